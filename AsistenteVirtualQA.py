@@ -1,114 +1,106 @@
 import sys
 import os
 from datetime import datetime
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
-                           QHBoxLayout, QLabel, QTextEdit, QPushButton, 
-                           QFrame, QFileDialog, QMessageBox, QDialog, 
-                           QListWidget, QListWidgetItem, QSplitter, QTextBrowser,
-                           QScrollArea, QGroupBox, QTabWidget)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PyQt5.QtGui import QFont, QTextCursor
 
-# Importar el chatbot
-from Chatbot import ChatBot
+# Medir el arranque desde la primera importación (ver tiempos_arranque.py)
+import tiempos_arranque
 
-# Importar panel QA avanzado mejorado
-from panel_qa_avanzado import PanelQAAvanzado
+with tiempos_arranque.medir("importar PyQt5"):
+    from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
+                               QHBoxLayout, QLabel, QTextEdit, QPushButton, 
+                               QFrame, QFileDialog, QMessageBox, QDialog, 
+                               QListWidget, QListWidgetItem, QSplitter, QTextBrowser,
+                               QScrollArea, QGroupBox, QTabWidget)
+    from PyQt5.QtCore import Qt, QObject, QThread, QTimer, pyqtSignal
+    from PyQt5.QtGui import QFont, QTextCursor
+
+# Importar el chatbot (google-generativeai se carga después, al configurar la IA)
+with tiempos_arranque.medir("importar Chatbot"):
+    from Chatbot import ChatBot
+
+# El panel QA avanzado y la integración con Notion se importan al abrirlos
 
 # Importar estilos centralizados
 from estilos_ui import obtener_estilos_completos
 
-# Importar librerías para procesar archivos
-try:
-    from docx import Document
-    DOCX_DISPONIBLE = True
-except ImportError:
-    DOCX_DISPONIBLE = False
-
-try:
-    import PyPDF2
-    PDF_DISPONIBLE = True
-except ImportError:
-    PDF_DISPONIBLE = False
+# Importar la extracción de texto de archivos adjuntos (PyPDF2 se carga al usarla)
+from extraccion_archivos import ExtraccionSegundoPlano, componer_contenido, procesar_archivos
 
 class ChatThread(QThread):
     """Hilo para manejar las respuestas del chatbot"""
     respuesta_recibida = pyqtSignal(str)
+    fragmento_recibido = pyqtSignal(str)
+    progreso_actualizado = pyqtSignal(str)
     error_ocurrido = pyqtSignal(str)
     
-    def __init__(self, chatbot, mensaje, archivos_adjuntos=None):
+    def __init__(self, chatbot, mensaje, archivos_adjuntos=None, streaming=True, tareas_extraccion=None):
         super().__init__()
         self.chatbot = chatbot
         self.mensaje = mensaje
         self.archivos_adjuntos = archivos_adjuntos or []
+        self.streaming = streaming
+        # Extracciones iniciadas al adjuntar (ExtraccionSegundoPlano), en el orden de los archivos
+        self.tareas_extraccion = tareas_extraccion
         
     def run(self):
         try:
+            # Si el mensaje se envió mientras la IA se configuraba, esperar a que termine
+            self.chatbot.esperar_ia()
+            
             # Procesar archivos adjuntos si existen
             contexto_archivos = ""
             if self.archivos_adjuntos:
                 contexto_archivos = self.procesar_archivos()
             
-            # Obtener respuesta del chatbot
-            mensaje_completo = f"{contexto_archivos}\n{self.mensaje}" if contexto_archivos else self.mensaje
-            respuesta = self.chatbot.procesar_mensaje(mensaje_completo)
+            # Obtener respuesta del chatbot (la pregunta va primero y los archivos después del
+            # separador, que es el formato que ChatBot usa para distinguirlos)
+            mensaje_completo = (f"{self.mensaje}\n\n--- ARCHIVOS ADJUNTOS ---{contexto_archivos}"
+                                if contexto_archivos else self.mensaje)
+            if self.streaming:
+                # Emitir cada fragmento apenas llega y la respuesta completa al final
+                fragmentos = []
+                for fragmento in self.chatbot.procesar_mensaje_stream(
+                        mensaje_completo, callback_progreso=self.progreso_actualizado.emit):
+                    fragmentos.append(fragmento)
+                    self.fragmento_recibido.emit(fragmento)
+                respuesta = "".join(fragmentos)
+            else:
+                respuesta = self.chatbot.procesar_mensaje(
+                    mensaje_completo, callback_progreso=self.progreso_actualizado.emit)
             self.respuesta_recibida.emit(respuesta)
             
         except Exception as e:
             self.error_ocurrido.emit(f"Error al procesar mensaje: {str(e)}")
     
     def procesar_archivos(self):
-        """Procesa los archivos adjuntos y extrae su contenido"""
-        contenido_total = ""
+        """Procesa los archivos adjuntos y extrae su contenido (reutilizando la preextracción)"""
+        if not self.tareas_extraccion:
+            return procesar_archivos(self.archivos_adjuntos, consulta=self.mensaje)
         
-        for archivo in self.archivos_adjuntos:
-            try:
-                if archivo.lower().endswith('.pdf') and PDF_DISPONIBLE:
-                    contenido = self.extraer_texto_pdf(archivo)
-                elif archivo.lower().endswith(('.docx', '.doc')) and DOCX_DISPONIBLE:
-                    contenido = self.extraer_texto_docx(archivo)
-                elif archivo.lower().endswith('.txt'):
-                    contenido = self.extraer_texto_txt(archivo)
-                else:
-                    contenido = f"Archivo adjuntado: {os.path.basename(archivo)} (tipo no soportado para extracción automática)"
-                
-                contenido_total += f"\n\n--- CONTENIDO DE {os.path.basename(archivo)} ---\n{contenido}\n"
-                
-            except Exception as e:
-                contenido_total += f"\n\nError al procesar {os.path.basename(archivo)}: {str(e)}\n"
-        
-        return contenido_total
+        if not all(tarea.done() for tarea in self.tareas_extraccion):
+            self.progreso_actualizado.emit("📄 Terminando de extraer los archivos adjuntos...")
+        return componer_contenido([tarea.result() for tarea in self.tareas_extraccion], consulta=self.mensaje)
+
+class NotificadorExtraccion(QObject):
+    """Lleva al hilo de la interfaz el aviso de que terminó la extracción de un archivo"""
+    archivo_procesado = pyqtSignal(str)
     
-    def extraer_texto_pdf(self, ruta_archivo):
-        """Extrae texto de un archivo PDF"""
-        try:
-            with open(ruta_archivo, 'rb') as archivo:
-                lector = PyPDF2.PdfReader(archivo)
-                texto = ""
-                for pagina in lector.pages:
-                    texto += pagina.extract_text() + "\n"
-            return texto
-        except Exception as e:
-            return f"Error al leer PDF: {str(e)}"
+    def notificar(self, ruta_archivo, resultado):
+        # Se llama desde el hilo de extracción; la señal se entrega en el hilo de la interfaz
+        self.archivo_procesado.emit(ruta_archivo)
+
+class ConfiguracionIAThread(QThread):
+    """Hilo que configura la IA sin bloquear la aparición de la ventana"""
+    ia_lista = pyqtSignal(bool)
     
-    def extraer_texto_docx(self, ruta_archivo):
-        """Extrae texto de un archivo DOCX"""
-        try:
-            doc = Document(ruta_archivo)
-            texto = ""
-            for parrafo in doc.paragraphs:
-                texto += parrafo.text + "\n"
-            return texto
-        except Exception as e:
-            return f"Error al leer DOCX: {str(e)}"
+    def __init__(self, chatbot):
+        super().__init__()
+        self.chatbot = chatbot
     
-    def extraer_texto_txt(self, ruta_archivo):
-        """Extrae texto de un archivo TXT"""
-        try:
-            with open(ruta_archivo, 'r', encoding='utf-8') as archivo:
-                return archivo.read()
-        except Exception as e:
-            return f"Error al leer TXT: {str(e)}"
+    def run(self):
+        with tiempos_arranque.medir("configurar IA"):
+            self.chatbot.configurar_ia()
+        self.ia_lista.emit(self.chatbot.usar_ia)
 
 class HistorialDialog(QDialog):
     """Diálogo para mostrar el historial de conversaciones"""
@@ -812,25 +804,47 @@ class PanelAyuda(QDialog):
         """)
 
 class AsistenteVirtualModernUI(QMainWindow):
+    INTERVALO_REPINTADO_MS = 120
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Asistente Virtual AI - Interfaz Moderna QA")
         self.setGeometry(100, 100, 1200, 800)
         self.setMinimumSize(1200, 800)
         
-        # Inicializar el chatbot
-        self.chatbot = ChatBot("Asistente Virtual")
+        # Inicializar el chatbot; la IA se configura en segundo plano al final del constructor
+        self.chatbot = ChatBot("Asistente Virtual", configurar_ia_al_iniciar=False)
         
         # Lista de archivos adjuntos
         self.archivos_adjuntos = []
         
+        # Los adjuntos se extraen en cuanto se eligen, mientras el usuario escribe la pregunta
+        self.notificador_extraccion = NotificadorExtraccion()
+        self.notificador_extraccion.archivo_procesado.connect(self.archivo_extraido)
+        self.extraccion_adjuntos = ExtraccionSegundoPlano(al_terminar=self.notificador_extraccion.notificar)
+        
         # Contador de mensajes
         self.contador_mensajes = 0
         
+        # Streaming de respuestas: los fragmentos se acumulan y se repintan
+        # como máximo cada INTERVALO_REPINTADO_MS para no saturar el QTextBrowser
+        self.streaming_habilitado = True
+        self._respuesta_parcial = ""
+        self._inicio_respuesta_parcial = None
+        self.timer_repintado = QTimer(self)
+        self.timer_repintado.setSingleShot(True)
+        self.timer_repintado.setInterval(self.INTERVALO_REPINTADO_MS)
+        self.timer_repintado.timeout.connect(self.repintar_respuesta_parcial)
+        
         # Configurar ventana principal
         self.setup_ui()
         self.apply_modern_styles()
         
+        # Configurar la IA en segundo plano (importa google-generativeai y lee .env)
+        self.hilo_configuracion_ia = ConfiguracionIAThread(self.chatbot)
+        self.hilo_configuracion_ia.ia_lista.connect(self.ia_configurada)
+        self.hilo_configuracion_ia.start()
+        
         # Mensaje de bienvenida inicial
         self.mostrar_mensaje_bienvenida()
         
@@ -1173,7 +1187,28 @@ class AsistenteVirtualModernUI(QMainWindow):
     
     def actualizar_status(self):
         """Actualizar el estado del pie de página"""
-        self.status_label.setText(f"{self.contador_mensajes} mensajes en esta sesión")
+        texto_estado = f"{self.contador_mensajes} mensajes en esta sesión"
+        
+        # Mostrar el aprovechamiento de la caché de respuestas cuando ya se usó
+        stats_cache = self.chatbot.obtener_estadisticas_cache()
+        if stats_cache['aciertos'] or stats_cache['fallos']:
+            texto_estado += (f"  •  Caché: {stats_cache['aciertos']} aciertos / {stats_cache['fallos']} fallos"
+                             f" (~{stats_cache['segundos_ahorrados']} s ahorrados)")
+        
+        if not self.chatbot.ia_lista.is_set():
+            texto_estado += "  •  ⏳ Conectando con la IA..."
+        
+        # Mostrar el estado del servicio de IA cuando hubo problemas
+        estado_ia = self.chatbot.obtener_estado_resiliencia()
+        if estado_ia['estado'] == 'abierto':
+            texto_estado += f"  •  🔴 IA no disponible, respuestas locales (reintento en {estado_ia['segundos_para_reintentar']:.0f} s)"
+        elif estado_ia['estado'] == 'semiabierto':
+            texto_estado += "  •  🟡 IA en prueba de recuperación"
+        if estado_ia['reintentos'] or estado_ia['timeouts'] or estado_ia['rechazadas']:
+            texto_estado += (f"  •  Reintentos: {estado_ia['reintentos']}, timeouts: {estado_ia['timeouts']},"
+                             f" locales por circuito: {estado_ia['rechazadas']}")
+        
+        self.status_label.setText(texto_estado)
     
     def scroll_to_bottom(self):
         """Hacer scroll hacia abajo"""
@@ -1211,7 +1246,13 @@ class AsistenteVirtualModernUI(QMainWindow):
         self.mostrar_mensaje_bot("✍️ Escribiendo...")
         
         # Crear y ejecutar hilo para respuesta
-        self.chat_thread = ChatThread(self.chatbot, mensaje, self.archivos_adjuntos.copy())
+        self._respuesta_parcial = ""
+        self._inicio_respuesta_parcial = None
+        self.chat_thread = ChatThread(self.chatbot, mensaje, self.archivos_adjuntos.copy(),
+                                      streaming=self.streaming_habilitado,
+                                      tareas_extraccion=self.extraccion_adjuntos.tareas(self.archivos_adjuntos))
+        self.chat_thread.fragmento_recibido.connect(self.procesar_fragmento)
+        self.chat_thread.progreso_actualizado.connect(self.procesar_progreso)
         self.chat_thread.respuesta_recibida.connect(self.procesar_respuesta)
         self.chat_thread.error_ocurrido.connect(self.procesar_error)
         self.chat_thread.start()
@@ -1219,10 +1260,53 @@ class AsistenteVirtualModernUI(QMainWindow):
         # Limpiar archivos adjuntos después de enviar
         if self.archivos_adjuntos:
             self.archivos_adjuntos.clear()
+            self.extraccion_adjuntos.limpiar()
             self.actualizar_visualizacion_archivos()
     
+    def procesar_fragmento(self, fragmento):
+        """Acumular un fragmento de la respuesta y programar el repintado"""
+        self._respuesta_parcial += fragmento
+        if not self.timer_repintado.isActive():
+            self.timer_repintado.start()
+    
+    def procesar_progreso(self, mensaje):
+        """Mostrar el avance del procesamiento de documentos grandes en el pie de página"""
+        self.status_label.setText(mensaje)
+    
+    def repintar_respuesta_parcial(self):
+        """Mostrar la respuesta parcial acumulada hasta el momento"""
+        if not self._respuesta_parcial:
+            return
+        
+        if self._inicio_respuesta_parcial is None:
+            # Primer fragmento: reemplazar el indicador de "escribiendo..."
+            self.remover_mensaje_escribiendo()
+            self._inicio_respuesta_parcial = self.area_chat.document().characterCount() - 1
+        else:
+            self.remover_contenido_desde(self._inicio_respuesta_parcial)
+        
+        timestamp = datetime.now().strftime("%H:%M")
+        self.area_chat.append(self.generar_html_mensaje_bot(self._respuesta_parcial + " ▌", timestamp))
+        self.scroll_to_bottom()
+    
+    def remover_respuesta_parcial(self):
+        """Quitar la respuesta parcial antes de mostrar la definitiva"""
+        self.timer_repintado.stop()
+        if self._inicio_respuesta_parcial is not None:
+            self.remover_contenido_desde(self._inicio_respuesta_parcial)
+        self._inicio_respuesta_parcial = None
+        self._respuesta_parcial = ""
+    
+    def remover_contenido_desde(self, posicion):
+        """Eliminar el contenido del chat desde una posición hasta el final"""
+        cursor = self.area_chat.textCursor()
+        cursor.setPosition(posicion)
+        cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+    
     def procesar_respuesta(self, respuesta):
         """Procesar respuesta del chatbot"""
+        self.remover_respuesta_parcial()
         self.remover_mensaje_escribiendo()
         
         # Guardar respuesta en el chatbot
@@ -1235,6 +1319,7 @@ class AsistenteVirtualModernUI(QMainWindow):
     
     def procesar_error(self, error):
         """Procesar error del chatbot"""
+        self.remover_respuesta_parcial()
         self.remover_mensaje_escribiendo()
         self.mostrar_mensaje_bot(f"❌ Error: {error}")
         self.habilitar_envio()
@@ -1281,6 +1366,8 @@ class AsistenteVirtualModernUI(QMainWindow):
         
         if archivos:
             self.archivos_adjuntos.extend(archivos)
+            for archivo in archivos:
+                self.extraccion_adjuntos.iniciar(archivo)
             self.actualizar_visualizacion_archivos()
             
             # NO mostrar mensaje en el chat - solo actualizar visualización
@@ -1292,6 +1379,7 @@ class AsistenteVirtualModernUI(QMainWindow):
         """Limpiar todos los archivos adjuntos"""
         if self.archivos_adjuntos:
             self.archivos_adjuntos.clear()
+            self.extraccion_adjuntos.limpiar()
             self.actualizar_visualizacion_archivos()
             # NO mostrar mensaje en el chat
             # self.mostrar_mensaje_sistema("🗑️ Todos los archivos adjuntos han sido eliminados")
@@ -1300,11 +1388,31 @@ class AsistenteVirtualModernUI(QMainWindow):
         """Eliminar un archivo individual de los adjuntos"""
         if 0 <= indice < len(self.archivos_adjuntos):
             archivo_eliminado = os.path.basename(self.archivos_adjuntos[indice])
-            del self.archivos_adjuntos[indice]
+            ruta_eliminada = self.archivos_adjuntos.pop(indice)
+            if ruta_eliminada not in self.archivos_adjuntos:
+                self.extraccion_adjuntos.descartar(ruta_eliminada)
             self.actualizar_visualizacion_archivos()
             # NO mostrar mensaje en el chat
             # self.mostrar_mensaje_sistema(f"🗑️ Archivo '{archivo_eliminado}' eliminado")
     
+    def archivo_extraido(self, ruta_archivo):
+        """Refrescar el estado de los adjuntos cuando termina la extracción de uno de ellos"""
+        if ruta_archivo in self.archivos_adjuntos:
+            self.actualizar_visualizacion_archivos()
+    
+    def describir_estado_extraccion(self, archivo):
+        """Texto e información ampliada del estado de extracción de un adjunto"""
+        estado, resultado = self.extraccion_adjuntos.estado(archivo)
+        if estado == ExtraccionSegundoPlano.EXTRAYENDO:
+            return "⏳", "Extrayendo texto..."
+        if estado == ExtraccionSegundoPlano.CON_ERROR:
+            return "⚠️", f"Error: {resultado['error']}"
+        if estado == ExtraccionSegundoPlano.LISTO:
+            paginas = resultado["total_paginas"]
+            origen = "caché" if resultado["desde_cache"] else f"{resultado['segundos']:.1f} s"
+            return "✅", f"Listo: {paginas} página{'s' if paginas != 1 else ''}, {len(resultado['contenido']):,} caracteres ({origen})"
+        return "", ""
+    
     def actualizar_visualizacion_archivos(self):
         """Actualizar la visualización de archivos adjuntos"""
         # Limpiar layout existente
@@ -1345,9 +1453,13 @@ class AsistenteVirtualModernUI(QMainWindow):
                 if len(nombre_archivo) > 30:
                     nombre_archivo = nombre_archivo[:27] + "..."
                 
-                archivo_label = QLabel(f"{icono} {nombre_archivo}")
+                # Estado de la extracción en segundo plano
+                estado, detalle_estado = self.describir_estado_extraccion(archivo)
+                
+                archivo_label = QLabel(f"{icono} {nombre_archivo} {estado}".rstrip())
                 archivo_label.setObjectName("archivoLabel")
-                archivo_label.setToolTip(archivo)  # Tooltip con ruta completa
+                # Tooltip con ruta completa y estado de la extracción
+                archivo_label.setToolTip(f"{archivo}\n{detalle_estado}" if detalle_estado else archivo)
                 
                 # Botón para eliminar archivo individual
                 eliminar_btn = QPushButton("❌")
@@ -1404,8 +1516,16 @@ class AsistenteVirtualModernUI(QMainWindow):
         panel_ayuda = PanelAyuda(self)
         panel_ayuda.exec_()
     
+    def ia_configurada(self, disponible):
+        """Actualizar el estado cuando termina la configuración de la IA"""
+        tiempos_arranque.marcar("IA lista" if disponible else "IA no disponible (modo local)")
+        self.actualizar_status()
+        if tiempos_arranque.detalle_habilitado():
+            tiempos_arranque.imprimir_linea_tiempo()
+    
     def opciones_avanzadas(self):
         """Abrir panel de opciones avanzadas para QA"""
+        from panel_qa_avanzado import PanelQAAvanzado
         panel = PanelQAAvanzado(self)
         panel.exec_()
     
@@ -1423,14 +1543,8 @@ class AsistenteVirtualModernUI(QMainWindow):
         # Limpiar chat
         self.area_chat.clear()
         
-        # Reiniciar sesión del chatbot
-        self.chatbot.sesion_actual = {
-            'inicio': datetime.now().isoformat(),
-            'conversaciones': []
-        }
-        
-        # Limpiar historial de conversación en memoria
-        self.chatbot.historial_conversacion = []
+        # Reiniciar sesión del chatbot (historial en memoria y sesión multi-turno)
+        self.chatbot.nueva_conversacion()
         
         # Resetear contador
         self.contador_mensajes = 0
@@ -1441,6 +1555,7 @@ class AsistenteVirtualModernUI(QMainWindow):
         
         # Limpiar archivos adjuntos
         self.archivos_adjuntos.clear()
+        self.extraccion_adjuntos.limpiar()
         self.actualizar_visualizacion_archivos()
     
     def guardar_conversacion(self):
@@ -1509,9 +1624,13 @@ def main():
     app.setFont(font)
     
     # Crear y mostrar la ventana principal
-    window = AsistenteVirtualModernUI()
+    with tiempos_arranque.medir("crear ventana"):
+        window = AsistenteVirtualModernUI()
     window.show()
     
+    # El primer ciclo del bucle de eventos ocurre cuando la ventana ya se pintó
+    QTimer.singleShot(0, lambda: tiempos_arranque.marcar("ventana visible"))
+    
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
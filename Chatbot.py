@@ -2,31 +2,150 @@ import re
 import random
 import os
 import json
+import time
+import asyncio
+import threading
+import weakref
 from datetime import datetime, timedelta
-import google.generativeai as genai
+
+from backends_ia import crear_backend
+from cache_respuestas import CacheRespuestas
+from cache_semantica import CacheSemantica
+from clasificador_local import ClasificadorLocal, LOCAL
+from casos_estructurados import (CONFIGURACION_JSON, INSTRUCCION_CASOS_ESTRUCTURADOS, convertir_a_proyecto,
+                                 interpretar_casos, renderizar_casos_cp)
+from constructor_prompt import (ConstructorPrompt, CONSERVAR_FINAL, CONSERVAR_INICIO,
+                                RESUMIR_PLANTILLA, estimar_tokens)
+from indice_bm25 import IndiceBM25, TITULO_FRAGMENTOS_HISTORIAL
+from enrutador_modelos import EnrutadorModelos, ESTANDAR, POTENTE, RAPIDO
+from normalizacion import SolicitudChat
+from politicas_generacion import (PoliticasGeneracion, ANALISIS_ARCHIVOS, CASOS_PRUEBA, CHAT_SIMPLE,
+                                  CONSULTA_TECNICA, CONTEXTO_QA, EXTRACCION_FRAGMENTO, MANUAL_USUARIO,
+                                  RESUMEN_CONVERSACION, ROL)
+from procesamiento_documentos import ProcesadorMapReduce
+from resumidor_conversacion import ResumidorConversacion
+from sesion_chat import SesionChat
+from resiliencia import (AvisoRespuestaIncompleta, GestorResiliencia, InterruptorCircuito, PoliticaReintentos,
+                         RespuestaRespaldo, es_error_reintentable)
+
+# Patrones de conversación trivial: son las únicas respuestas predefinidas que puede elegir el
+# clasificador local, porque nunca sustituyen a una respuesta de QA
+PATRON_SALUDOS = "hola|buenos dias|buenas tardes|buenas noches|saludos"
+PATRON_DESPEDIDAS = "adios|chao|hasta luego|nos vemos|bye"
+PATRON_AGRADECIMIENTOS = "gracias|muchas gracias|te agradezco"
+PATRON_CONFIRMACIONES = r"\b(ok|vale|perfecto|genial|de nada)\b"
+PATRONES_CONVERSACION_TRIVIAL = (PATRON_SALUDOS, PATRON_DESPEDIDAS, PATRON_AGRADECIMIENTOS, PATRON_CONFIRMACIONES)
 
 class ChatBot:
-    def __init__(self, nombre="AsistentBot"):
+    def __init__(self, nombre="AsistentBot", configurar_ia_al_iniciar=True):
         self.nombre = nombre
         self.usar_ia = True
-        self.modelo_ia = None
+        self.backend_ia = None
+        
+        # Se marca cuando termina configurar_ia (la interfaz lo ejecuta en segundo plano)
+        self.ia_lista = threading.Event()
         self.historial_conversacion = []
+        
+        # Historial multi-turno que se envía al modelo como turnos nativos (no pegado en el prompt);
+        # las respuestas largas se abrevian y los turnos antiguos se resumen en segundo plano
+        # después de cada respuesta, de modo que el contexto no crece con la conversación
+        self.usar_sesion_chat = True
+        self.resumidor_conversacion = ResumidorConversacion(self.generar_resumen_conversacion)
+        self.sesion_chat = SesionChat(presupuesto_tokens=2000, resumidor=self.resumidor_conversacion)
+        
         self.sesion_actual = {
             'inicio': datetime.now().isoformat(),
             'conversaciones': []
         }
+        # Archivo de la sesión actual: se elige en el primer guardado y los siguientes lo reescriben
+        self.ruta_sesion_actual = None
         
         # Configurar directorio de historial
         self.directorio_historial = os.path.join(os.path.dirname(__file__), 'historial')
         self.crear_directorio_historial()
         
-        # Configurar Google AI
-        self.configurar_ia()
+        # Modelo y configuración de generación (también forman parte de la clave de caché)
+        self.nombre_modelo = 'gemini-2.0-flash'
+        self.configuracion_generacion = {}
+        
+        # Tokens de salida, temperatura y secuencias de parada según el tipo de solicitud;
+        # se pueden sobrescribir en politicas_generacion.json
+        self.politicas_generacion = PoliticasGeneracion(
+            os.path.join(os.path.dirname(__file__), 'politicas_generacion.json')
+        )
+        
+        # Cada solicitud va a un nivel de modelo (rápido, estándar o potente) según su intención
+        # y tamaño; la latencia por nivel se registra para ajustar los umbrales con datos reales
+        self.usar_enrutador = True
+        self.enrutador_modelos = EnrutadorModelos(
+            self.obtener_modelos_por_nivel(),
+            archivo_registro=os.path.join(os.path.dirname(__file__), 'cache', 'enrutador', 'latencias.jsonl')
+        )
+        self._backends_por_modelo = {}
+        self._backend_origen = None
+        self._lock_backends = threading.Lock()
+        
+        # Los casos de prueba se piden como JSON con esquema (sin el formato doble en la salida);
+        # la vista CP- y el JSON de proyecto se generan localmente a partir de ese JSON
+        self.usar_casos_estructurados = True
+        
+        # Caché de respuestas de la IA (usar_cache=False la omite)
+        self.usar_cache = True
+        self.cache_respuestas = CacheRespuestas(
+            os.path.join(os.path.dirname(__file__), 'cache', 'respuestas')
+        )
+        
+        # Tamaño máximo estimado del prompt; las secciones menos importantes se recortan primero
+        self.presupuesto_tokens_prompt = 30000
+        self.ultimo_informe_prompt = []
+        
+        # Caché por similitud para preguntas equivalentes con distinta redacción
+        self.cache_semantica = CacheSemantica(umbral_similitud=0.9)
+        
+        # Clasificador entrenado con el historial (python clasificador_local.py entrenar) para
+        # responder localmente los mensajes triviales que las reglas no reconocen; se carga con
+        # el primer mensaje y, si no hay modelo entrenado, solo se usan las reglas
+        self.usar_clasificador_local = True
+        self.umbral_clasificador_local = 0.9
+        self.clasificador_local = None
+        self._clasificador_cargado = False
+        
+        # Índice BM25 de las sesiones guardadas en historial/: las preguntas ya resueltas se
+        # responden sin la IA y las conversaciones relacionadas se agregan al prompt como
+        # contexto compacto. Se sincroniza con la primera búsqueda y al guardar cada sesión
+        self.usar_indice_historial = True
+        self.indice_historial = IndiceBM25(
+            os.path.join(os.path.dirname(__file__), 'cache', 'bm25', 'indice.json')
+        )
+        self._historial_indexado = False
+        
+        # Adjuntos más grandes que el umbral se condensan por fragmentos en paralelo (map-reduce)
+        self.umbral_map_reduce_caracteres = 60000
+        self.tamano_fragmento_caracteres = 24000
+        self.max_llamadas_paralelas = 4
+        
+        # Máximo de solicitudes al modelo en vuelo a la vez, compartido por todas las llamadas
+        # que se ejecutan en un mismo bucle de eventos
+        self.max_solicitudes_concurrentes = 4
+        self._semaforos = weakref.WeakKeyDictionary()
+        self._bucle = None
+        self._lock_bucle = threading.Lock()
+        
+        # Timeout por llamada, reintentos con espera exponencial e interruptor de circuito:
+        # con el circuito abierto los mensajes se responden localmente sin esperar al proveedor
+        self.resiliencia = GestorResiliencia(
+            PoliticaReintentos(max_intentos=3, espera_base=0.5, espera_maxima=8.0, timeout_segundos=90.0),
+            InterruptorCircuito(umbral_fallos=5, segundos_apertura=30.0)
+        )
+        
+        # Configurar Google AI (con configurar_ia_al_iniciar=False lo hace quien crea el chatbot)
+        if configurar_ia_al_iniciar:
+            self.configurar_ia()
         
         # Respuestas locales básicas (se usarán si la IA no está disponible)
         self.respuestas_locales = {
             # Saludos
-            "hola|buenos dias|buenas tardes|buenas noches|saludos": [
+            PATRON_SALUDOS: [
                 f"¡Hola! Soy {self.nombre}, ¿en qué puedo ayudarte?",
                 f"¡Saludos! Soy {self.nombre}, ¿qué necesitas?",
                 f"¡Hola! ¿Cómo estás? Soy {self.nombre}"
@@ -60,19 +179,25 @@ class ChatBot:
             ],
             
             # Despedidas
-            "adios|chao|hasta luego|nos vemos|bye": [
+            PATRON_DESPEDIDAS: [
                 "¡Hasta luego! Fue un placer ayudarte.",
                 "¡Adiós! Que tengas un excelente día.",
                 "¡Nos vemos! Vuelve cuando necesites ayuda."
             ],
             
             # Agradecimientos
-            "gracias|muchas gracias|te agradezco": [
+            PATRON_AGRADECIMIENTOS: [
                 "¡De nada! Estoy aquí para ayudarte.",
                 "¡Un placer ayudarte!",
                 "¡Para eso estoy aquí!"
             ],
             
+            # Confirmaciones
+            PATRON_CONFIRMACIONES: [
+                "¡Genial! ¿En qué más puedo ayudarte?",
+                "¡Perfecto! Aquí estoy si necesitas algo más."
+            ],
+            
             # Información personal
             "como estas|tu edad|cuantos anos": [
                 "Soy un programa de computadora, así que no tengo edad como los humanos.",
@@ -118,13 +243,19 @@ class ChatBot:
         ]
     
     def configurar_ia(self):
-        """Configura la conexión con Google AI Studio"""
+        """Configura el backend de IA (Gemini, o el sustituto local con CHATBOT_BACKEND=local)"""
         try:
+            nombre_backend = (self.cargar_variable_entorno('CHATBOT_BACKEND') or 'gemini').lower()
+            if nombre_backend == 'local':
+                self.backend_ia = crear_backend('local', self.nombre_modelo,
+                                                opciones=self.obtener_opciones_backend_local())
+                print(f"🧪 IA simulada con el backend local - {self.nombre}")
+                return
+            
             # Cargar API key desde archivo .env
             api_key = self.cargar_api_key()
             if api_key:
-                genai.configure(api_key=api_key)
-                self.modelo_ia = genai.GenerativeModel('gemini-2.0-flash')
+                self.backend_ia = crear_backend(nombre_backend, self.nombre_modelo, api_key)
                 print(f"✅ IA configurada correctamente - {self.nombre} con Gemini 2.0 Flash")
             else:
                 self.usar_ia = False
@@ -133,44 +264,103 @@ class ChatBot:
             self.usar_ia = False
             print(f"⚠️ Error configurando IA: {e}")
             print("Usando respuestas locales")
+        finally:
+            self.ia_lista.set()
+    
+    def esperar_ia(self, timeout=None):
+        """Espera a que termine la configuración de la IA; devuelve False si se agotó el tiempo"""
+        return self.ia_lista.wait(timeout)
     
     def cargar_api_key(self):
         """Carga la API key desde el archivo .env"""
+        return self.cargar_variable_entorno('GOOGLE_API_KEY')
+    
+    def cargar_variable_entorno(self, nombre):
+        """Lee una variable de configuración del entorno o, si no está definida, del archivo .env"""
+        if os.environ.get(nombre):
+            return os.environ[nombre]
         try:
             env_path = os.path.join(os.path.dirname(__file__), '.env')
             if os.path.exists(env_path):
                 with open(env_path, 'r') as f:
                     for line in f:
-                        if line.startswith('GOOGLE_API_KEY='):
+                        if line.startswith(f'{nombre}='):
                             return line.split('=', 1)[1].strip()
             return None
         except Exception as e:
-            print(f"Error cargando API key: {e}")
+            print(f"Error cargando {nombre}: {e}")
             return None
     
+    def obtener_modelos_por_nivel(self):
+        """
+        Modelo de cada nivel (CHATBOT_MODELO_RAPIDO, CHATBOT_MODELO_ESTANDAR y CHATBOT_MODELO_POTENTE);
+        los niveles sin configurar usan el modelo principal, así que sin configuración el
+        enrutamiento no cambia de modelo
+        """
+        modelos = {nivel: self.nombre_modelo for nivel in (RAPIDO, ESTANDAR, POTENTE)}
+        for nivel in (RAPIDO, ESTANDAR, POTENTE):
+            modelo = self.cargar_variable_entorno(f'CHATBOT_MODELO_{nivel.upper()}')
+            if modelo:
+                modelos[nivel] = modelo
+        return modelos
+    
+    def obtener_opciones_backend_local(self):
+        """Latencia y ritmo del backend local (CHATBOT_LOCAL_LATENCIA y CHATBOT_LOCAL_TOKENS_POR_SEGUNDO)"""
+        opciones = {}
+        for variable, opcion in [('CHATBOT_LOCAL_LATENCIA', 'latencia_primer_token'),
+                                 ('CHATBOT_LOCAL_TOKENS_POR_SEGUNDO', 'tokens_por_segundo')]:
+            valor = self.cargar_variable_entorno(variable)
+            if valor:
+                try:
+                    opciones[opcion] = float(valor)
+                except ValueError:
+                    print(f"⚠️ Valor inválido para {variable}: {valor}")
+        return opciones
+    
     def es_respuesta_local(self, mensaje):
         """Verifica si el mensaje debe ser respondido localmente"""
-        mensaje_limpio = mensaje.lower().strip()
-        
-        # Patrones que siempre se responden localmente
-        patrones_locales = [
-            r'\b(hola|hi|buenos dias|buenas tardes|buenas noches|saludos)\b',
-            r'\b(adios|chao|hasta luego|nos vemos|bye)\b',
-            r'\b(gracias|muchas gracias|te agradezco)\b',
-            r'\b(quien eres|como te llamas|tu nombre)\b'
-        ]
+        return self.detectar_intenciones(mensaje)["respuesta_local"]
+    
+    def es_conversacion_trivial(self, mensaje):
+        """
+        Indica si el mensaje es un saludo, agradecimiento, despedida o confirmación sin ninguna
+        intención de QA (rol, contexto QA, casos de prueba o manual de usuario)
+        """
+        intenciones = self.detectar_intenciones(mensaje)
+        if (intenciones["rol"] or intenciones["contexto_qa"] or intenciones["casos_prueba"]
+                or intenciones["manual_usuario"]):
+            return False
+        mensaje_limpio = SolicitudChat.desde(mensaje).texto_normalizado
+        return any(re.search(patron, mensaje_limpio) for patron in PATRONES_CONVERSACION_TRIVIAL)
+    
+    def clasificar_mensaje(self, mensaje):
+        """
+        Clase del clasificador local (local, ia o ia_plantillas) o None si no hay modelo entrenado
+        o la predicción no alcanza el umbral de confianza
+        """
+        if not self.usar_clasificador_local:
+            return None
+        if not self._clasificador_cargado:
+            self.clasificador_local = ClasificadorLocal.cargar()
+            self._clasificador_cargado = True
+        if self.clasificador_local is None:
+            return None
         
-        for patron in patrones_locales:
-            if re.search(patron, mensaje_limpio):
-                return True
-        return False
+        inicio = time.perf_counter()
+        clase, probabilidad = self.clasificador_local.predecir(SolicitudChat.desde(mensaje).texto_normalizado)
+        duracion_us = (time.perf_counter() - inicio) * 1_000_000
+        print(f"🧮 Clasificador local: {clase} ({probabilidad:.0%}, {duracion_us:.0f} µs)")
+        return clase if probabilidad >= self.umbral_clasificador_local else None
     
-    def responder_localmente(self, mensaje):
-        """Genera respuesta usando patrones locales"""
-        mensaje_limpio = mensaje.lower().strip()
+    def responder_localmente(self, mensaje, patrones=None):
+        """Genera respuesta usando patrones locales (solo los indicados en "patrones", si se dan)"""
+        # Los patrones se escriben sin acentos ni mayúsculas, igual que el texto normalizado
+        mensaje_limpio = SolicitudChat.desde(mensaje).texto_normalizado
         
         # Buscar coincidencias en las respuestas predefinidas
         for patron, respuestas in self.respuestas_locales.items():
+            if patrones is not None and patron not in patrones:
+                continue
             if re.search(patron, mensaje_limpio):
                 return random.choice(respuestas)
         
@@ -1185,170 +1375,109 @@ IMPORTANTE PARA EL MANUAL:
 - Proporcionar **contexto** sobre cuándo y por qué usar cada funcionalidad
         """
     
-    def responder_con_ia(self, mensaje):
-        """Genera respuesta usando Google AI"""
-        try:
-            # Detectar si hay archivos adjuntos en el mensaje
-            tiene_archivos = "--- ARCHIVOS ADJUNTOS ---" in mensaje
-            
-            # Detectar si el usuario solicita un rol específico
-            rol_solicitado = self.detectar_rol_solicitado(mensaje)
+    def construir_prompt(self, mensaje, casos_estructurados=False):
+        """
+        Construye el prompt completo para Google AI según el tipo de solicitud;
+        con casos_estructurados los casos de prueba se piden solo como JSON con esquema
+        """
+        # Detectar si hay archivos adjuntos y separarlos de la pregunta del usuario
+        tiene_archivos = "--- ARCHIVOS ADJUNTOS ---" in mensaje
+        if tiene_archivos:
+            pregunta_usuario, contenido_archivos = mensaje.split("--- ARCHIVOS ADJUNTOS ---", 1)
+            pregunta_usuario = pregunta_usuario.strip() or "Analiza este archivo"
+        else:
+            pregunta_usuario, contenido_archivos = mensaje, ""
+        
+        # Detectar si el usuario solicita un rol específico
+        rol_solicitado = self.detectar_rol_solicitado(mensaje)
+        
+        # Detectar funcionalidades QA específicas
+        contexto_qa = self.detectar_contexto_qa_especializado(mensaje)
+        
+        # Detectar si se solicitan casos de prueba
+        solicita_casos_prueba = self.solicita_casos_prueba(pregunta_usuario)
+        
+        # Detectar si se solicita manual de usuario
+        solicita_manual_usuario = self.solicita_manual_usuario(pregunta_usuario)
+        
+        # Agregar plantillas según lo solicitado (en modo estructurado el esquema reemplaza a las plantillas)
+        plantillas_casos = solicita_casos_prueba and not casos_estructurados
+        plantillas = "\n".join(plantilla for plantilla in [
+            self.obtener_plantilla_casos_prueba() if plantillas_casos else "",
+            self.obtener_plantilla_casos_prueba_json() if plantillas_casos else "",
+            self.obtener_plantilla_manual_usuario() if solicita_manual_usuario else ""
+        ] if plantilla)
+        
+        if solicita_casos_prueba and casos_estructurados:
+            instruccion_casos = INSTRUCCION_CASOS_ESTRUCTURADOS
+        else:
+            instruccion_casos = ("INSTRUCCIÓN ESPECIAL PARA CASOS DE PRUEBA: Si el usuario solicita casos de prueba, debes generar AMBOS formatos: el formato original estándar Y el formato JSON. Presenta primero el formato original completo, luego una separación clara, y después el formato JSON completo."
+                                 if solicita_casos_prueba else "")
+        
+        constructor = ConstructorPrompt(self.presupuesto_tokens_prompt)
+        
+        if rol_solicitado or contexto_qa:
+            rol_final = rol_solicitado or f"QA Specialist - {contexto_qa}"
+            contexto_especializado = (self.obtener_contexto_rol(rol_solicitado) if rol_solicitado
+                                      else self.generar_contexto_qa_especializado(contexto_qa))
+            constructor.agregar("rol", f"Eres {self.nombre}, actuando como {rol_final}.\n\n{contexto_especializado}")
+        
+        if tiene_archivos:
+            # Para mensajes con archivos, usar un prompt especializado pero específico
+            if rol_solicitado or contexto_qa:
+                constructor.agregar("instrucciones", f"IMPORTANTE: Mantén tu rol de {rol_final} y responde ÚNICAMENTE lo que el usuario solicita.")
+            else:
+                constructor.agregar("rol", f"Eres {self.nombre}, un chatbot especializado en análisis de documentos y QA profesional.")
+                constructor.agregar("instrucciones", "IMPORTANTE: Responde ÚNICAMENTE lo que el usuario solicita. No agregues información extra no solicitada.")
             
-            # Detectar funcionalidades QA específicas
-            contexto_qa = self.detectar_contexto_qa_especializado(mensaje)
+            constructor.agregar("plantillas", plantillas, prioridad=3, estrategia=RESUMIR_PLANTILLA)
+            constructor.agregar("solicitud", f'El usuario solicita: "{pregunta_usuario}"\n\n{instruccion_casos}')
             
-            if tiene_archivos:
-                # Extraer solo la pregunta del usuario (sin el contenido de archivos)
-                pregunta_usuario = mensaje.split("--- ARCHIVOS ADJUNTOS ---")[0].strip()
-                if not pregunta_usuario:
-                    pregunta_usuario = "Analiza este archivo"
-                
-                # Para mensajes con archivos, usar un prompt especializado pero específico
-                # Detectar si se solicitan casos de prueba
-                solicita_casos_prueba = any(palabra in pregunta_usuario.lower() for palabra in 
-                                          ['casos de prueba', 'test cases', 'casos prueba', 'generar casos', 'crear casos'])
-                
-                # Detectar si se solicita manual de usuario
-                solicita_manual_usuario = any(palabra in pregunta_usuario.lower() for palabra in 
-                                            ['manual de usuario', 'manual usuario', 'documentacion usuario', 'guia usuario', 
-                                             'documentation user', 'user manual', 'guia de usuario', 'manual del usuario'])
-                
-                if rol_solicitado or contexto_qa:
-                    # Agregar plantillas según lo solicitado
-                    plantilla_casos = self.obtener_plantilla_casos_prueba() if solicita_casos_prueba else ""
-                    plantilla_casos_json = self.obtener_plantilla_casos_prueba_json() if solicita_casos_prueba else ""
-                    plantilla_manual = self.obtener_plantilla_manual_usuario() if solicita_manual_usuario else ""
-                    plantillas_qa = self.obtener_plantillas_qa_avanzadas() if contexto_qa else {}
-                    contexto_especializado = self.generar_contexto_qa_especializado(contexto_qa) if contexto_qa else ""
-                    
-                    rol_final = rol_solicitado or f"QA Specialist - {contexto_qa}"
-                    
-                    prompt = f"""Eres {self.nombre}, actuando como {rol_final}.
-
-{self.obtener_contexto_rol(rol_solicitado) if rol_solicitado else contexto_especializado}
-
-IMPORTANTE: Mantén tu rol de {rol_final} y responde ÚNICAMENTE lo que el usuario solicita.
-
-{plantilla_casos}
-{plantilla_casos_json}
-{plantilla_manual}
-
-El usuario solicita: "{pregunta_usuario}"
-
-{"INSTRUCCIÓN ESPECIAL PARA CASOS DE PRUEBA: Si el usuario solicita casos de prueba, debes generar AMBOS formatos: el formato original estándar Y el formato JSON. Presenta primero el formato original completo, luego una separación clara, y después el formato JSON completo." if solicita_casos_prueba else ""}
-
-Basándote en tu experiencia como {rol_final} y en su solicitud específica:
-
-Historial reciente:
-{self.obtener_historial_reciente()}
-
-Contenido del archivo y solicitud:
-{mensaje}
-
-Responde como {rol_final} específicamente a lo solicitado:"""
-                else:
-                    # Agregar plantillas según lo solicitado
-                    plantilla_casos = self.obtener_plantilla_casos_prueba() if solicita_casos_prueba else ""
-                    plantilla_casos_json = self.obtener_plantilla_casos_prueba_json() if solicita_casos_prueba else ""
-                    plantilla_manual = self.obtener_plantilla_manual_usuario() if solicita_manual_usuario else ""
-                    
-                    prompt = f"""Eres {self.nombre}, un chatbot especializado en análisis de documentos y QA profesional.
-
-IMPORTANTE: Responde ÚNICAMENTE lo que el usuario solicita. No agregues información extra no solicitada.
-
-{plantilla_casos}
-{plantilla_casos_json}
-{plantilla_manual}
-
-El usuario solicita: "{pregunta_usuario}"
-
-{"INSTRUCCIÓN ESPECIAL PARA CASOS DE PRUEBA: Si el usuario solicita casos de prueba, debes generar AMBOS formatos: el formato original estándar Y el formato JSON. Presenta primero el formato original completo, luego una separación clara, y después el formato JSON completo." if solicita_casos_prueba else ""}
-
-Basándote en su solicitud específica, puedes:
+            if rol_solicitado or contexto_qa:
+                constructor.agregar("guia", f"Basándote en tu experiencia como {rol_final} y en su solicitud específica:")
+                cierre = f"Responde como {rol_final} específicamente a lo solicitado:"
+            else:
+                constructor.agregar("guia", """Basándote en su solicitud específica, puedes:
 - Si pide un RESUMEN: Proporciona solo un resumen claro y conciso
 - Si pide CASOS DE PRUEBA: Genera casos de prueba detallados siguiendo AMBAS plantillas (original y JSON)
 - Si pide MANUAL DE USUARIO: Genera documentación siguiendo la estructura específica
 - Si pide ANÁLISIS: Analiza el contenido según su solicitud
 - Si pide REVISIÓN DE CÓDIGO: Revisa y sugiere mejoras
-- Si no especifica: Pregunta qué tipo de análisis necesita
-
-Historial reciente:
-{self.obtener_historial_reciente()}
-
-Contenido del archivo y solicitud:
-{mensaje}
-
-Responde específicamente a lo solicitado por el usuario:"""
+- Si no especifica: Pregunta qué tipo de análisis necesita""")
+                cierre = "Responde específicamente a lo solicitado por el usuario:"
+            
+            constructor.agregar("historial", self.obtener_historial_para_prompt(), prioridad=4,
+                                estrategia=CONSERVAR_FINAL, titulo="Historial reciente:")
+            constructor.agregar("adjuntos", contenido_archivos, prioridad=2,
+                                estrategia=CONSERVAR_INICIO, titulo="Contenido de los archivos adjuntos:")
+            constructor.agregar("cierre", cierre)
+        
+        elif rol_solicitado or contexto_qa:
+            # Agregar plantillas QA específicas si aplica
+            plantillas_qa = self.obtener_plantillas_qa_avanzadas() if contexto_qa else {}
+            plantillas_texto = "\n".join([f"=== {k.upper()} ===\n{v}" for k, v in plantillas_qa.items()])
+            
+            constructor.agregar("plantillas", plantillas, prioridad=3, estrategia=RESUMIR_PLANTILLA)
+            constructor.agregar("plantillas_qa", plantillas_texto, prioridad=4, estrategia=CONSERVAR_INICIO)
+            constructor.agregar("instruccion_casos", instruccion_casos)
+            constructor.agregar("instrucciones", f"Mantén tu rol y personalidad como {rol_final} durante toda la conversación.")
+            constructor.agregar("historial", self.obtener_historial_para_prompt(), prioridad=4,
+                                estrategia=CONSERVAR_FINAL, titulo="Historial reciente de la conversación:")
+            constructor.agregar("historial_relevante", self.obtener_fragmentos_historial(mensaje), prioridad=4,
+                                estrategia=CONSERVAR_INICIO, titulo=TITULO_FRAGMENTOS_HISTORIAL)
+            constructor.agregar("solicitud", f"Usuario: {mensaje}")
+            constructor.agregar("cierre", f"Responde como {rol_final} de manera profesional y experta:")
+        
+        else:
+            # Detectar si es una pregunta simple o técnica
+            if self.es_pregunta_simple(mensaje):
+                constructor.agregar("rol", f"Eres {self.nombre}, un chatbot amigable especializado en QA y testing.")
+                constructor.agregar("instrucciones", "Responde de manera BREVE, NATURAL y AMIGABLE. NO uses formato estructurado para saludos o preguntas simples.")
+                constructor.agregar("solicitud", f"Usuario: {mensaje}")
+                constructor.agregar("cierre", "Responde de forma corta y conversacional (máximo 2-3 líneas):")
             else:
-                # Prompt normal para conversación regular
-                # Detectar si se solicitan casos de prueba
-                solicita_casos_prueba = any(palabra in mensaje.lower() for palabra in 
-                                          ['casos de prueba', 'test cases', 'casos prueba', 'generar casos', 'crear casos'])
-                
-                # Detectar si se solicita manual de usuario
-                solicita_manual_usuario = any(palabra in mensaje.lower() for palabra in 
-                                            ['manual de usuario', 'manual usuario', 'documentacion usuario', 'guia usuario', 
-                                             'documentation user', 'user manual', 'guia de usuario', 'manual del usuario'])
-                
-                if rol_solicitado or contexto_qa:
-                    # Agregar plantillas según lo solicitado
-                    plantilla_casos = self.obtener_plantilla_casos_prueba() if solicita_casos_prueba else ""
-                    plantilla_casos_json = self.obtener_plantilla_casos_prueba_json() if solicita_casos_prueba else ""
-                    plantilla_manual = self.obtener_plantilla_manual_usuario() if solicita_manual_usuario else ""
-                    plantillas_qa = self.obtener_plantillas_qa_avanzadas() if contexto_qa else {}
-                    contexto_especializado = self.generar_contexto_qa_especializado(contexto_qa) if contexto_qa else ""
-                    
-                    rol_final = rol_solicitado or f"QA Specialist - {contexto_qa}"
-                    
-                    # Agregar plantillas QA específicas si aplica
-                    plantillas_texto = ""
-                    if plantillas_qa:
-                        plantillas_texto = "\n".join([f"=== {k.upper()} ===\n{v}" for k, v in plantillas_qa.items()])
-                    
-                    prompt = f"""Eres {self.nombre}, actuando como {rol_final}.
-
-{self.obtener_contexto_rol(rol_solicitado) if rol_solicitado else contexto_especializado}
-
-{plantilla_casos}
-{plantilla_casos_json}
-{plantilla_manual}
-{plantillas_texto}
-
-{"INSTRUCCIÓN ESPECIAL PARA CASOS DE PRUEBA: Si el usuario solicita casos de prueba, debes generar AMBOS formatos: el formato original estándar Y el formato JSON. Presenta primero el formato original completo, luego una separación clara, y después el formato JSON completo." if solicita_casos_prueba else ""}
-
-Mantén tu rol y personalidad como {rol_final} durante toda la conversación.
-
-Historial reciente de la conversación:
-{self.obtener_historial_reciente()}
-
-Usuario: {mensaje}
-
-Responde como {rol_final} de manera profesional y experta:"""
-                else:
-                    # Agregar plantillas según lo solicitado
-                    plantilla_casos = self.obtener_plantilla_casos_prueba() if solicita_casos_prueba else ""
-                    plantilla_casos_json = self.obtener_plantilla_casos_prueba_json() if solicita_casos_prueba else ""
-                    plantilla_manual = self.obtener_plantilla_manual_usuario() if solicita_manual_usuario else ""
-                    
-                    # Detectar si es una pregunta simple o técnica
-                    preguntas_simples = ['como estas', 'que tal', 'hola', 'hi', 'buenos dias', 'buenas tardes', 
-                                        'buenas noches', 'como te encuentras', 'que haces', 'adios', 'chao',
-                                        'hasta luego', 'gracias', 'muchas gracias', 'de nada', 'ok', 'vale']
-                    
-                    es_pregunta_simple = any(palabra in mensaje.lower() for palabra in preguntas_simples)
-                    
-                    if es_pregunta_simple:
-                        prompt = f"""Eres {self.nombre}, un chatbot amigable especializado en QA y testing.
-                        
-Responde de manera BREVE, NATURAL y AMIGABLE. NO uses formato estructurado para saludos o preguntas simples.
-
-Usuario: {mensaje}
-
-Responde de forma corta y conversacional (máximo 2-3 líneas):"""
-                    else:
-                        prompt = f"""Eres {self.nombre}, un chatbot especializado en QA y testing. 
-                        
-IMPORTANTE: Para consultas técnicas o complejas, responde en formato estructurado:
+                constructor.agregar("rol", f"Eres {self.nombre}, un chatbot especializado en QA y testing.")
+                constructor.agregar("instrucciones", """IMPORTANTE: Para consultas técnicas o complejas, responde en formato estructurado:
 
 # 📌 [TÍTULO PRINCIPAL]
 Breve introducción (máximo 2-3 líneas).
@@ -1369,107 +1498,464 @@ Consejos prácticos.
 ## 5️⃣ **Conclusión**
 Resumen breve.
 
-⚠️ Usa **negrita** para términos clave.
-                        
-{plantilla_casos}
-{plantilla_casos_json}
-{plantilla_manual}
-
-{"INSTRUCCIÓN ESPECIAL PARA CASOS DE PRUEBA: Si el usuario solicita casos de prueba, debes generar AMBOS formatos: el formato original estándar Y el formato JSON. Presenta primero el formato original completo, luego una separación clara, y después el formato JSON completo." if solicita_casos_prueba else ""}
-                        
-Historial reciente:
-{self.obtener_historial_reciente()}
-                        
-Usuario: {mensaje}
-                        
-Responde siguiendo el formato estructurado para esta consulta técnica:"""
+⚠️ Usa **negrita** para términos clave.""")
+                constructor.agregar("plantillas", plantillas, prioridad=3, estrategia=RESUMIR_PLANTILLA)
+                constructor.agregar("instruccion_casos", instruccion_casos)
+                constructor.agregar("historial", self.obtener_historial_para_prompt(), prioridad=4,
+                                    estrategia=CONSERVAR_FINAL, titulo="Historial reciente:")
+                constructor.agregar("historial_relevante", self.obtener_fragmentos_historial(mensaje), prioridad=4,
+                                    estrategia=CONSERVAR_INICIO, titulo=TITULO_FRAGMENTOS_HISTORIAL)
+                constructor.agregar("solicitud", f"Usuario: {mensaje}")
+                constructor.agregar("cierre", "Responde siguiendo el formato estructurado para esta consulta técnica:")
+        
+        prompt = constructor.construir()
+        
+        # Informe del tamaño final por sección (se muestra cuando hubo recortes)
+        self.ultimo_informe_prompt = constructor.informe
+        if constructor.hubo_recortes():
+            print(f"✂️ {constructor.resumen()}")
+        
+        return prompt
+    
+    def solicita_casos_prueba(self, pregunta):
+        """Indica si la pregunta pide casos de prueba"""
+        return self.detectar_intenciones(pregunta)["casos_prueba"]
+    
+    def solicita_manual_usuario(self, pregunta):
+        """Indica si la pregunta pide un manual de usuario"""
+        return self.detectar_intenciones(pregunta)["manual_usuario"]
+    
+    def es_pregunta_simple(self, mensaje):
+        """Indica si el mensaje es un saludo o una pregunta conversacional simple"""
+        return self.detectar_intenciones(mensaje)["pregunta_simple"]
+    
+    def detectar_intenciones(self, mensaje):
+        """
+        Todas las señales de intención en una sola pasada sobre la pregunta normalizada (nunca sobre
+        los adjuntos); con una SolicitudChat se reutiliza lo ya calculado
+        """
+        return SolicitudChat.desde(mensaje).intenciones
+    
+    def detectar_intencion(self, mensaje):
+        """Tipo de solicitud que determina la política de generación (mismo criterio que construir_prompt)"""
+        intenciones = self.detectar_intenciones(mensaje)
+        if intenciones["casos_prueba"]:
+            return CASOS_PRUEBA
+        if intenciones["manual_usuario"]:
+            return MANUAL_USUARIO
+        if SolicitudChat.desde(mensaje).tiene_adjuntos:
+            return ANALISIS_ARCHIVOS
+        if intenciones["rol"]:
+            return ROL
+        if intenciones["contexto_qa"]:
+            return CONTEXTO_QA
+        if intenciones["pregunta_simple"]:
+            return CHAT_SIMPLE
+        return CONSULTA_TECNICA
+    
+    def obtener_configuracion_generacion(self, intencion):
+        """Configuración de generación para el tipo de solicitud; registra la política aplicada"""
+        configuracion = self.politicas_generacion.obtener(intencion, self.configuracion_generacion)
+        print(f"🎛️ Política de generación: {self.politicas_generacion.describir(intencion, configuracion)}")
+        return configuracion
+    
+    def obtener_semaforo(self):
+        """Devuelve el semáforo que limita las solicitudes en vuelo del bucle de eventos actual"""
+        bucle = asyncio.get_running_loop()
+        semaforo = self._semaforos.get(bucle)
+        if semaforo is None:
+            semaforo = asyncio.Semaphore(self.max_solicitudes_concurrentes)
+            self._semaforos[bucle] = semaforo
+        return semaforo
+    
+    def compartir_recursos(self, otro):
+        """
+        Usa el límite de solicitudes en vuelo, las cachés y el índice del historial de otro chatbot,
+        para que varias instancias del mismo proceso respeten juntas el límite y el tamaño en disco
+        """
+        self._semaforos = otro._semaforos
+        self.cache_respuestas = otro.cache_respuestas
+        self.cache_semantica = otro.cache_semantica
+        self.indice_historial = otro.indice_historial
+    
+    def obtener_bucle(self):
+        """Devuelve el bucle de eventos propio del chatbot, iniciándolo en segundo plano si hace falta"""
+        # Se usa siempre el mismo bucle porque el cliente asíncrono del SDK queda ligado al bucle
+        # en el que se creó; además así todas las llamadas síncronas comparten el semáforo
+        with self._lock_bucle:
+            if self._bucle is None:
+                self._bucle = asyncio.new_event_loop()
+                threading.Thread(target=self._bucle.run_forever, name="ChatBotAsyncio", daemon=True).start()
+            return self._bucle
+    
+    def ejecutar_sync(self, corrutina):
+        """Ejecuta una corrutina en el bucle del chatbot y espera su resultado"""
+        return asyncio.run_coroutine_threadsafe(corrutina, self.obtener_bucle()).result()
+    
+    def iterar_sync(self, generador_async):
+        """Recorre un generador asíncrono desde código síncrono usando el bucle del chatbot"""
+        async def siguiente():
+            return await generador_async.__anext__()
+        
+        try:
+            while True:
+                try:
+                    yield self.ejecutar_sync(siguiente())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.ejecutar_sync(generador_async.aclose())
+    
+    async def condensar_adjuntos_async(self, mensaje, callback_progreso=None):
+        """Reemplaza los adjuntos muy grandes por las notas relevantes extraídas de cada fragmento"""
+        if "--- ARCHIVOS ADJUNTOS ---" not in mensaje:
+            return mensaje
+        
+        pregunta_usuario, contenido_archivos = mensaje.split("--- ARCHIVOS ADJUNTOS ---", 1)
+        if len(contenido_archivos) <= self.umbral_map_reduce_caracteres:
+            return mensaje
+        
+        procesador = ProcesadorMapReduce(
+            lambda prompt: self.generar_contenido_async(prompt, intencion=EXTRACCION_FRAGMENTO),
+            max_paralelo=self.max_llamadas_paralelas,
+            tamano_fragmento=self.tamano_fragmento_caracteres
+        )
+        inicio = time.perf_counter()
+        notas = await procesador.condensar(pregunta_usuario.strip() or "Analiza este archivo",
+                                           contenido_archivos, callback_progreso)
+        print(f"📄 Adjuntos condensados de {len(contenido_archivos)} a {len(notas)} caracteres "
+              f"en {time.perf_counter() - inicio:.1f}s")
+        
+        if callback_progreso:
+            callback_progreso("✍️ Generando respuesta final...")
+        
+        return (f"{pregunta_usuario}--- ARCHIVOS ADJUNTOS ---\n"
+                f"(Notas extraídas de la documentación adjunta, procesada por fragmentos)\n\n{notas}")
+    
+    def condensar_adjuntos(self, mensaje, callback_progreso=None):
+        """Versión síncrona de condensar_adjuntos_async"""
+        return self.ejecutar_sync(self.condensar_adjuntos_async(mensaje, callback_progreso))
+    
+    async def responder_con_ia_async(self, mensaje, usar_cache=None, callback_progreso=None):
+        """Genera respuesta usando Google AI"""
+        if self.resiliencia.interruptor.esta_abierto():
+            return self.responder_con_circuito_abierto(mensaje)
+        
+        try:
+            intencion = self.detectar_intencion(mensaje)
+            # Los adjuntos grandes se condensan una sola vez, aunque haya que repetir la
+            # solicitud en formato doble
+            mensaje_condensado = await self.condensar_adjuntos_async(mensaje, callback_progreso)
+            if self.usar_casos_estructurados and intencion == CASOS_PRUEBA:
+                try:
+                    respuesta = await self.generar_casos_estructurados_async(mensaje_condensado, usar_cache,
+                                                                             condensado=True)
+                    self.guardar_en_cache_semantica(mensaje, respuesta)
+                    return respuesta
+                except ValueError as e:
+                    print(f"⚠️ JSON de casos de prueba inválido, se piden en formato doble: {e}")
             
-            response = self.modelo_ia.generate_content(prompt)
-            return response.text
+            prompt = self.construir_prompt(mensaje_condensado)
+            respuesta = await self.generar_contenido_async(prompt, usar_cache, self.obtener_historial_sesion(),
+                                                           intencion=intencion)
+            self.guardar_en_cache_semantica(mensaje, respuesta)
+            return respuesta
             
         except Exception as e:
             print(f"Error con IA: {e}")
-            return self.responder_localmente(mensaje)
+            return RespuestaRespaldo(self.responder_localmente(mensaje), str(e))
     
-    def detectar_contexto_qa_especializado(self, mensaje):
-        """Detecta contextos QA especializados en el mensaje"""
-        mensaje_lower = mensaje.lower()
-        
-        # Patrones para diferentes especializaciones QA
-        contextos_qa = {
-            "qa_api": [
-                "endpoint", "api testing", "rest api", "json schema", "postman",
-                "test api", "api cases", "swagger", "openapi", "microservices"
-            ],
-            "qa_security": [
-                "security testing", "owasp", "vulnerabilities", "penetration test",
-                "authentication", "authorization", "sql injection", "xss", "csrf"
-            ],
-            "qa_performance": [
-                "performance testing", "load testing", "stress testing", "jmeter",
-                "performance cases", "response time", "throughput", "scalability"
-            ],
-            "qa_mobile": [
-                "mobile testing", "app testing", "android testing", "ios testing",
-                "mobile automation", "appium", "device testing"
-            ],
-            "qa_automatizado": [
-                "test automation", "selenium", "playwright", "cypress", "automation scripts",
-                "automated testing", "test framework", "ci/cd testing"
-            ],
-            "qa_manual": [
-                "manual testing", "exploratory testing", "user acceptance testing",
-                "uat", "manual test cases", "regression testing"
-            ]
-        }
+    def responder_con_ia(self, mensaje, usar_cache=None, callback_progreso=None):
+        """Versión síncrona de responder_con_ia_async"""
+        return self.ejecutar_sync(self.responder_con_ia_async(mensaje, usar_cache, callback_progreso))
+    
+    async def generar_casos_estructurados_async(self, mensaje, usar_cache=None, callback_progreso=None,
+                                                condensado=False):
+        """
+        Pide los casos de prueba como JSON con esquema y genera localmente la vista CP- y el JSON de proyecto;
+        con "condensado" el mensaje ya pasó por condensar_adjuntos_async
+        
+        Raises:
+            ValueError: Si la respuesta no es un JSON de casos de prueba válido
+        """
+        configuracion = self.obtener_configuracion_generacion(CASOS_PRUEBA)
+        configuracion.update(CONFIGURACION_JSON)
+        if not condensado:
+            mensaje = await self.condensar_adjuntos_async(mensaje, callback_progreso)
+        prompt = self.construir_prompt(mensaje, casos_estructurados=True)
+        texto = await self.generar_contenido_async(prompt, usar_cache, self.obtener_historial_sesion(),
+                                                   configuracion, CASOS_PRUEBA)
+        return self.renderizar_casos_estructurados(interpretar_casos(texto))
+    
+    def renderizar_casos_estructurados(self, datos):
+        """Presenta los casos en el formato CP- estándar seguido del JSON de proyecto"""
+        proyecto = convertir_a_proyecto(datos, self.calcular_fechas_proyecto)
+        return (f"{renderizar_casos_cp(datos, datetime.now())}\n\n---\n\n"
+                f"```json\n{json.dumps(proyecto, indent=2, ensure_ascii=False)}\n```")
+    
+    async def generar_contenido_async(self, prompt, usar_cache=None, historial=None, configuracion=None,
+                                      intencion=None):
+        """
+        Envía el prompt (y el historial multi-turno, si se indica) consultando antes la caché de respuestas;
+        con la intención se aplican su política de generación y su nivel de modelo
+        """
+        usar_cache = self.usar_cache if usar_cache is None else usar_cache
+        if configuracion is None:
+            configuracion = (self.obtener_configuracion_generacion(intencion) if intencion
+                             else self.configuracion_generacion)
+        nivel = self.elegir_nivel_modelo(intencion, prompt, historial) if intencion else None
+        backend = self.obtener_backend(nivel)
+        clave = self.generar_clave_cache(prompt, historial, configuracion, backend)
         
-        for contexto, patrones in contextos_qa.items():
-            for patron in patrones:
-                if patron in mensaje_lower:
-                    return contexto
+        if usar_cache:
+            respuesta_cache = self.cache_respuestas.obtener(clave)
+            if respuesta_cache is not None:
+                return respuesta_cache
         
-        # Si menciona QA en general pero no específico
-        if any(palabra in mensaje_lower for palabra in ["qa", "quality assurance", "testing", "test cases"]):
-            return "qa_manual"  # Default a manual QA
+        async with self.obtener_semaforo():
+            inicio = time.perf_counter()
+            try:
+                texto = await self.resiliencia.ejecutar(lambda: backend.generar(
+                    prompt, configuracion, self.resiliencia.politica.timeout_segundos, historial))
+            except Exception:
+                self.registrar_latencia_modelo(nivel, time.perf_counter() - inicio, intencion, prompt, historial,
+                                               exito=False)
+                raise
+            duracion = time.perf_counter() - inicio
         
-        return None
+        self.registrar_latencia_modelo(nivel, duracion, intencion, prompt, historial)
+        # Aunque se omita la lectura, la respuesta nueva refresca la entrada en caché
+        self.cache_respuestas.guardar(clave, texto, duracion, estimar_tokens(prompt + texto))
+        return texto
     
-    def detectar_rol_solicitado(self, mensaje):
-        """Detecta si el usuario solicita un rol específico"""
-        mensaje_lower = mensaje.lower()
-        
-        # Patrones para diferentes roles profesionales
-        roles = {
-            "experto en QA y casos de prueba": [
-                "actua como experto en qa", "actua como ingeniero qa", "actua como tester",
-                "actua como experto en testing", "actua como experto en casos de prueba",
-                "comportate como qa", "comportate como tester", "eres un experto qa",
-                "eres un ingeniero qa", "experto en quality assurance"
-            ],
-            "arquitecto de software": [
-                "actua como arquitecto", "actua como arquitecto de software",
-                "comportate como arquitecto", "eres un arquitecto de software"
-            ],
-            "analista de negocio": [
-                "actua como analista", "actua como analista de negocio",
-                "comportate como analista", "eres un analista de negocio"
-            ],
-            "desarrollador senior": [
-                "actua como desarrollador", "actua como programador senior",
-                "comportate como desarrollador", "eres un desarrollador senior"
-            ],
-            "consultor técnico": [
-                "actua como consultor", "actua como consultor tecnico",
-                "comportate como consultor", "eres un consultor técnico"
-            ]
+    def generar_contenido(self, prompt, usar_cache=None, historial=None, configuracion=None, intencion=None):
+        """Versión síncrona de generar_contenido_async"""
+        return self.ejecutar_sync(self.generar_contenido_async(prompt, usar_cache, historial, configuracion,
+                                                               intencion))
+    
+    def generar_clave_cache(self, prompt, historial=None, configuracion=None, backend=None):
+        """Clave de la caché de respuestas; incluye el backend para no mezclar respuestas simuladas y reales"""
+        backend = backend or self.backend_ia
+        modelo = f"{backend.nombre}:{backend.nombre_modelo}" if backend else f"ninguno:{self.nombre_modelo}"
+        configuracion = self.configuracion_generacion if configuracion is None else configuracion
+        return CacheRespuestas.generar_clave(prompt, modelo, configuracion, self.sesion_chat.huella(historial))
+    
+    def elegir_nivel_modelo(self, intencion, prompt, historial=None):
+        """Nivel de modelo según la intención y el tamaño del prompt más el historial; registra la elección"""
+        if not self.usar_enrutador:
+            return None
+        tokens = self.estimar_tokens_solicitud(prompt, historial)
+        nivel = self.enrutador_modelos.elegir(intencion, tokens)
+        print(f"🧭 Modelo: {self.enrutador_modelos.modelo(nivel)} (nivel {nivel}, ~{tokens} tokens)")
+        return nivel
+    
+    def obtener_backend(self, nivel=None):
+        """Backend del modelo asignado al nivel, derivado del backend configurado (sin nivel, el configurado)"""
+        if nivel is None or not self.backend_ia:
+            return self.backend_ia
+        modelo = self.enrutador_modelos.modelo(nivel)
+        if modelo == self.backend_ia.nombre_modelo:
+            return self.backend_ia
+        
+        with self._lock_backends:
+            # Si se reemplazó el backend configurado, las variantes anteriores ya no sirven
+            if self._backend_origen is not self.backend_ia:
+                self._backends_por_modelo = {}
+                self._backend_origen = self.backend_ia
+            if modelo not in self._backends_por_modelo:
+                self._backends_por_modelo[modelo] = self.backend_ia.con_modelo(modelo)
+            return self._backends_por_modelo[modelo]
+    
+    def estimar_tokens_solicitud(self, prompt, historial=None):
+        """Tamaño estimado de lo que se envía al modelo: prompt más historial multi-turno"""
+        return estimar_tokens(prompt) + sum(estimar_tokens(turno["texto"]) for turno in historial or [])
+    
+    def registrar_latencia_modelo(self, nivel, segundos, intencion, prompt, historial=None, exito=True):
+        """Registra la duración de una llamada en las estadísticas de su nivel de modelo"""
+        if nivel:
+            self.enrutador_modelos.registrar(nivel, segundos, intencion or "",
+                                             self.estimar_tokens_solicitud(prompt, historial), exito)
+    
+    def obtener_estadisticas_modelos(self):
+        """Devuelve llamadas, errores y latencias p50/p90 por nivel de modelo"""
+        return self.enrutador_modelos.obtener_estadisticas()
+    
+    def obtener_historial_sesion(self):
+        """Historial compacto de la conversación para enviar como turnos nativos (None si está desactivado)"""
+        return self.sesion_chat.obtener_historial() if self.usar_sesion_chat else None
+    
+    def obtener_historial_para_prompt(self):
+        """Historial en texto para el prompt; vacío cuando se envía como sesión multi-turno"""
+        return "" if self.usar_sesion_chat else self.obtener_historial_reciente()
+    
+    def nueva_conversacion(self):
+        """Reinicia la sesión, el historial en memoria y la sesión multi-turno"""
+        self.sesion_actual = {
+            'inicio': datetime.now().isoformat(),
+            'conversaciones': []
         }
+        self.ruta_sesion_actual = None
+        self.historial_conversacion = []
+        self.sesion_chat.reiniciar()
+    
+    def obtener_estadisticas_cache(self):
+        """Devuelve los contadores de aciertos y fallos de la caché de respuestas"""
+        return self.cache_respuestas.obtener_estadisticas()
+    
+    def buscar_respuesta_previa(self, mensaje):
+        """Respuesta ya dada a la misma pregunta en esta sesión (caché semántica) o en sesiones anteriores"""
+        respuesta = self.buscar_en_cache_semantica(mensaje)
+        if respuesta is None:
+            respuesta = self.buscar_en_historial(mensaje)
+        return respuesta
+    
+    def obtener_indice_historial(self):
+        """Índice de sesiones anteriores, sincronizado con historial/ la primera vez que se usa"""
+        if not self._historial_indexado:
+            agregadas = self.indice_historial.sincronizar(self.directorio_historial)
+            if agregadas:
+                print(f"📚 Índice del historial: {agregadas} conversaciones nuevas indexadas")
+            self._historial_indexado = True
+        return self.indice_historial
+    
+    def buscar_en_historial(self, mensaje):
+        """Respuesta de una sesión anterior a prácticamente la misma pregunta, con el mismo rol y contexto QA"""
+        solicitud = SolicitudChat.desde(mensaje)
+        # Con turnos anteriores la pregunta puede referirse a ellos y la respuesta guardada no serviría
+        if (not self.usar_cache or not self.usar_indice_historial or solicitud.tiene_adjuntos
+                or self.sesion_chat.obtener_turnos()):
+            return None
         
-        for rol, patrones in roles.items():
-            for patron in patrones:
-                if patron in mensaje_lower:
-                    return rol
+        documento = self.obtener_indice_historial().respuesta_directa(
+            solicitud.pregunta,
+            self.detectar_rol_solicitado(solicitud),
+            self.detectar_contexto_qa_especializado(solicitud)
+        )
+        if documento is None:
+            return None
+        print(f"📚 Respuesta reutilizada del historial ({documento['sesion']}, "
+              f"coincidencia {documento['coincidencia']:.0%})")
+        return documento["respuesta"]
+    
+    def obtener_fragmentos_historial(self, mensaje):
+        """Conversaciones anteriores relacionadas con la pregunta, abreviadas para el prompt"""
+        solicitud = SolicitudChat.desde(mensaje)
+        if not self.usar_indice_historial or solicitud.tiene_adjuntos:
+            return ""
+        return self.obtener_indice_historial().fragmentos(solicitud.pregunta)
+    
+    def buscar_en_cache_semantica(self, mensaje):
+        """Busca una respuesta previa a una pregunta equivalente con el mismo rol y contexto QA"""
+        # Con archivos adjuntos la respuesta depende del documento, no solo de la pregunta, y con
+        # turnos anteriores depende también de la conversación (por ejemplo, "dame 5 casos más")
+        if not self.usar_cache or "--- ARCHIVOS ADJUNTOS ---" in mensaje or self.sesion_chat.obtener_turnos():
+            return None
         
-        return None
+        return self.cache_semantica.buscar(
+            mensaje,
+            self.detectar_rol_solicitado(mensaje),
+            self.detectar_contexto_qa_especializado(mensaje)
+        )
+    
+    def guardar_en_cache_semantica(self, mensaje, respuesta):
+        """Recuerda la respuesta de la IA para futuras preguntas equivalentes (solo las que no dependen de turnos anteriores)"""
+        if "--- ARCHIVOS ADJUNTOS ---" in mensaje or not respuesta or self.sesion_chat.obtener_turnos():
+            return
+        
+        self.cache_semantica.agregar(
+            mensaje,
+            self.detectar_rol_solicitado(mensaje),
+            self.detectar_contexto_qa_especializado(mensaje),
+            respuesta
+        )
+    
+    async def responder_con_ia_stream_async(self, mensaje, usar_cache=None, callback_progreso=None):
+        """Genera respuesta usando Google AI, entregando fragmentos a medida que llegan"""
+        if self.resiliencia.interruptor.esta_abierto():
+            yield self.responder_con_circuito_abierto(mensaje)
+            return
+        
+        if self.usar_casos_estructurados and self.detectar_intencion(mensaje) == CASOS_PRUEBA:
+            # El JSON no se puede mostrar a medida que llega: se entrega la vista ya generada
+            yield await self.responder_con_ia_async(mensaje, usar_cache, callback_progreso)
+            return
+        
+        usar_cache = self.usar_cache if usar_cache is None else usar_cache
+        hubo_fragmentos = False
+        try:
+            intencion = self.detectar_intencion(mensaje)
+            configuracion = self.obtener_configuracion_generacion(intencion)
+            prompt = self.construir_prompt(await self.condensar_adjuntos_async(mensaje, callback_progreso))
+            historial = self.obtener_historial_sesion()
+            nivel = self.elegir_nivel_modelo(intencion, prompt, historial)
+            backend = self.obtener_backend(nivel)
+            clave = self.generar_clave_cache(prompt, historial, configuracion, backend)
+            
+            if usar_cache:
+                respuesta_cache = self.cache_respuestas.obtener(clave)
+                if respuesta_cache is not None:
+                    yield respuesta_cache
+                    return
+            
+            fragmentos = []
+            async with self.obtener_semaforo():
+                inicio = time.perf_counter()
+                # Los reintentos solo cubren el inicio del stream, antes de entregar nada al usuario
+                textos = await self.resiliencia.ejecutar(lambda: backend.generar_stream(
+                    prompt, configuracion, self.resiliencia.politica.timeout_segundos, historial))
+                
+                async for texto in textos:
+                    if texto:
+                        hubo_fragmentos = True
+                        fragmentos.append(texto)
+                        yield texto
+                duracion = time.perf_counter() - inicio
+            
+            self.registrar_latencia_modelo(nivel, duracion, intencion, prompt, historial)
+            
+            # Solo se guarda en caché una respuesta completa
+            respuesta_completa = "".join(fragmentos)
+            self.cache_respuestas.guardar(clave, respuesta_completa, duracion,
+                                          estimar_tokens(prompt + respuesta_completa))
+            self.guardar_en_cache_semantica(mensaje, respuesta_completa)
+        
+        except Exception as e:
+            print(f"Error con IA (streaming): {e}")
+            if hubo_fragmentos and es_error_reintentable(e):
+                # El stream se cortó a mitad de la respuesta
+                self.resiliencia.interruptor.registrar_fallo()
+            # Solo usar respuesta local si todavía no se envió nada al usuario; si ya se
+            # envió una parte, se avisa de que está incompleta en lugar de darla por buena
+            if not hubo_fragmentos:
+                yield RespuestaRespaldo(self.responder_localmente(mensaje), str(e))
+            else:
+                yield AvisoRespuestaIncompleta(
+                    "\n\n⚠️ La respuesta se interrumpió por un error del servicio de IA. "
+                    "Vuelve a enviar la pregunta para obtenerla completa.")
+    
+    def responder_con_circuito_abierto(self, mensaje):
+        """Respuesta local inmediata mientras el servicio de IA no está disponible"""
+        self.resiliencia.rechazadas += 1
+        segundos = self.resiliencia.interruptor.segundos_para_reintentar()
+        print(f"⚡ Circuito abierto: respuesta local (se reintentará la IA en {segundos:.0f}s)")
+        return RespuestaRespaldo(self.generar_respuesta_archivo_local(mensaje),
+                                 f"circuito abierto (reintento en {segundos:.0f}s)")
+    
+    def obtener_estado_resiliencia(self):
+        """Devuelve el estado del interruptor de circuito y los contadores de reintentos"""
+        return self.resiliencia.obtener_estadisticas()
+    
+    def responder_con_ia_stream(self, mensaje, usar_cache=None, callback_progreso=None):
+        """Versión síncrona de responder_con_ia_stream_async"""
+        yield from self.iterar_sync(self.responder_con_ia_stream_async(mensaje, usar_cache, callback_progreso))
+    
+    def detectar_contexto_qa_especializado(self, mensaje):
+        """Detecta contextos QA especializados en la pregunta del usuario"""
+        return self.detectar_intenciones(mensaje)["contexto_qa"]
+    
+    def detectar_rol_solicitado(self, mensaje):
+        """Detecta si el usuario solicita un rol específico"""
+        return self.detectar_intenciones(mensaje)["rol"]
     
     def obtener_contexto_rol(self, rol):
         """Obtiene el contexto y características de un rol específico"""
@@ -1544,15 +2030,17 @@ Tu objetivo es proporcionar guidance experto y soluciones optimizadas.
         return contextos_roles.get(rol, "Actúa como un profesional experto en tu área.")
     
     def obtener_historial_reciente(self):
-        """Obtiene las últimas 3 interacciones para contexto"""
-        if len(self.historial_conversacion) == 0:
-            return "Esta es la primera interacción."
-        
-        historial = ""
-        for interaccion in self.historial_conversacion[-3:]:
-            historial += f"Usuario: {interaccion['usuario']}\n{self.nombre}: {interaccion['bot']}\n"
+        """Obtiene el resumen de la conversación más la última interacción, dentro del presupuesto de la sesión"""
+        historial = self.sesion_chat.obtener_historial_texto(self.nombre)
         return historial if historial else "Esta es la primera interacción."
     
+    def generar_resumen_conversacion(self, prompt):
+        """Genera con la IA el resumen acumulado de la conversación (se ejecuta en segundo plano)"""
+        if not self.usar_ia or not self.backend_ia:
+            raise RuntimeError("IA no disponible")
+        # Sin historial: el prompt del resumen ya contiene los turnos a resumir
+        return self.generar_contenido(prompt, intencion=RESUMEN_CONVERSACION)
+    
     def crear_directorio_historial(self):
         """Crea el directorio para guardar el historial si no existe"""
         try:
@@ -1561,13 +2049,25 @@ Tu objetivo es proporcionar guidance experto y soluciones optimizadas.
         except Exception as e:
             print(f"Error creando directorio de historial: {e}")
     
-    def guardar_conversacion(self, mensaje_usuario, respuesta_bot):
-        """Guarda una conversación individual en la sesión actual"""
+    def guardar_conversacion(self, mensaje_usuario, respuesta_bot, fue_ia=None, con_adjuntos=False,
+                             respaldo_local=False, incompleta=False):
+        """
+        Guarda una conversación individual en la sesión actual; "fue_ia" es la etiqueta con la
+        que se entrena el clasificador local (por defecto, la de las reglas: nunca la decisión del
+        propio clasificador, para que sus errores no se aprendan de nuevo), y "con_adjuntos", "respaldo_local" (la IA falló y
+        se respondió localmente) e "incompleta" (el stream se cortó) evitan que el índice del
+        historial reutilice la respuesta
+        """
+        if fue_ia is None:
+            fue_ia = self.usar_ia and not self.es_respuesta_local(mensaje_usuario)
         conversacion = {
             'timestamp': datetime.now().isoformat(),
             'usuario': mensaje_usuario,
             'bot': respuesta_bot,
-            'fue_ia': self.usar_ia and not self.es_respuesta_local(mensaje_usuario)
+            'fue_ia': fue_ia,
+            'con_adjuntos': con_adjuntos,
+            'respaldo_local': respaldo_local,
+            'incompleta': incompleta
         }
         
         self.sesion_actual['conversaciones'].append(conversacion)
@@ -1579,20 +2079,35 @@ Tu objetivo es proporcionar guidance experto y soluciones optimizadas.
             self.sesion_actual['fin'] = datetime.now().isoformat()
             self.sesion_actual['total_mensajes'] = len(self.sesion_actual['conversaciones'])
             
-            # Crear nombre de archivo con timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            nombre_archivo = f"conversacion_{timestamp}.json"
-            ruta_archivo = os.path.join(self.directorio_historial, nombre_archivo)
+            # Un archivo por sesión: guardar de nuevo la misma sesión reescribe el mismo archivo
+            if self.ruta_sesion_actual is None:
+                self.ruta_sesion_actual = self.elegir_archivo_sesion()
+            ruta_archivo = self.ruta_sesion_actual
             
             # Guardar archivo
             with open(ruta_archivo, 'w', encoding='utf-8') as f:
                 json.dump(self.sesion_actual, f, ensure_ascii=False, indent=2)
             
+            # Las preguntas de esta sesión quedan disponibles para las siguientes
+            if self.usar_indice_historial:
+                self.indice_historial.agregar_sesion(ruta_archivo)
+            
             return ruta_archivo
         except Exception as e:
             print(f"Error guardando sesión: {e}")
             return None
     
+    def elegir_archivo_sesion(self):
+        """Ruta libre para la sesión actual, con el nombre basado en su fecha de inicio"""
+        timestamp = datetime.fromisoformat(self.sesion_actual['inicio']).strftime("%Y%m%d_%H%M%S")
+        ruta_archivo = os.path.join(self.directorio_historial, f"conversacion_{timestamp}.json")
+        # Otra sesión iniciada en el mismo segundo ya usa ese nombre
+        sufijo = 2
+        while os.path.exists(ruta_archivo):
+            ruta_archivo = os.path.join(self.directorio_historial, f"conversacion_{timestamp}_{sufijo}.json")
+            sufijo += 1
+        return ruta_archivo
+    
     def cargar_historial_sesiones(self):
         """Carga todas las sesiones guardadas"""
         try:
@@ -1639,22 +2154,85 @@ Tu objetivo es proporcionar guidance experto y soluciones optimizadas.
             print(f"Error obteniendo estadísticas: {e}")
             return None
     
-    def procesar_mensaje(self, mensaje):
+    def debe_responder_localmente(self, mensaje):
+        """
+        Indica si el mensaje se responde sin consultar a la IA: por las reglas de saludos o porque
+        el clasificador local lo considera trivial y es conversación trivial sin intención de QA
+        """
+        if not self.usar_ia:
+            return True
+        if SolicitudChat.desde(mensaje).tiene_adjuntos:
+            return False
+        if self.es_respuesta_local(mensaje):
+            return True
+        return self.es_conversacion_trivial(mensaje) and self.clasificar_mensaje(mensaje) == LOCAL
+    
+    def responder_sin_ia(self, mensaje):
+        """Genera la respuesta local adecuada según haya o no archivos adjuntos"""
+        if SolicitudChat.desde(mensaje).tiene_adjuntos and not self.usar_ia:
+            return self.generar_respuesta_archivo_local(mensaje)
+        if self.usar_ia and not self.es_respuesta_local(mensaje):
+            # Enrutado por el clasificador local: solo se responde con los patrones de conversación trivial
+            return self.responder_localmente(mensaje, PATRONES_CONVERSACION_TRIVIAL)
+        return self.responder_localmente(mensaje)
+    
+    async def procesar_mensaje_async(self, mensaje, callback_progreso=None):
         """Procesa el mensaje del usuario y devuelve una respuesta"""
-        mensaje_limpio = mensaje.lower().strip()
-        
-        # Verificar si hay archivos adjuntos
-        tiene_archivos = "--- ARCHIVOS ADJUNTOS ---" in mensaje
+        # Pregunta normalizada e intenciones se calculan una vez y las reutilizan todos los detectores
+        mensaje = SolicitudChat.desde(mensaje)
         
         # Verificar si debe responder localmente (pero no si hay archivos)
-        if (self.es_respuesta_local(mensaje) and not tiene_archivos) or not self.usar_ia:
-            if tiene_archivos and not self.usar_ia:
-                respuesta = self.generar_respuesta_archivo_local(mensaje)
-            else:
-                respuesta = self.responder_localmente(mensaje)
+        if self.debe_responder_localmente(mensaje):
+            respuesta = self.responder_sin_ia(mensaje)
+        else:
+            respuesta = self.buscar_respuesta_previa(mensaje)
+            if respuesta is None:
+                respuesta = await self.responder_con_ia_async(mensaje, callback_progreso=callback_progreso)
+        
+        self.registrar_interaccion(mensaje, respuesta)
+        return respuesta
+    
+    def procesar_mensaje(self, mensaje, callback_progreso=None):
+        """Versión síncrona de procesar_mensaje_async"""
+        return self.ejecutar_sync(self.procesar_mensaje_async(mensaje, callback_progreso))
+    
+    async def procesar_mensaje_stream_async(self, mensaje, callback_progreso=None):
+        """Procesa el mensaje del usuario entregando la respuesta por fragmentos"""
+        mensaje = SolicitudChat.desde(mensaje)
+        
+        if self.debe_responder_localmente(mensaje):
+            respuesta_previa = self.responder_sin_ia(mensaje)
+        else:
+            respuesta_previa = self.buscar_respuesta_previa(mensaje)
+        
+        respaldo_local = incompleta = False
+        if respuesta_previa is not None:
+            fragmentos = [respuesta_previa]
+            yield respuesta_previa
         else:
-            respuesta = self.responder_con_ia(mensaje)
+            fragmentos = []
+            async for fragmento in self.responder_con_ia_stream_async(mensaje, callback_progreso=callback_progreso):
+                respaldo_local = respaldo_local or isinstance(fragmento, RespuestaRespaldo)
+                incompleta = incompleta or isinstance(fragmento, AvisoRespuestaIncompleta)
+                fragmentos.append(fragmento)
+                yield fragmento
         
+        # El historial se actualiza una vez que la respuesta está completa
+        self.registrar_interaccion(mensaje, "".join(fragmentos), respaldo_local=respaldo_local,
+                                   incompleta=incompleta)
+    
+    def procesar_mensaje_stream(self, mensaje, callback_progreso=None):
+        """Versión síncrona de procesar_mensaje_stream_async"""
+        yield from self.iterar_sync(self.procesar_mensaje_stream_async(mensaje, callback_progreso))
+    
+    def registrar_interaccion(self, mensaje, respuesta, fue_ia=None, respaldo_local=None, incompleta=False):
+        """
+        Agrega la interacción al historial en memoria y a la sesión actual; "respaldo_local" indica
+        que la IA falló y se respondió localmente (por defecto, si la respuesta es una RespuestaRespaldo)
+        e "incompleta" que el stream se cortó a mitad de la respuesta
+        """
+        if respaldo_local is None:
+            respaldo_local = isinstance(respuesta, RespuestaRespaldo)
         # Agregar al historial (solo la parte del mensaje del usuario, no los archivos completos)
         mensaje_para_historial = mensaje.split("--- ARCHIVOS ADJUNTOS ---")[0].strip()
         if not mensaje_para_historial:
@@ -1665,14 +2243,16 @@ Tu objetivo es proporcionar guidance experto y soluciones optimizadas.
             'bot': respuesta
         })
         
+        # La sesión multi-turno guarda la pregunta sin adjuntos y la respuesta
+        self.sesion_chat.agregar_turno(mensaje_para_historial, respuesta)
+        
         # Guardar conversación individual
-        self.guardar_conversacion(mensaje_para_historial, respuesta)
+        self.guardar_conversacion(mensaje_para_historial, respuesta, fue_ia,
+                                  SolicitudChat.desde(mensaje).tiene_adjuntos, respaldo_local, incompleta)
         
         # Mantener solo las últimas 10 interacciones en memoria
         if len(self.historial_conversacion) > 10:
             self.historial_conversacion = self.historial_conversacion[-10:]
-        
-        return respuesta
     
     def analizar_contenido_archivo(self, contenido_archivo, tipo_analisis="general"):
         """Analiza el contenido de un archivo y genera respuestas específicas"""
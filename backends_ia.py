@@ -0,0 +1,279 @@
+"""
+Backends intercambiables para generar respuestas (Gemini o un sustituto local para pruebas)
+"""
+import abc
+import asyncio
+import copy
+import json
+import random
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from constructor_prompt import estimar_tokens
+
+class BackendIA(abc.ABC):
+    """Interfaz común de los proveedores de generación de texto"""
+    
+    nombre = "base"
+    
+    def __init__(self, nombre_modelo: str):
+        self.nombre_modelo = nombre_modelo
+    
+    @abc.abstractmethod
+    async def generar(self, prompt: str, configuracion: Optional[Dict[str, Any]] = None,
+                      timeout: Optional[float] = None, historial: Optional[List[Dict[str, str]]] = None) -> str:
+        """
+        Generar la respuesta completa para un prompt
+        
+        Args:
+            prompt: Prompt completo
+            configuracion: Configuración de generación (temperatura, tokens máximos, etc.)
+            timeout: Tiempo máximo de la llamada en segundos
+            historial: Turnos anteriores {"rol": "usuario"|"modelo", "texto": ...}
+        
+        Returns:
+            Texto generado
+        """
+    
+    @abc.abstractmethod
+    async def generar_stream(self, prompt: str, configuracion: Optional[Dict[str, Any]] = None,
+                             timeout: Optional[float] = None,
+                             historial: Optional[List[Dict[str, str]]] = None) -> AsyncIterator[str]:
+        """
+        Iniciar una generación por fragmentos
+        
+        La corrutina termina cuando la generación empezó, de modo que los reintentos
+        cubren el inicio del stream; el iterador devuelto entrega los fragmentos de texto.
+        
+        Args:
+            prompt: Prompt completo
+            configuracion: Configuración de generación
+            timeout: Tiempo máximo para iniciar la llamada en segundos
+            historial: Turnos anteriores {"rol": "usuario"|"modelo", "texto": ...}
+        
+        Returns:
+            Iterador asíncrono de fragmentos de texto
+        """
+    
+    def contar_tokens(self, prompt: str) -> int:
+        """Contar los tokens de un prompt (por defecto, estimación local)"""
+        return estimar_tokens(prompt)
+    
+    def con_modelo(self, nombre_modelo: str) -> "BackendIA":
+        """
+        Backend equivalente del mismo proveedor que usa otro modelo
+        
+        Args:
+            nombre_modelo: Modelo a usar
+        
+        Returns:
+            Copia del backend con el modelo indicado
+        """
+        otro = copy.copy(self)
+        otro.nombre_modelo = nombre_modelo
+        return otro
+
+class BackendGemini(BackendIA):
+    """Generación con Google Gemini a través de google-generativeai"""
+    
+    nombre = "gemini"
+    
+    def __init__(self, nombre_modelo: str, api_key: str):
+        """
+        Inicializar el backend
+        
+        Args:
+            nombre_modelo: Modelo de Gemini a usar
+            api_key: Clave de Google AI Studio
+        """
+        super().__init__(nombre_modelo)
+        # Importación diferida: google-generativeai tarda más de un segundo en cargarse
+        try:
+            import google.generativeai as genai
+        except ImportError:
+            raise ImportError("google-generativeai no está instalado")
+        genai.configure(api_key=api_key)
+        self.modelo = genai.GenerativeModel(nombre_modelo)
+    
+    async def generar(self, prompt, configuracion=None, timeout=None, historial=None):
+        response = await self._enviar(prompt, configuracion, timeout, historial, stream=False)
+        return response.text
+    
+    async def generar_stream(self, prompt, configuracion=None, timeout=None, historial=None):
+        response = await self._enviar(prompt, configuracion, timeout, historial, stream=True)
+        return self._textos(response)
+    
+    async def _enviar(self, prompt, configuracion, timeout, historial, stream):
+        opciones = {"generation_config": configuracion or None, "request_options": self._opciones(timeout),
+                    "stream": stream}
+        if not historial:
+            return await self.modelo.generate_content_async(prompt, **opciones)
+        
+        # Sesión de chat nativa con el historial ya compactado por el chatbot
+        chat = self.modelo.start_chat(history=[
+            {"role": "user" if turno["rol"] == "usuario" else "model", "parts": [turno["texto"]]}
+            for turno in historial
+        ])
+        return await chat.send_message_async(prompt, **opciones)
+    
+    def con_modelo(self, nombre_modelo):
+        import google.generativeai as genai
+        otro = super().con_modelo(nombre_modelo)
+        otro.modelo = genai.GenerativeModel(nombre_modelo)
+        return otro
+    
+    def contar_tokens(self, prompt):
+        try:
+            return self.modelo.count_tokens(prompt).total_tokens
+        except Exception as e:
+            print(f"Error contando tokens con Gemini: {e}")
+            return super().contar_tokens(prompt)
+    
+    async def _textos(self, response):
+        async for fragmento in response:
+            try:
+                texto = fragmento.text
+            except ValueError:
+                # Fragmentos sin partes de texto (por ejemplo, el cierre del stream)
+                continue
+            if texto:
+                yield texto
+    
+    def _opciones(self, timeout):
+        return {"timeout": timeout} if timeout else None
+
+class BackendLocal(BackendIA):
+    """
+    Sustituto local sin red que devuelve respuestas generadas por plantilla.
+    
+    Simula la latencia hasta el primer token y el ritmo de generación del proveedor
+    para medir el costo propio del chatbot (prompts, caché, historial e interfaz).
+    """
+    
+    nombre = "local"
+    
+    def __init__(self, nombre_modelo: str = "local-simulado", latencia_primer_token: float = 0.3,
+                 tokens_por_segundo: float = 200.0, tokens_respuesta: int = 400,
+                 probabilidad_error: float = 0.0):
+        """
+        Inicializar el backend
+        
+        Args:
+            nombre_modelo: Nombre informativo del modelo simulado
+            latencia_primer_token: Segundos de espera antes del primer fragmento
+            tokens_por_segundo: Ritmo de generación simulado (0 = instantáneo)
+            tokens_respuesta: Tamaño aproximado de las respuestas generadas
+            probabilidad_error: Probabilidad de fallar con un error transitorio (para probar reintentos)
+        """
+        super().__init__(nombre_modelo)
+        self.latencia_primer_token = latencia_primer_token
+        self.tokens_por_segundo = tokens_por_segundo
+        self.tokens_respuesta = tokens_respuesta
+        self.probabilidad_error = probabilidad_error
+        self.llamadas = 0
+    
+    async def generar(self, prompt, configuracion=None, timeout=None, historial=None):
+        fragmentos = []
+        async for texto in await self.generar_stream(prompt, configuracion, timeout, historial):
+            fragmentos.append(texto)
+        return "".join(fragmentos)
+    
+    async def generar_stream(self, prompt, configuracion=None, timeout=None, historial=None):
+        self.llamadas += 1
+        await asyncio.sleep(self.latencia_primer_token)
+        if random.random() < self.probabilidad_error:
+            raise ConnectionError("Error simulado del backend local")
+        return self._fragmentos(self.generar_respuesta(prompt, configuracion))
+    
+    def generar_respuesta(self, prompt: str, configuracion: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Generar una respuesta de plantilla coherente con el tipo de solicitud
+        
+        Args:
+            prompt: Prompt completo
+            configuracion: Configuración de generación (se respetan max_output_tokens y la salida JSON)
+        
+        Returns:
+            Texto de la respuesta simulada
+        """
+        tokens_objetivo = self.tokens_respuesta
+        if configuracion and configuracion.get("max_output_tokens"):
+            tokens_objetivo = min(tokens_objetivo, configuracion["max_output_tokens"])
+        
+        solicitud = self._extraer_solicitud(prompt)
+        if configuracion and configuracion.get("response_mime_type") == "application/json":
+            return self._generar_json_casos(solicitud, tokens_objetivo)
+        if re.search(r'casos? de prueba|test cases?', solicitud, re.IGNORECASE):
+            bloques = []
+            numero = 1
+            while estimar_tokens("\n\n".join(bloques)) < tokens_objetivo:
+                bloques.append(
+                    f"**CP-{numero:03d}** - Validar escenario {numero} de: {solicitud[:60]}\n"
+                    f"**Precondiciones:** Usuario con acceso al sistema\n"
+                    f"**Pasos:**\n1. Acceder al módulo\n2. Ejecutar la acción {numero}\n3. Verificar el resultado\n"
+                    f"**Resultado esperado:** El sistema responde según lo especificado"
+                )
+                numero += 1
+            return "\n\n".join(bloques)
+        
+        parrafo = (f"Respuesta simulada del backend local para: \"{solicitud[:80]}\". "
+                   f"El prompt tenía ~{estimar_tokens(prompt)} tokens. ")
+        repeticiones = max(1, tokens_objetivo // max(1, estimar_tokens(parrafo)))
+        return "\n\n".join(parrafo for _ in range(repeticiones))
+    
+    def _generar_json_casos(self, solicitud: str, tokens_objetivo: int) -> str:
+        # Casos de prueba con la forma del esquema de casos estructurados
+        casos = []
+        while not casos or estimar_tokens(json.dumps(casos, ensure_ascii=False)) < tokens_objetivo:
+            numero = len(casos) + 1
+            casos.append({
+                "titulo": f"Validar escenario {numero} de: {solicitud[:60]}",
+                "descripcion": f"Verificar el comportamiento del escenario {numero}",
+                "modulo": "Módulo simulado",
+                "prioridad": ["Alta", "Media", "Baja"][numero % 3],
+                "resultado_esperado": "El sistema responde según lo especificado",
+                "pasos": ["Acceder al módulo", f"Ejecutar la acción {numero}", "Verificar el resultado"],
+                "horas_estimadas": 2 + numero % 5
+            })
+        return json.dumps({"proyecto": "Sistema simulado", "descripcion": f"Casos para: {solicitud[:80]}",
+                           "epica": "Validación funcional", "casos": casos}, ensure_ascii=False)
+    
+    async def _fragmentos(self, texto: str):
+        tamano = 80  # ~20 tokens por fragmento
+        for inicio in range(0, len(texto), tamano):
+            if self.tokens_por_segundo:
+                await asyncio.sleep(estimar_tokens(texto[inicio:inicio + tamano]) / self.tokens_por_segundo)
+            yield texto[inicio:inicio + tamano]
+    
+    def _extraer_solicitud(self, prompt: str) -> str:
+        # La solicitud es la última línea "Usuario: ..." o 'El usuario solicita: "..."' del prompt
+        coincidencias = re.findall(r'^(?:Usuario: |El usuario solicita: ")(.+?)"?$', prompt, re.MULTILINE)
+        if coincidencias:
+            return coincidencias[-1].strip()
+        return prompt.strip().splitlines()[-1] if prompt.strip() else ""
+
+def crear_backend(nombre: str, nombre_modelo: str, api_key: Optional[str] = None,
+                  opciones: Optional[Dict[str, Any]] = None) -> BackendIA:
+    """
+    Crear el backend indicado
+    
+    Args:
+        nombre: "gemini" o "local"
+        nombre_modelo: Modelo a usar
+        api_key: Clave del proveedor (obligatoria para Gemini)
+        opciones: Parámetros adicionales del backend local
+    
+    Returns:
+        Instancia del backend
+    
+    Raises:
+        ValueError: Si el backend no existe o falta la clave
+    """
+    nombre = (nombre or "gemini").strip().lower()
+    if nombre == BackendLocal.nombre:
+        return BackendLocal(**(opciones or {}))
+    if nombre == BackendGemini.nombre:
+        if not api_key:
+            raise ValueError("No se encontró GOOGLE_API_KEY")
+        return BackendGemini(nombre_modelo, api_key)
+    raise ValueError(f"Backend de IA desconocido: {nombre}")
@@ -0,0 +1,104 @@
+"""
+Medición del costo propio del chatbot con el backend local (sin red ni cuota)
+
+Mide por etapa: construcción del prompt, respuesta completa, primer fragmento del
+stream, guardado del historial y rendimiento con solicitudes concurrentes.
+
+Uso:
+    python benchmark_backend.py --solicitudes 50 --latencia 0 --tokens-por-segundo 0
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ['CHATBOT_BACKEND'] = 'local'
+
+from backends_ia import BackendLocal
+from cache_respuestas import CacheRespuestas
+from Chatbot import ChatBot
+from indice_bm25 import IndiceBM25
+from metricas import percentil
+
+MENSAJES_EJEMPLO = [
+    "Genera casos de prueba para el login con usuario y contraseña",
+    "Explica la diferencia entre pruebas de regresión y pruebas de humo",
+    "Actúa como QA senior y revisa la estrategia de pruebas del módulo de pagos",
+    "Crea casos de prueba para el endpoint REST de creación de usuarios",
+    "¿Qué métricas de calidad recomiendas para un equipo ágil?"
+]
+
+def crear_chatbot(latencia: float, tokens_por_segundo: float, directorio: str) -> ChatBot:
+    """
+    Crear un chatbot con backend local y todo lo que escribe en disco (caché, historial, índice
+    del historial y registro de latencias) en un directorio temporal, para que las respuestas
+    simuladas no lleguen a los datos reales
+    """
+    chatbot = ChatBot("Benchmark")
+    chatbot.backend_ia = BackendLocal(latencia_primer_token=latencia, tokens_por_segundo=tokens_por_segundo)
+    chatbot.usar_cache = False
+    chatbot.cache_respuestas = CacheRespuestas(os.path.join(directorio, 'cache'))
+    chatbot.directorio_historial = os.path.join(directorio, 'historial')
+    chatbot.crear_directorio_historial()
+    chatbot.indice_historial = IndiceBM25(os.path.join(directorio, 'bm25', 'indice.json'))
+    chatbot.enrutador_modelos.archivo_registro = os.path.join(directorio, 'enrutador', 'latencias.jsonl')
+    return chatbot
+
+def medir(funcion, repeticiones: int):
+    """Ejecutar una función varias veces y devolver las duraciones en milisegundos"""
+    duraciones = []
+    for i in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(i)
+        duraciones.append((time.perf_counter() - inicio) * 1000)
+    return duraciones
+
+def imprimir_etapa(nombre: str, duraciones):
+    print(f"{nombre:<32} p50={percentil(duraciones, 50):9.2f} ms  p90={percentil(duraciones, 90):9.2f} ms  "
+          f"p99={percentil(duraciones, 99):9.2f} ms")
+
+def main():
+    """Función principal del benchmark"""
+    parser = argparse.ArgumentParser(description="Mide el costo propio del chatbot con el backend local")
+    parser.add_argument("--solicitudes", type=int, default=30, help="Solicitudes por etapa")
+    parser.add_argument("--latencia", type=float, default=0.0, help="Segundos hasta el primer token simulado")
+    parser.add_argument("--tokens-por-segundo", type=float, default=0.0, help="Ritmo simulado (0 = instantáneo)")
+    parser.add_argument("--concurrencia", type=int, default=8, help="Solicitudes simultáneas en la etapa asíncrona")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as directorio:
+        chatbot = crear_chatbot(args.latencia, args.tokens_por_segundo, directorio)
+        
+        def mensaje(i):
+            return f"{MENSAJES_EJEMPLO[i % len(MENSAJES_EJEMPLO)]} (variante {i})"
+        
+        print(f"Backend local: latencia={args.latencia}s, tokens/s={args.tokens_por_segundo or 'instantáneo'}")
+        print("-" * 90)
+        imprimir_etapa("Construcción del prompt", medir(lambda i: chatbot.construir_prompt(mensaje(i)), args.solicitudes))
+        imprimir_etapa("Respuesta completa", medir(lambda i: chatbot.procesar_mensaje(mensaje(i)), args.solicitudes))
+        
+        def primer_fragmento(i):
+            stream = chatbot.procesar_mensaje_stream(mensaje(i))
+            next(stream)
+            stream.close()
+        
+        imprimir_etapa("Primer fragmento (stream)", medir(primer_fragmento, args.solicitudes))
+        imprimir_etapa("Guardado del historial", medir(lambda i: chatbot.guardar_sesion_completa(), args.solicitudes))
+        
+        async def concurrentes():
+            return await asyncio.gather(*(chatbot.procesar_mensaje_async(mensaje(i))
+                                          for i in range(args.solicitudes)))
+        
+        chatbot.max_solicitudes_concurrentes = args.concurrencia
+        inicio = time.perf_counter()
+        asyncio.run(concurrentes())
+        segundos = time.perf_counter() - inicio
+        print(f"{'Asíncrono (concurrencia ' + str(args.concurrencia) + ')':<32} "
+              f"{args.solicitudes / segundos:9.1f} solicitudes/s")
+        
+        # El resumen de la conversación se actualiza en segundo plano y escribe en la caché temporal
+        chatbot.resumidor_conversacion.esperar()
+
+if __name__ == "__main__":
+    main()
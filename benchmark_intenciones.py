@@ -0,0 +1,102 @@
+"""
+Micro-benchmark de la detección de intenciones: búsquedas repetidas por palabra clave
+sobre el mensaje completo (implementación anterior) frente al detector compilado de una
+sola pasada sobre la pregunta
+
+Uso:
+    python benchmark_intenciones.py --tamano-adjunto 2000000 --repeticiones 20
+"""
+import argparse
+import re
+import time
+
+from detector_intenciones import (CONTEXTOS_QA, PALABRAS_CASOS_PRUEBA, PALABRAS_MANUAL_USUARIO,
+                                  PALABRAS_QA_GENERAL, PREGUNTAS_SIMPLES, ROLES, DetectorIntenciones)
+from metricas import percentil
+from normalizacion import normalizar_texto
+
+SEPARADOR = "--- ARCHIVOS ADJUNTOS ---"
+
+def detectar_legado(mensaje: str) -> dict:
+    """Implementación anterior: cada comprobación pasa a minúsculas y recorre el mensaje completo"""
+    pregunta = mensaje.split(SEPARADOR, 1)[0]
+    
+    def rol():
+        mensaje_lower = mensaje.lower()
+        for nombre, patrones in ROLES.items():
+            for patron in patrones:
+                if patron in mensaje_lower:
+                    return nombre
+        return None
+    
+    def contexto_qa():
+        mensaje_lower = mensaje.lower()
+        for contexto, patrones in CONTEXTOS_QA.items():
+            for patron in patrones:
+                if patron in mensaje_lower:
+                    return contexto
+        if any(palabra in mensaje_lower for palabra in PALABRAS_QA_GENERAL):
+            return "qa_manual"
+        return None
+    
+    def respuesta_local():
+        mensaje_limpio = mensaje.lower().strip()
+        patrones_locales = [
+            r'\b(hola|hi|buenos dias|buenas tardes|buenas noches|saludos)\b',
+            r'\b(adios|chao|hasta luego|nos vemos|bye)\b',
+            r'\b(gracias|muchas gracias|te agradezco)\b',
+            r'\b(quien eres|como te llamas|tu nombre)\b'
+        ]
+        return any(re.search(patron, mensaje_limpio) for patron in patrones_locales)
+    
+    return {
+        "rol": rol(),
+        "contexto_qa": contexto_qa(),
+        "casos_prueba": any(palabra in pregunta.lower() for palabra in PALABRAS_CASOS_PRUEBA),
+        "manual_usuario": any(palabra in pregunta.lower() for palabra in PALABRAS_MANUAL_USUARIO),
+        "pregunta_simple": any(palabra in mensaje.lower() for palabra in PREGUNTAS_SIMPLES),
+        "respuesta_local": respuesta_local()
+    }
+
+def detectar_compilado(detector: DetectorIntenciones, mensaje: str) -> dict:
+    """Implementación actual: normalización y una pasada del patrón compilado, solo sobre la pregunta"""
+    indice = mensaje.find(SEPARADOR)
+    return detector.detectar(normalizar_texto(mensaje if indice < 0 else mensaje[:indice]))
+
+def medir(funcion, mensaje: str, repeticiones: int):
+    duraciones = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(mensaje)
+        duraciones.append((time.perf_counter() - inicio) * 1000)
+    return duraciones
+
+def main():
+    """Función principal del benchmark"""
+    parser = argparse.ArgumentParser(description="Compara la detección de intenciones anterior y la compilada")
+    parser.add_argument("--tamano-adjunto", type=int, default=2_000_000, help="Caracteres del adjunto simulado")
+    parser.add_argument("--repeticiones", type=int, default=20, help="Repeticiones por caso")
+    args = parser.parse_args()
+    
+    inicio = time.perf_counter()
+    detector = DetectorIntenciones()
+    print(f"Compilación del detector: {(time.perf_counter() - inicio) * 1000:.2f} ms")
+    
+    pregunta = "Actúa como QA senior y genera casos de prueba de performance testing para el endpoint de pagos"
+    parrafo = "El sistema debe permitir registrar pagos y consultar su estado desde la aplicación. "
+    adjunto = (parrafo * (args.tamano_adjunto // len(parrafo) + 1))[:args.tamano_adjunto]
+    casos = {
+        "Solo pregunta": pregunta,
+        f"Pregunta + adjunto de {args.tamano_adjunto:,} car.": f"{pregunta}\n\n{SEPARADOR}\n\n{adjunto}"
+    }
+    
+    print("-" * 90)
+    for nombre, mensaje in casos.items():
+        legado = medir(detectar_legado, mensaje, args.repeticiones)
+        compilado = medir(lambda m: detectar_compilado(detector, m), mensaje, args.repeticiones)
+        mediana_legado, mediana_compilado = percentil(legado, 50), percentil(compilado, 50)
+        print(f"{nombre:<40} anterior p50={mediana_legado:10.3f} ms  compilado p50={mediana_compilado:8.3f} ms  "
+              f"x{mediana_legado / max(mediana_compilado, 1e-6):,.0f}")
+
+if __name__ == "__main__":
+    main()
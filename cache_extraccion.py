@@ -0,0 +1,215 @@
+"""
+Caché en disco del texto extraído de archivos adjuntos, direccionada por contenido
+
+La clave es el SHA-256 de los bytes del archivo (calculado por bloques) más el tipo de
+archivo y la versión del extractor, así que un acierto solo cuesta leer el archivo una
+vez para calcular el hash, sin volver a analizar el PDF o el DOCX.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+class CacheExtraccion:
+    """Caché LRU en disco de documentos extraídos con un límite de tamaño total"""
+    
+    def __init__(self, directorio: str, max_bytes_disco: int = 200 * 1024 * 1024,
+                 tamano_bloque: int = 1024 * 1024):
+        """
+        Inicializar la caché de extracción
+        
+        Args:
+            directorio: Carpeta donde se guarda un JSON por documento
+            max_bytes_disco: Tamaño máximo total de las entradas en disco
+            tamano_bloque: Bytes leídos por iteración al calcular el hash
+        """
+        self.directorio = directorio
+        self.max_bytes_disco = max_bytes_disco
+        self.tamano_bloque = tamano_bloque
+        
+        self._lock = threading.Lock()
+        
+        self.aciertos = 0
+        self.fallos = 0
+        self.segundos_ahorrados = 0.0
+        
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+        except Exception as e:
+            print(f"Error creando directorio de caché de extracción: {e}")
+        
+        # Bytes en disco: se miden una vez al arrancar y se actualizan con cada escritura y
+        # borrado, de modo que el directorio solo se recorre cuando se supera el límite
+        self._bytes_disco = self._medir_disco()
+    
+    def huella_archivo(self, ruta_archivo: str) -> str:
+        """
+        SHA-256 de los bytes del archivo, leído por bloques para no cargarlo entero en memoria
+        
+        Args:
+            ruta_archivo: Ruta del archivo
+        
+        Returns:
+            Hash en hexadecimal
+        """
+        resumen = hashlib.sha256()
+        with open(ruta_archivo, 'rb') as f:
+            while True:
+                bloque = f.read(self.tamano_bloque)
+                if not bloque:
+                    break
+                resumen.update(bloque)
+        return resumen.hexdigest()
+    
+    def generar_clave(self, ruta_archivo: str, version_extractor: str) -> str:
+        """
+        Clave de un archivo: contenido, tipo (la extensión elige el extractor) y versión del extractor
+        
+        Args:
+            ruta_archivo: Ruta del archivo
+            version_extractor: Versión de la lógica de extracción
+        
+        Returns:
+            Clave usada como nombre de archivo de la entrada
+        """
+        extension = os.path.splitext(ruta_archivo)[1].lower().lstrip('.') or "sin_extension"
+        return f"{self.huella_archivo(ruta_archivo)}-{extension}-v{version_extractor}"
+    
+    def obtener(self, clave: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtener un documento extraído
+        
+        Args:
+            clave: Clave generada con generar_clave
+        
+        Returns:
+            Diccionario con "texto", "paginas" (desplazamiento de cada página en el texto)
+            y "total_paginas", o None si no está en caché
+        """
+        with self._lock:
+            try:
+                with open(self._ruta(clave), 'r', encoding='utf-8') as f:
+                    entrada = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self.fallos += 1
+                return None
+            
+            self._tocar_archivo(clave)
+            self.aciertos += 1
+            self.segundos_ahorrados += entrada.get("duracion", 0.0)
+            return entrada["documento"]
+    
+    def guardar(self, clave: str, documento: Dict[str, Any], duracion: float = 0.0):
+        """
+        Guardar un documento extraído
+        
+        Args:
+            clave: Clave generada con generar_clave
+            documento: Diccionario con "texto", "paginas" y "total_paginas"
+            duracion: Segundos que tardó la extracción original
+        """
+        entrada = {
+            "documento": documento,
+            "creado": time.time(),
+            "duracion": duracion
+        }
+        
+        with self._lock:
+            try:
+                # Se escribe en un temporal para que una lectura simultánea no vea un JSON a medias
+                temporal = f"{self._ruta(clave)}.tmp"
+                with open(temporal, 'w', encoding='utf-8') as f:
+                    json.dump(entrada, f, ensure_ascii=False)
+                anterior = self._tamano_archivo(self._ruta(clave))
+                nuevo = self._tamano_archivo(temporal)
+                os.replace(temporal, self._ruta(clave))
+                self._bytes_disco += nuevo - anterior
+                if self._bytes_disco > self.max_bytes_disco:
+                    self._recortar_disco()
+            except Exception as e:
+                print(f"Error guardando extracción en caché: {e}")
+    
+    def limpiar(self):
+        """Eliminar todas las entradas de la caché"""
+        with self._lock:
+            for archivo in self._archivos_en_disco():
+                try:
+                    os.remove(archivo.path)
+                except OSError:
+                    pass
+            self._bytes_disco = self._medir_disco()
+    
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        """
+        Obtener los contadores de uso de la caché
+        
+        Returns:
+            Diccionario con aciertos, fallos, tasa de aciertos, segundos de extracción
+            ahorrados, entradas y bytes en disco
+        """
+        archivos = self._archivos_en_disco()
+        total = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": self.aciertos / total if total else 0.0,
+            "segundos_ahorrados": round(self.segundos_ahorrados, 2),
+            "entradas_disco": len(archivos),
+            "bytes_disco": sum(archivo.stat().st_size for archivo in archivos)
+        }
+    
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, f"{clave}.json")
+    
+    def _tocar_archivo(self, clave: str):
+        """Actualizar la fecha de modificación para el orden LRU en disco"""
+        try:
+            os.utime(self._ruta(clave), None)
+        except OSError:
+            pass
+    
+    def _archivos_en_disco(self):
+        try:
+            return [a for a in os.scandir(self.directorio) if a.name.endswith('.json') and a.is_file()]
+        except OSError:
+            return []
+    
+    def _tamano_archivo(self, ruta: str) -> int:
+        try:
+            return os.stat(ruta).st_size
+        except OSError:
+            return 0
+    
+    def _estados_en_disco(self):
+        """(fecha de modificación, tamaño, ruta) de cada entrada en disco"""
+        estados = []
+        for archivo in self._archivos_en_disco():
+            try:
+                estado = archivo.stat()
+            except OSError:
+                continue
+            estados.append((estado.st_mtime, estado.st_size, archivo.path))
+        return estados
+    
+    def _medir_disco(self) -> int:
+        return sum(tamano for _, tamano, _ in self._estados_en_disco())
+    
+    def _recortar_disco(self):
+        """Eliminar las entradas menos usadas hasta respetar el tamaño máximo"""
+        archivos = self._estados_en_disco()
+        total = sum(tamano for _, tamano, _ in archivos)
+        # Se deja un margen bajo el límite para que las escrituras siguientes no vuelvan a recorrer el directorio
+        objetivo = int(self.max_bytes_disco * 0.9)
+        
+        for _, tamano, ruta in sorted(archivos):
+            if total <= objetivo:
+                break
+            try:
+                os.remove(ruta)
+                total -= tamano
+            except OSError:
+                pass
+        # El recorrido también corrige las diferencias con lo escrito por otros procesos
+        self._bytes_disco = total
@@ -0,0 +1,241 @@
+"""
+Caché persistente de respuestas de la IA (prompt → respuesta)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+class CacheRespuestas:
+    """Caché LRU con expiración (TTL) en memoria y respaldo en disco"""
+    
+    def __init__(self, directorio: str, max_entradas: int = 200,
+                 max_bytes_disco: int = 50 * 1024 * 1024, ttl_segundos: int = 7 * 24 * 3600):
+        """
+        Inicializar la caché de respuestas
+        
+        Args:
+            directorio: Carpeta donde se guardan las entradas en disco
+            max_entradas: Número máximo de respuestas mantenidas en memoria
+            max_bytes_disco: Tamaño máximo total de las entradas en disco
+            ttl_segundos: Tiempo de vida de cada entrada
+        """
+        self.directorio = directorio
+        self.max_entradas = max_entradas
+        self.max_bytes_disco = max_bytes_disco
+        self.ttl_segundos = ttl_segundos
+        
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        
+        # Contadores para medir cuánta latencia y cuota ahorra la caché
+        self.aciertos = 0
+        self.fallos = 0
+        self.segundos_ahorrados = 0.0
+        self.tokens_ahorrados = 0
+        
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+        except Exception as e:
+            print(f"Error creando directorio de caché: {e}")
+        
+        # Bytes en disco: se miden una vez al arrancar y se actualizan con cada escritura y
+        # borrado, de modo que el directorio solo se recorre cuando se supera el límite
+        self._bytes_disco = self._medir_disco()
+    
+    @staticmethod
+    def generar_clave(prompt: str, modelo: str, configuracion: Optional[Dict[str, Any]] = None,
+                      huella_historial: str = "") -> str:
+        """
+        Generar la clave de una solicitud
+        
+        Args:
+            prompt: Prompt completo enviado al modelo
+            modelo: Nombre del modelo
+            configuracion: Configuración de generación usada
+            huella_historial: Huella del historial multi-turno enviado junto al prompt
+        
+        Returns:
+            Hash SHA-256 en hexadecimal
+        """
+        datos = {
+            "prompt": prompt,
+            "modelo": modelo,
+            "configuracion": configuracion or {}
+        }
+        if huella_historial:
+            datos["historial"] = huella_historial
+        contenido = json.dumps(datos, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+    
+    def obtener(self, clave: str) -> Optional[str]:
+        """
+        Obtener una respuesta guardada
+        
+        Args:
+            clave: Clave generada con generar_clave
+        
+        Returns:
+            La respuesta guardada o None si no existe o expiró
+        """
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is None:
+                entrada = self._leer_de_disco(clave)
+                if entrada is not None:
+                    self._guardar_en_memoria(clave, entrada)
+            
+            if entrada is not None and self._expirada(entrada):
+                self._eliminar(clave)
+                entrada = None
+            
+            if entrada is None:
+                self.fallos += 1
+                return None
+            
+            self._memoria.move_to_end(clave)
+            self._tocar_archivo(clave)
+            self.aciertos += 1
+            self.segundos_ahorrados += entrada.get("duracion", 0.0)
+            self.tokens_ahorrados += entrada.get("tokens", 0)
+            return entrada["respuesta"]
+    
+    def guardar(self, clave: str, respuesta: str, duracion: float = 0.0, tokens: int = 0):
+        """
+        Guardar una respuesta en memoria y en disco
+        
+        Args:
+            clave: Clave generada con generar_clave
+            respuesta: Texto de la respuesta del modelo
+            duracion: Segundos que tardó la generación original
+            tokens: Tokens estimados de la solicitud y la respuesta
+        """
+        entrada = {
+            "respuesta": respuesta,
+            "creado": time.time(),
+            "duracion": duracion,
+            "tokens": tokens
+        }
+        
+        with self._lock:
+            self._guardar_en_memoria(clave, entrada)
+            try:
+                anterior = self._tamano_archivo(self._ruta(clave))
+                with open(self._ruta(clave), 'w', encoding='utf-8') as f:
+                    json.dump(entrada, f, ensure_ascii=False)
+                self._bytes_disco += self._tamano_archivo(self._ruta(clave)) - anterior
+                if self._bytes_disco > self.max_bytes_disco:
+                    self._recortar_disco()
+            except Exception as e:
+                print(f"Error guardando respuesta en caché: {e}")
+    
+    def limpiar(self):
+        """Eliminar todas las entradas de la caché"""
+        with self._lock:
+            self._memoria.clear()
+            for archivo in self._archivos_en_disco():
+                try:
+                    os.remove(archivo.path)
+                except OSError:
+                    pass
+            self._bytes_disco = self._medir_disco()
+    
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        """
+        Obtener los contadores de uso de la caché
+        
+        Returns:
+            Diccionario con aciertos, fallos, tasa de aciertos y ahorro estimado
+        """
+        total = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": self.aciertos / total if total else 0.0,
+            "segundos_ahorrados": round(self.segundos_ahorrados, 2),
+            "tokens_ahorrados": self.tokens_ahorrados,
+            "entradas_memoria": len(self._memoria)
+        }
+    
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, f"{clave}.json")
+    
+    def _expirada(self, entrada: Dict[str, Any]) -> bool:
+        return time.time() - entrada.get("creado", 0) > self.ttl_segundos
+    
+    def _guardar_en_memoria(self, clave: str, entrada: Dict[str, Any]):
+        self._memoria[clave] = entrada
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_entradas:
+            self._memoria.popitem(last=False)
+    
+    def _leer_de_disco(self, clave: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._ruta(clave), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+    
+    def _eliminar(self, clave: str):
+        self._memoria.pop(clave, None)
+        tamano = self._tamano_archivo(self._ruta(clave))
+        try:
+            os.remove(self._ruta(clave))
+            self._bytes_disco -= tamano
+        except OSError:
+            pass
+    
+    def _tocar_archivo(self, clave: str):
+        """Actualizar la fecha de modificación para el orden LRU en disco"""
+        try:
+            os.utime(self._ruta(clave), None)
+        except OSError:
+            pass
+    
+    def _archivos_en_disco(self):
+        try:
+            return [a for a in os.scandir(self.directorio) if a.name.endswith('.json') and a.is_file()]
+        except OSError:
+            return []
+    
+    def _tamano_archivo(self, ruta: str) -> int:
+        try:
+            return os.stat(ruta).st_size
+        except OSError:
+            return 0
+    
+    def _estados_en_disco(self):
+        """(fecha de modificación, tamaño, ruta) de cada entrada en disco"""
+        estados = []
+        for archivo in self._archivos_en_disco():
+            try:
+                estado = archivo.stat()
+            except OSError:
+                continue
+            estados.append((estado.st_mtime, estado.st_size, archivo.path))
+        return estados
+    
+    def _medir_disco(self) -> int:
+        return sum(tamano for _, tamano, _ in self._estados_en_disco())
+    
+    def _recortar_disco(self):
+        """Eliminar las entradas menos usadas hasta respetar el tamaño máximo"""
+        archivos = self._estados_en_disco()
+        total = sum(tamano for _, tamano, _ in archivos)
+        # Se deja un margen bajo el límite para que las escrituras siguientes no vuelvan a recorrer el directorio
+        objetivo = int(self.max_bytes_disco * 0.9)
+        
+        for _, tamano, ruta in sorted(archivos):
+            if total <= objetivo:
+                break
+            try:
+                os.remove(ruta)
+                total -= tamano
+                self._memoria.pop(os.path.basename(ruta)[:-len('.json')], None)
+            except OSError:
+                pass
+        # El recorrido también corrige las diferencias con lo escrito por otros procesos
+        self._bytes_disco = total
@@ -0,0 +1,209 @@
+"""
+Caché semántica de respuestas para preguntas casi duplicadas
+"""
+import importlib.util
+import threading
+import zlib
+from typing import Any, Dict, List, Optional
+
+from normalizacion import SolicitudChat, normalizar_texto
+
+# numpy se importa al vectorizar la primera solicitud para no retrasar el arranque
+NUMPY_DISPONIBLE = importlib.util.find_spec("numpy") is not None
+np = None
+
+# Palabras sin valor para comparar solicitudes
+PALABRAS_VACIAS = {
+    "a", "al", "con", "de", "del", "el", "en", "la", "las", "lo", "los", "me", "mi",
+    "para", "por", "que", "se", "un", "una", "unos", "unas", "y", "o", "sobre", "su",
+    "sus", "te", "tu", "favor", "porfa", "porfavor", "puedes", "podrias", "quiero",
+    "necesito", "dame", "hazme"
+}
+
+# Verbos que piden lo mismo con distintas palabras
+SINONIMOS = {
+    "genera": "generar", "generame": "generar", "crea": "generar", "crear": "generar",
+    "creame": "generar", "haz": "generar", "hacer": "generar", "elabora": "generar",
+    "elaborar": "generar", "escribe": "generar", "escribir": "generar", "redacta": "generar",
+    "redactar": "generar", "arma": "generar", "armar": "generar", "disena": "generar",
+    "disenar": "generar", "caso": "casos", "pruebas": "prueba", "test": "prueba",
+    "tests": "prueba", "explica": "explicar", "explicame": "explicar", "describe": "explicar",
+    "resume": "resumir", "resumen": "resumir"
+}
+
+def normalizar_mensaje(mensaje: str) -> List[str]:
+    """
+    Normalizar un mensaje a una lista de términos comparables
+    
+    Args:
+        mensaje: Texto original del usuario (si es una SolicitudChat se reutiliza su texto normalizado)
+    
+    Returns:
+        Lista de términos sin acentos, palabras vacías ni variantes de verbos
+    """
+    texto = mensaje.texto_normalizado if isinstance(mensaje, SolicitudChat) else normalizar_texto(mensaje)
+    terminos = []
+    for palabra in texto.split():
+        if palabra in PALABRAS_VACIAS:
+            continue
+        terminos.append(SINONIMOS.get(palabra, palabra))
+    return terminos
+
+class CacheSemantica:
+    """Caché de respuestas por similitud usando TF-IDF con hashing"""
+    
+    def __init__(self, umbral_similitud: float = 0.9, dimensiones: int = 4096,
+                 max_entradas: int = 500, min_terminos: int = 2):
+        """
+        Inicializar la caché semántica
+        
+        Args:
+            umbral_similitud: Similitud coseno mínima para reutilizar una respuesta
+            dimensiones: Tamaño del espacio de hashing de términos
+            max_entradas: Número máximo de solicitudes recordadas
+            min_terminos: Términos mínimos para que una solicitud se compare
+        """
+        self.umbral_similitud = umbral_similitud
+        self.dimensiones = dimensiones
+        self.max_entradas = max_entradas
+        self.min_terminos = min_terminos
+        self.disponible = NUMPY_DISPONIBLE
+        
+        self._lock = threading.Lock()
+        
+        # Buffer circular: la fila i de la matriz corresponde a la entrada i
+        self._entradas = [None] * max_entradas  # (rol, contexto, respuesta)
+        self._siguiente = 0
+        self._matriz_tf = None
+        self._frecuencia_documentos = None
+        
+        self.aciertos = 0
+        self.fallos = 0
+    
+    def vectorizar(self, mensaje: str) -> Optional["np.ndarray"]:
+        """
+        Convertir un mensaje en su vector TF (unigramas y bigramas con hashing)
+        
+        Args:
+            mensaje: Texto original del usuario
+        
+        Returns:
+            Vector TF o None si el mensaje tiene muy pocos términos
+        """
+        terminos = normalizar_mensaje(mensaje)
+        if len(terminos) < self.min_terminos:
+            return None
+        
+        _importar_numpy()
+        caracteristicas = terminos + [f"{a} {b}" for a, b in zip(terminos, terminos[1:])]
+        vector = np.zeros(self.dimensiones, dtype=np.float32)
+        for caracteristica in caracteristicas:
+            vector[zlib.crc32(caracteristica.encode('utf-8')) % self.dimensiones] += 1.0
+        
+        # TF sublineal para que las repeticiones no dominen la similitud
+        no_nulos = vector > 0
+        vector[no_nulos] = 1.0 + np.log(vector[no_nulos])
+        return vector
+    
+    def buscar(self, mensaje: str, rol: Optional[str], contexto: Optional[str]) -> Optional[str]:
+        """
+        Buscar una respuesta previa para una solicitud equivalente
+        
+        Args:
+            mensaje: Texto original del usuario
+            rol: Rol detectado en el mensaje
+            contexto: Contexto QA detectado en el mensaje
+        
+        Returns:
+            La respuesta guardada más parecida o None si ninguna supera el umbral
+        """
+        if not self.disponible:
+            return None
+        
+        vector = self.vectorizar(mensaje)
+        with self._lock:
+            if vector is None or self._matriz_tf is None:
+                self.fallos += 1
+                return None
+            
+            # Solo se comparan solicitudes con el mismo rol y contexto QA
+            candidatos = [i for i, entrada in enumerate(self._entradas)
+                          if entrada is not None and entrada[0] == rol and entrada[1] == contexto]
+            if not candidatos:
+                self.fallos += 1
+                return None
+            
+            idf = self._calcular_idf()
+            consulta = vector * idf
+            matriz = self._matriz_tf[candidatos] * idf
+            
+            normas = np.linalg.norm(matriz, axis=1) * np.linalg.norm(consulta)
+            normas[normas == 0] = 1.0
+            similitudes = (matriz @ consulta) / normas
+            
+            mejor = int(np.argmax(similitudes))
+            if similitudes[mejor] < self.umbral_similitud:
+                self.fallos += 1
+                return None
+            
+            self.aciertos += 1
+            return self._entradas[candidatos[mejor]][2]
+    
+    def agregar(self, mensaje: str, rol: Optional[str], contexto: Optional[str], respuesta: str):
+        """
+        Recordar la respuesta dada a una solicitud
+        
+        Args:
+            mensaje: Texto original del usuario
+            rol: Rol detectado en el mensaje
+            contexto: Contexto QA detectado en el mensaje
+            respuesta: Respuesta generada por la IA
+        """
+        if not self.disponible:
+            return
+        
+        vector = self.vectorizar(mensaje)
+        if vector is None:
+            return
+        
+        with self._lock:
+            if self._matriz_tf is None:
+                self._matriz_tf = np.zeros((self.max_entradas, self.dimensiones), dtype=np.float32)
+                self._frecuencia_documentos = np.zeros(self.dimensiones, dtype=np.float32)
+            
+            posicion = self._siguiente
+            if self._entradas[posicion] is not None:
+                # Se reemplaza la solicitud más antigua
+                self._frecuencia_documentos -= (self._matriz_tf[posicion] > 0)
+            
+            self._matriz_tf[posicion] = vector
+            self._frecuencia_documentos += (vector > 0)
+            self._entradas[posicion] = (rol, contexto, respuesta)
+            self._siguiente = (posicion + 1) % self.max_entradas
+    
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        """
+        Obtener los contadores de uso de la caché semántica
+        
+        Returns:
+            Diccionario con aciertos, fallos y número de entradas
+        """
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "entradas": self._total_entradas(),
+            "umbral_similitud": self.umbral_similitud
+        }
+    
+    def _total_entradas(self) -> int:
+        return sum(1 for entrada in self._entradas if entrada is not None)
+    
+    def _calcular_idf(self) -> "np.ndarray":
+        total = self._total_entradas()
+        return np.log((1.0 + total) / (1.0 + self._frecuencia_documentos)) + 1.0
+
+def _importar_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
@@ -0,0 +1,185 @@
+"""
+Casos de prueba en JSON con esquema: el modelo devuelve solo los datos y las vistas
+(formato CP- y JSON de proyecto) se generan localmente
+"""
+import json
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+FECHA_INICIO_PROYECTO = "2025-08-04"
+HORAS_POR_PRIORIDAD = {"alta": 6, "media": 4, "baja": 2}
+MESES = ["enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto",
+         "septiembre", "octubre", "noviembre", "diciembre"]
+
+ESQUEMA_CASOS_PRUEBA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "proyecto": {"type": "string", "description": "Nombre del proyecto o módulo probado"},
+        "descripcion": {"type": "string", "description": "Descripción general de lo que se prueba"},
+        "epica": {"type": "string", "description": "Título que agrupa los casos de prueba"},
+        "casos": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "titulo": {"type": "string"},
+                    "descripcion": {"type": "string"},
+                    "modulo": {"type": "string"},
+                    "prioridad": {"type": "string", "enum": ["Alta", "Media", "Baja"]},
+                    "resultado_esperado": {"type": "string"},
+                    "pasos": {"type": "array", "items": {"type": "string"}},
+                    "horas_estimadas": {"type": "integer"}
+                },
+                "required": ["titulo", "descripcion", "modulo", "prioridad", "resultado_esperado",
+                             "pasos", "horas_estimadas"]
+            }
+        }
+    },
+    "required": ["proyecto", "descripcion", "epica", "casos"]
+}
+
+CONFIGURACION_JSON = {"response_mime_type": "application/json", "response_schema": ESQUEMA_CASOS_PRUEBA}
+
+INSTRUCCION_CASOS_ESTRUCTURADOS = """INSTRUCCIÓN ESPECIAL PARA CASOS DE PRUEBA: Responde únicamente con el JSON del esquema indicado.
+- "titulo": título corto y claro del caso
+- "descripcion": qué se va a validar, con detalle
+- "modulo": módulo o sistema al que pertenece
+- "prioridad": Alta, Media o Baja
+- "resultado_esperado": comportamiento esperado del sistema
+- "pasos": un paso por elemento, sin numerar
+- "horas_estimadas": estimación realista (típicamente entre 2 y 8 horas)"""
+
+def interpretar_casos(texto: str) -> Dict[str, Any]:
+    """
+    Leer y validar la respuesta JSON del modelo
+    
+    Args:
+        texto: Respuesta del modelo
+    
+    Returns:
+        Datos normalizados: proyecto, descripcion, epica y la lista de casos
+    
+    Raises:
+        ValueError: Si el texto no es JSON o no tiene casos de prueba
+    """
+    texto = texto.strip()
+    # Algunos modelos envuelven el JSON en un bloque de código aunque se pida JSON puro
+    if texto.startswith("```"):
+        texto = texto.strip("`").removeprefix("json").strip()
+    datos = json.loads(texto)
+    if not isinstance(datos, dict) or not isinstance(datos.get("casos"), list) or not datos["casos"]:
+        raise ValueError("la respuesta no contiene una lista de casos de prueba")
+    
+    casos = []
+    for caso in datos["casos"]:
+        if not isinstance(caso, dict) or not caso.get("titulo"):
+            continue
+        prioridad = str(caso.get("prioridad") or "Media").capitalize()
+        pasos = caso.get("pasos") or []
+        if isinstance(pasos, str):
+            pasos = [paso for paso in pasos.splitlines() if paso.strip()]
+        try:
+            horas = int(caso.get("horas_estimadas"))
+        except (TypeError, ValueError):
+            horas = HORAS_POR_PRIORIDAD.get(prioridad.lower(), 4)
+        casos.append({
+            "titulo": str(caso["titulo"]).strip(),
+            "descripcion": str(caso.get("descripcion") or caso["titulo"]).strip(),
+            "modulo": str(caso.get("modulo") or datos.get("proyecto") or "").strip(),
+            "prioridad": prioridad,
+            "resultado_esperado": str(caso.get("resultado_esperado") or "").strip(),
+            "pasos": [str(paso).strip() for paso in pasos],
+            "horas_estimadas": max(1, horas)
+        })
+    if not casos:
+        raise ValueError("ningún caso de prueba tiene título")
+    
+    return {
+        "proyecto": str(datos.get("proyecto") or "Sistema de Testing").strip(),
+        "descripcion": str(datos.get("descripcion") or "").strip(),
+        "epica": str(datos.get("epica") or "Validación Funcional Completa").strip(),
+        "casos": casos
+    }
+
+def fecha_en_texto(fecha: datetime) -> str:
+    """Fecha en el formato de la plantilla, por ejemplo "8 de agosto de 2025" """
+    return f"{fecha.day} de {MESES[fecha.month - 1]} de {fecha.year}"
+
+def renderizar_casos_cp(datos: Dict[str, Any], fecha_creacion: datetime) -> str:
+    """
+    Vista legible de los casos en el formato estándar CP-
+    
+    Args:
+        datos: Datos devueltos por interpretar_casos
+        fecha_creacion: Fecha que se muestra como fecha de creación
+    
+    Returns:
+        Texto con un bloque por caso de prueba
+    """
+    bloques = []
+    for numero, caso in enumerate(datos["casos"], start=1):
+        pasos = "\n".join(f"{indice}. {paso}" for indice, paso in enumerate(caso["pasos"], start=1))
+        bloques.append(
+            f"CP-{numero}: {caso['titulo']}\n"
+            f"Descripción: {caso['descripcion']}\n"
+            f"Fecha de creación: {fecha_en_texto(fecha_creacion)}\n"
+            f"Nº ID: {numero}\n"
+            f"Módulo: {caso['modulo']}\n"
+            f"Prioridad: {caso['prioridad']}\n"
+            f"Status: Por hacer\n"
+            f"Resultado esperado: {caso['resultado_esperado']}\n"
+            f"Paso a paso de la prueba:\n{pasos}"
+        )
+    return "\n\n".join(bloques)
+
+def convertir_a_proyecto(datos: Dict[str, Any], calcular_fechas: Callable[[str, int], Tuple[str, str]],
+                         fecha_inicio: str = FECHA_INICIO_PROYECTO) -> Dict[str, Any]:
+    """
+    Casos de prueba como tareas de proyecto (formato JSON de la plantilla)
+    
+    Las tareas se planifican una tras otra en días hábiles a partir de la fecha de inicio.
+    
+    Args:
+        datos: Datos devueltos por interpretar_casos
+        calcular_fechas: Función (fecha_inicio, horas) → (inicio, fin) en formato YYYY-MM-DD
+        fecha_inicio: Fecha de inicio del proyecto
+    
+    Returns:
+        Diccionario con la estructura proyectos → épicas → tareas
+    """
+    tareas: List[Dict[str, Any]] = []
+    siguiente_inicio = fecha_inicio
+    for caso in datos["casos"]:
+        inicio, fin = calcular_fechas(siguiente_inicio, caso["horas_estimadas"])
+        tareas.append({
+            "descripcion": caso["descripcion"],
+            "resumen": caso["titulo"],
+            "inicio": inicio,
+            "fin": fin,
+            "estado": "Pendiente",
+            "horas_estimadas": caso["horas_estimadas"]
+        })
+        # La siguiente tarea empieza el día hábil posterior al fin de esta
+        dia = datetime.strptime(fin, "%Y-%m-%d") + timedelta(days=1)
+        while dia.weekday() > 4:
+            dia += timedelta(days=1)
+        siguiente_inicio = dia.strftime("%Y-%m-%d")
+    
+    return {
+        "proyectos": [
+            {
+                "proyecto_id": 1,
+                "nombre": datos["proyecto"],
+                "descripcion": datos["descripcion"] or f"Casos de prueba para validar {datos['proyecto']}",
+                "fecha_inicio": fecha_inicio,
+                "epicas": [
+                    {
+                        "epic_id": 1,
+                        "titulo": datos["epica"],
+                        "descripcion": datos["descripcion"] or datos["epica"],
+                        "tareas": tareas
+                    }
+                ]
+            }
+        ]
+    }
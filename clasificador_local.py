@@ -0,0 +1,336 @@
+"""
+Clasificador entrenado sin conexión que decide si un mensaje se responde localmente o con la IA
+
+Naive Bayes multinomial sobre n-gramas con hashing (palabras, pares de palabras y
+trigramas de caracteres), entrenado con las sesiones guardadas en historial/*.json
+más un corpus base de ejemplos. La predicción es una suma de columnas de una matriz
+pequeña, del orden de microsegundos.
+
+Uso:
+    python clasificador_local.py entrenar
+    python clasificador_local.py evaluar --particiones 5
+"""
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from detector_intenciones import detectar_intenciones
+from metricas import percentil
+from normalizacion import SEPARADOR_ADJUNTOS, normalizar_texto
+
+# numpy se importa al cargar o entrenar el modelo para no retrasar el arranque
+NUMPY_DISPONIBLE = importlib.util.find_spec("numpy") is not None
+np = None
+
+# Clases que predice el clasificador
+LOCAL = "local"
+IA = "ia"
+IA_PLANTILLAS = "ia_plantillas"
+CLASES = [LOCAL, IA, IA_PLANTILLAS]
+
+DIRECTORIO_BASE = os.path.dirname(__file__)
+ARCHIVO_MODELO = os.path.join(DIRECTORIO_BASE, 'cache', 'clasificador', 'modelo.npz')
+DIRECTORIO_HISTORIAL = os.path.join(DIRECTORIO_BASE, 'historial')
+
+# Ejemplos con los que arranca el entrenamiento aunque el historial esté vacío
+EJEMPLOS_BASE: List[Tuple[str, str]] = [
+    (texto, LOCAL) for texto in [
+        "hola", "holaa", "hola que tal", "buenos dias", "buenas tardes", "buenas noches",
+        "saludos", "hey hola", "como estas", "que tal estas", "como te encuentras hoy",
+        "adios", "chao", "hasta luego", "nos vemos", "bye", "me voy gracias",
+        "gracias", "muchas gracias", "te agradezco", "mil gracias por la ayuda", "ok gracias",
+        "vale", "ok", "perfecto", "genial", "de nada", "quien eres", "como te llamas",
+        "cual es tu nombre", "que eres", "cuantos anos tienes", "tu edad", "que hora es",
+        "que puedes hacer", "en que me puedes ayudar", "ayuda", "que funciones tienes"
+    ]
+] + [
+    (texto, IA) for texto in [
+        "explica la diferencia entre pruebas de regresion y pruebas de humo",
+        "que es una prueba de integracion y cuando se usa",
+        "como configuro selenium con python para un proyecto nuevo",
+        "por que falla mi test de cypress al esperar un elemento",
+        "dame ejemplos de consultas sql para validar datos duplicados",
+        "como funciona la autenticacion con jwt en una api rest",
+        "que herramientas recomiendas para pruebas de carga",
+        "resume el siguiente requerimiento en tres puntos",
+        "analiza este flujo de compra y dime que riesgos ves",
+        "como estimo el esfuerzo de pruebas de un sprint",
+        "que metricas de calidad deberia reportar al equipo",
+        "escribe un script de postman para validar el esquema de respuesta",
+        "cual es la diferencia entre verificacion y validacion",
+        "como integro las pruebas automatizadas en el pipeline de ci cd",
+        "que es owasp top 10 y como lo aplico en pruebas de seguridad",
+        "redacta un reporte de defecto para un error en el login",
+        "actua como arquitecto de software y revisa esta arquitectura de microservicios",
+        "que patrones de diseno usar para page object model",
+        "como mockeo una dependencia externa en pruebas unitarias",
+        "deseo realizar un backlog con tareas para backend y frontend"
+    ]
+] + [
+    (texto, IA_PLANTILLAS) for texto in [
+        "genera casos de prueba para el modulo de login",
+        "crea casos de prueba del carrito de compras",
+        "necesito casos de prueba para el registro de usuarios",
+        "generar casos para la pantalla de pagos",
+        "hazme los test cases del endpoint de clientes",
+        "escribe casos de prueba funcionales para el formulario de contacto",
+        "casos de prueba de performance para la api de pedidos",
+        "dame casos prueba para el flujo de recuperacion de contrasena",
+        "genera casos de prueba en formato cp para notion",
+        "crear casos para validar la carga de archivos",
+        "genera el manual de usuario del sistema de inventario",
+        "necesito un manual de usuario para la aplicacion movil",
+        "redacta la guia de usuario del modulo de reportes",
+        "crea la documentacion usuario del portal de clientes",
+        "escribe el manual del usuario para el panel de administracion",
+        "haz una guia usuario paso a paso del proceso de facturacion",
+        "user manual for the billing module",
+        "generate test cases for the checkout api"
+    ]
+]
+
+def caracteristicas(texto_normalizado: str) -> List[str]:
+    """
+    Características de un texto ya normalizado: palabras, pares de palabras y trigramas de caracteres
+    
+    Args:
+        texto_normalizado: Texto devuelto por normalizar_texto
+    
+    Returns:
+        Lista de características (con repeticiones)
+    """
+    palabras = texto_normalizado.split()
+    resultado = palabras + [f"{a} {b}" for a, b in zip(palabras, palabras[1:])]
+    # Los trigramas de caracteres toleran faltas de ortografía y letras repetidas ("holaa")
+    for palabra in palabras:
+        marcada = f"#{palabra}#"
+        resultado.extend(f"§{marcada[i:i + 3]}" for i in range(len(marcada) - 2))
+    return resultado
+
+def etiquetar_conversacion(conversacion: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """
+    Ejemplo de entrenamiento a partir de una conversación guardada
+    
+    Args:
+        conversacion: Entrada de "conversaciones" de una sesión del historial
+    
+    Returns:
+        (texto normalizado, clase) o None si la conversación no sirve para entrenar
+    """
+    pregunta = str(conversacion.get("usuario") or "").split(SEPARADOR_ADJUNTOS, 1)[0]
+    texto = normalizar_texto(pregunta)
+    # Con la IA caída la respuesta local de respaldo no dice nada de la clase del mensaje
+    if not texto or conversacion.get("respaldo_local", False):
+        return None
+    if not conversacion.get("fue_ia", True):
+        return texto, LOCAL
+    
+    intenciones = detectar_intenciones(texto)
+    respuesta = str(conversacion.get("bot") or "")
+    if intenciones["casos_prueba"] or intenciones["manual_usuario"] or "CP-" in respuesta:
+        return texto, IA_PLANTILLAS
+    return texto, IA
+
+def cargar_ejemplos_historial(directorio: str = DIRECTORIO_HISTORIAL) -> List[Tuple[str, str]]:
+    """
+    Ejemplos de entrenamiento de todas las sesiones guardadas
+    
+    Args:
+        directorio: Carpeta con los archivos conversacion_*.json
+    
+    Returns:
+        Lista de (texto normalizado, clase)
+    """
+    ejemplos = []
+    for ruta in sorted(glob.glob(os.path.join(directorio, '*.json'))):
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                sesion = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Sesión omitida ({os.path.basename(ruta)}): {e}")
+            continue
+        for conversacion in sesion.get("conversaciones", []):
+            ejemplo = etiquetar_conversacion(conversacion)
+            if ejemplo:
+                ejemplos.append(ejemplo)
+    return ejemplos
+
+class ClasificadorLocal:
+    """Naive Bayes multinomial con hashing de características"""
+    
+    def __init__(self, dimensiones: int = 2 ** 14, suavizado: float = 0.02):
+        """
+        Inicializar un clasificador sin entrenar
+        
+        Args:
+            dimensiones: Tamaño del espacio de hashing
+            suavizado: Suavizado de Laplace de los conteos
+        """
+        self.dimensiones = dimensiones
+        self.suavizado = suavizado
+        self.clases = list(CLASES)
+        self.log_prior = None
+        self.log_probabilidades = None
+        self.ejemplos_entrenamiento = 0
+    
+    def indices(self, texto_normalizado: str) -> List[int]:
+        """Posiciones de las características del texto en el espacio de hashing"""
+        return [zlib.crc32(c.encode('utf-8')) % self.dimensiones for c in caracteristicas(texto_normalizado)]
+    
+    def entrenar(self, ejemplos: List[Tuple[str, str]]):
+        """
+        Entrenar con una lista de (texto normalizado, clase)
+        
+        Args:
+            ejemplos: Ejemplos etiquetados con una de CLASES
+        """
+        _importar_numpy()
+        conteos = np.zeros((len(self.clases), self.dimensiones), dtype=np.float64)
+        documentos = np.zeros(len(self.clases), dtype=np.float64)
+        for texto, clase in ejemplos:
+            fila = self.clases.index(clase)
+            indices = self.indices(texto)
+            # Cada ejemplo pesa lo mismo: un mensaje largo no desplaza a los saludos de una palabra
+            np.add.at(conteos[fila], indices, 1.0 / max(len(indices), 1))
+            documentos[fila] += 1
+        
+        conteos += self.suavizado
+        self.log_probabilidades = np.log(conteos / conteos.sum(axis=1, keepdims=True))
+        self.log_prior = np.log((documentos + 1.0) / (documentos.sum() + len(self.clases)))
+        self.ejemplos_entrenamiento = len(ejemplos)
+    
+    def predecir(self, texto_normalizado: str) -> Tuple[str, float]:
+        """
+        Clase más probable de un texto
+        
+        Args:
+            texto_normalizado: Texto devuelto por normalizar_texto
+        
+        Returns:
+            (clase, probabilidad a posteriori)
+        """
+        puntuaciones = self.log_prior + self.log_probabilidades[:, self.indices(texto_normalizado)].sum(axis=1)
+        probabilidades = np.exp(puntuaciones - puntuaciones.max())
+        probabilidades /= probabilidades.sum()
+        mejor = int(np.argmax(probabilidades))
+        return self.clases[mejor], float(probabilidades[mejor])
+    
+    def guardar(self, ruta: str = ARCHIVO_MODELO):
+        """Guardar el modelo entrenado en un archivo .npz"""
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        np.savez_compressed(ruta, log_prior=self.log_prior, log_probabilidades=self.log_probabilidades,
+                            clases=np.array(self.clases), suavizado=self.suavizado,
+                            ejemplos_entrenamiento=self.ejemplos_entrenamiento)
+    
+    @classmethod
+    def cargar(cls, ruta: str = ARCHIVO_MODELO) -> Optional["ClasificadorLocal"]:
+        """
+        Cargar un modelo guardado
+        
+        Returns:
+            El clasificador, o None si no hay modelo entrenado o numpy no está disponible
+        """
+        if not NUMPY_DISPONIBLE or not os.path.exists(ruta):
+            return None
+        _importar_numpy()
+        try:
+            with np.load(ruta) as datos:
+                clasificador = cls(dimensiones=datos["log_probabilidades"].shape[1],
+                                   suavizado=float(datos["suavizado"]))
+                clasificador.clases = [str(clase) for clase in datos["clases"]]
+                clasificador.log_prior = datos["log_prior"]
+                clasificador.log_probabilidades = datos["log_probabilidades"]
+                clasificador.ejemplos_entrenamiento = int(datos["ejemplos_entrenamiento"])
+        except (OSError, KeyError, ValueError) as e:
+            print(f"⚠️ No se pudo cargar el clasificador local: {e}")
+            return None
+        return clasificador
+
+def evaluar(ejemplos: List[Tuple[str, str]], particiones: int = 5,
+            umbral_confianza: float = 0.9) -> Dict[str, Any]:
+    """
+    Precisión por validación cruzada y latencia de predicción
+    
+    Args:
+        ejemplos: Ejemplos etiquetados
+        particiones: Número de particiones de la validación cruzada
+        umbral_confianza: Probabilidad mínima con la que el chatbot responde localmente
+    
+    Returns:
+        Precisión global, matriz de confusión (real → predicha), mensajes que se
+        responderían localmente (y cuántos necesitaban la IA) y latencias en microsegundos
+    """
+    aciertos = 0
+    locales = locales_erroneos = 0
+    confusion = {real: {predicha: 0 for predicha in CLASES} for real in CLASES}
+    latencias = []
+    for particion in range(particiones):
+        entrenamiento = [e for i, e in enumerate(ejemplos) if i % particiones != particion]
+        prueba = [e for i, e in enumerate(ejemplos) if i % particiones == particion]
+        clasificador = ClasificadorLocal()
+        clasificador.entrenar(entrenamiento)
+        for texto, clase in prueba:
+            inicio = time.perf_counter()
+            predicha, probabilidad = clasificador.predecir(texto)
+            latencias.append((time.perf_counter() - inicio) * 1_000_000)
+            aciertos += predicha == clase
+            confusion[clase][predicha] += 1
+            if predicha == LOCAL and probabilidad >= umbral_confianza:
+                locales += 1
+                locales_erroneos += clase != LOCAL
+    
+    return {
+        "ejemplos": len(ejemplos),
+        "precision": aciertos / max(len(ejemplos), 1),
+        "confusion": confusion,
+        "umbral_confianza": umbral_confianza,
+        "respondidos_localmente": locales,
+        "locales_erroneos": locales_erroneos,
+        "p50_us": percentil(latencias, 50),
+        "p99_us": percentil(latencias, 99)
+    }
+
+def imprimir_informe(informe: Dict[str, Any]):
+    """Mostrar el resultado de evaluar"""
+    print(f"Ejemplos: {informe['ejemplos']}  precisión: {informe['precision']:.1%}  "
+          f"latencia p50={informe['p50_us']:.1f} µs  p99={informe['p99_us']:.1f} µs")
+    print("real/predicha".ljust(16) + "".join(f"{clase:>15}" for clase in CLASES))
+    for real, fila in informe["confusion"].items():
+        print(f"{real:<16}" + "".join(f"{fila[clase]:>15}" for clase in CLASES))
+    print(f"Respondidos localmente (confianza ≥ {informe['umbral_confianza']:.0%}): "
+          f"{informe['respondidos_localmente']}, de ellos {informe['locales_erroneos']} necesitaban la IA")
+
+def _importar_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+
+def main():
+    """Entrenamiento y evaluación desde la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Entrena el clasificador local/IA con el historial de sesiones")
+    parser.add_argument("accion", choices=["entrenar", "evaluar"])
+    parser.add_argument("--historial", default=DIRECTORIO_HISTORIAL, help="Carpeta de sesiones guardadas")
+    parser.add_argument("--modelo", default=ARCHIVO_MODELO, help="Archivo del modelo entrenado")
+    parser.add_argument("--particiones", type=int, default=5, help="Particiones de la validación cruzada")
+    parser.add_argument("--umbral", type=float, default=0.9, help="Confianza mínima para responder localmente")
+    args = parser.parse_args()
+    
+    historial = cargar_ejemplos_historial(args.historial)
+    ejemplos = [(normalizar_texto(texto), clase) for texto, clase in EJEMPLOS_BASE] + historial
+    print(f"📚 {len(historial)} ejemplos del historial + {len(EJEMPLOS_BASE)} ejemplos base")
+    
+    imprimir_informe(evaluar(ejemplos, args.particiones, args.umbral))
+    if args.accion == "entrenar":
+        clasificador = ClasificadorLocal()
+        clasificador.entrenar(ejemplos)
+        clasificador.guardar(args.modelo)
+        print(f"✅ Modelo guardado en {args.modelo}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Constructor de prompts por secciones priorizadas con presupuesto de tokens
+"""
+import re
+from typing import Any, Dict, List
+
+MARCA_RECORTE = "[... contenido recortado para respetar el límite del prompt ...]"
+
+# Estrategias de recorte disponibles para cada sección
+FIJA = "fija"            # Nunca se recorta
+CONSERVAR_INICIO = "inicio"  # Se elimina el final (adjuntos largos)
+CONSERVAR_FINAL = "final"    # Se elimina el principio (historial: lo reciente importa más)
+RESUMIR_PLANTILLA = "plantilla"  # Se quitan los ejemplos y se conservan las reglas
+
+def estimar_tokens(texto: str) -> int:
+    """
+    Estimar localmente los tokens de un texto (aprox. 4 caracteres por token)
+    
+    Args:
+        texto: Texto a medir
+    
+    Returns:
+        Número estimado de tokens
+    """
+    return (len(texto) + 3) // 4
+
+class SeccionPrompt:
+    """Bloque del prompt con su prioridad y forma de recortarse"""
+    
+    def __init__(self, nombre: str, contenido: str, prioridad: int, estrategia: str, titulo: str = ""):
+        self.nombre = nombre
+        self.titulo = titulo
+        self.contenido = contenido.strip()
+        self.prioridad = prioridad
+        self.estrategia = estrategia
+        self.tokens_originales = estimar_tokens(self.contenido)
+        self.recorte = ""
+    
+    @property
+    def tokens(self) -> int:
+        return estimar_tokens(self.contenido)
+    
+    def renderizar(self) -> str:
+        """Texto de la sección con su título (el título nunca se recorta)"""
+        return f"{self.titulo}\n{self.contenido}" if self.titulo else self.contenido
+
+class ConstructorPrompt:
+    """
+    Arma el prompt final a partir de secciones y lo ajusta a un presupuesto de tokens.
+    
+    La prioridad 1 es la más importante; cuando el prompt excede el presupuesto se
+    recortan primero las secciones con número de prioridad más alto.
+    """
+    
+    def __init__(self, presupuesto_tokens: int = 30000, tokens_minimos_seccion: int = 200):
+        """
+        Inicializar el constructor
+        
+        Args:
+            presupuesto_tokens: Tamaño máximo estimado del prompt
+            tokens_minimos_seccion: Tamaño al que se puede reducir como mínimo una sección recortable
+        """
+        self.presupuesto_tokens = presupuesto_tokens
+        self.tokens_minimos_seccion = tokens_minimos_seccion
+        self.secciones: List[SeccionPrompt] = []
+        self.informe: List[Dict[str, Any]] = []
+    
+    def agregar(self, nombre: str, contenido: str, prioridad: int = 1, estrategia: str = FIJA,
+                titulo: str = "") -> "ConstructorPrompt":
+        """
+        Agregar una sección al prompt (las secciones vacías se ignoran)
+        
+        Args:
+            nombre: Identificador de la sección para el informe
+            contenido: Texto de la sección
+            prioridad: 1 = imprescindible; números mayores se recortan antes
+            estrategia: Forma de recortar la sección si hace falta
+            titulo: Encabezado que precede al contenido y no se recorta
+        
+        Returns:
+            El mismo constructor, para encadenar llamadas
+        """
+        if contenido and contenido.strip():
+            self.secciones.append(SeccionPrompt(nombre, contenido, prioridad, estrategia, titulo))
+        return self
+    
+    def construir(self) -> str:
+        """
+        Construir el prompt respetando el presupuesto de tokens
+        
+        Returns:
+            Texto final del prompt
+        """
+        exceso = sum(s.tokens for s in self.secciones) - self.presupuesto_tokens
+        
+        # Recortar de menor a mayor importancia; a igual prioridad, la última sección primero
+        recortables = [s for s in self.secciones if s.estrategia != FIJA]
+        for seccion in sorted(recortables, key=lambda s: (-s.prioridad, -self.secciones.index(s))):
+            if exceso <= 0:
+                break
+            objetivo = max(self.tokens_minimos_seccion, seccion.tokens - exceso)
+            if objetivo >= seccion.tokens:
+                continue
+            antes = seccion.tokens
+            self._recortar(seccion, objetivo)
+            exceso -= antes - seccion.tokens
+        
+        self.informe = [{
+            "seccion": s.nombre,
+            "prioridad": s.prioridad,
+            "tokens_originales": s.tokens_originales,
+            "tokens_finales": s.tokens,
+            "recorte": s.recorte
+        } for s in self.secciones]
+        
+        return "\n\n".join(s.renderizar() for s in self.secciones)
+    
+    def total_tokens(self) -> int:
+        """Tokens estimados del prompt con los recortes aplicados"""
+        return sum(s.tokens for s in self.secciones)
+    
+    def hubo_recortes(self) -> bool:
+        """Indica si alguna sección tuvo que recortarse"""
+        return any(s.recorte for s in self.secciones)
+    
+    def resumen(self) -> str:
+        """
+        Generar un resumen legible del tamaño final de cada sección
+        
+        Returns:
+            Texto de una línea con los tokens por sección
+        """
+        partes = []
+        for fila in self.informe:
+            detalle = f"{fila['seccion']}={fila['tokens_finales']}"
+            if fila['recorte']:
+                detalle += f" (de {fila['tokens_originales']}, {fila['recorte']})"
+            partes.append(detalle)
+        return f"Prompt ~{self.total_tokens()}/{self.presupuesto_tokens} tokens: " + ", ".join(partes)
+    
+    def _recortar(self, seccion: SeccionPrompt, objetivo_tokens: int):
+        """Reducir una sección hasta el tamaño objetivo según su estrategia"""
+        # Se descuenta el espacio que ocupa la marca de recorte
+        max_caracteres = max(0, objetivo_tokens * 4 - len(MARCA_RECORTE) - 1)
+        
+        if seccion.estrategia == RESUMIR_PLANTILLA:
+            # Las reglas de formato se conservan completas; solo se quitan los ejemplos
+            sin_ejemplos = quitar_ejemplos(seccion.contenido)
+            if len(sin_ejemplos) < len(seccion.contenido):
+                seccion.contenido = sin_ejemplos
+                seccion.recorte = "sin ejemplos"
+            return
+        
+        if len(seccion.contenido) <= max_caracteres:
+            return
+        
+        if seccion.estrategia == CONSERVAR_FINAL:
+            seccion.contenido = MARCA_RECORTE + "\n" + seccion.contenido[-max_caracteres:]
+            seccion.recorte = "inicio recortado"
+        else:
+            seccion.contenido = seccion.contenido[:max_caracteres] + "\n" + MARCA_RECORTE
+            seccion.recorte = "final recortado"
+
+def quitar_ejemplos(plantilla: str) -> str:
+    """
+    Quitar de una plantilla los bloques de ejemplo, conservando la estructura y las reglas
+    
+    Args:
+        plantilla: Texto de la plantilla
+    
+    Returns:
+        Plantilla sin los ejemplos
+    """
+    # Los ejemplos empiezan en una línea "Ejemplo ..." / "EJEMPLO ..." y llegan hasta
+    # la siguiente línea que empieza con "IMPORTANTE" (o el final de la plantilla)
+    patron = re.compile(r'^[=\s]*ejemplo[^\n]*\n.*?(?=^IMPORTANTE|\Z)', re.IGNORECASE | re.MULTILINE | re.DOTALL)
+    return patron.sub("", plantilla).strip()
@@ -0,0 +1,195 @@
+"""
+Detección de intenciones en una sola pasada con un patrón compilado una vez al arrancar
+
+Todas las palabras clave (roles, contextos QA, casos de prueba, manual de usuario,
+preguntas simples y saludos de respuesta local) se combinan en una única expresión
+regular construida a partir de un trie. Un lookahead permite encontrar las
+coincidencias solapadas, con lo que el resultado es el mismo que comprobar cada
+lista de palabras por separado. Las palabras clave y el texto se comparan
+normalizados (sin acentos, puntuación ni mayúsculas).
+"""
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from normalizacion import normalizar_texto
+
+# Roles profesionales, en orden de prioridad
+ROLES = {
+    "experto en QA y casos de prueba": [
+        "actua como experto en qa", "actua como ingeniero qa", "actua como tester",
+        "actua como experto en testing", "actua como experto en casos de prueba",
+        "comportate como qa", "comportate como tester", "eres un experto qa",
+        "eres un ingeniero qa", "experto en quality assurance"
+    ],
+    "arquitecto de software": [
+        "actua como arquitecto", "actua como arquitecto de software",
+        "comportate como arquitecto", "eres un arquitecto de software"
+    ],
+    "analista de negocio": [
+        "actua como analista", "actua como analista de negocio",
+        "comportate como analista", "eres un analista de negocio"
+    ],
+    "desarrollador senior": [
+        "actua como desarrollador", "actua como programador senior",
+        "comportate como desarrollador", "eres un desarrollador senior"
+    ],
+    "consultor técnico": [
+        "actua como consultor", "actua como consultor tecnico",
+        "comportate como consultor", "eres un consultor técnico"
+    ]
+}
+
+# Especializaciones QA, en orden de prioridad
+CONTEXTOS_QA = {
+    "qa_api": [
+        "endpoint", "api testing", "rest api", "json schema", "postman",
+        "test api", "api cases", "swagger", "openapi", "microservices"
+    ],
+    "qa_security": [
+        "security testing", "owasp", "vulnerabilities", "penetration test",
+        "authentication", "authorization", "sql injection", "xss", "csrf"
+    ],
+    "qa_performance": [
+        "performance testing", "load testing", "stress testing", "jmeter",
+        "performance cases", "response time", "throughput", "scalability"
+    ],
+    "qa_mobile": [
+        "mobile testing", "app testing", "android testing", "ios testing",
+        "mobile automation", "appium", "device testing"
+    ],
+    "qa_automatizado": [
+        "test automation", "selenium", "playwright", "cypress", "automation scripts",
+        "automated testing", "test framework", "ci/cd testing"
+    ],
+    "qa_manual": [
+        "manual testing", "exploratory testing", "user acceptance testing",
+        "uat", "manual test cases", "regression testing"
+    ]
+}
+
+# Si menciona QA en general pero no una especialidad, se asume QA manual
+PALABRAS_QA_GENERAL = ["qa", "quality assurance", "testing", "test cases"]
+CONTEXTO_QA_GENERAL = "qa_manual"
+
+PALABRAS_CASOS_PRUEBA = ['casos de prueba', 'test cases', 'casos prueba', 'generar casos', 'crear casos']
+
+PALABRAS_MANUAL_USUARIO = ['manual de usuario', 'manual usuario', 'documentacion usuario', 'guia usuario',
+                           'documentation user', 'user manual', 'guia de usuario', 'manual del usuario']
+
+PREGUNTAS_SIMPLES = ['como estas', 'que tal', 'hola', 'hi', 'buenos dias', 'buenas tardes',
+                     'buenas noches', 'como te encuentras', 'que haces', 'adios', 'chao',
+                     'hasta luego', 'gracias', 'muchas gracias', 'de nada', 'ok', 'vale']
+
+# Mensajes que siempre se responden localmente (solo como palabras completas)
+PALABRAS_RESPUESTA_LOCAL = [
+    'hola', 'hi', 'buenos dias', 'buenas tardes', 'buenas noches', 'saludos',
+    'adios', 'chao', 'hasta luego', 'nos vemos', 'bye',
+    'gracias', 'muchas gracias', 'te agradezco',
+    'quien eres', 'como te llamas', 'tu nombre'
+]
+
+def _patron_trie(palabras: List[str]) -> str:
+    """Expresión regular equivalente a la alternativa de las palabras, factorizada por prefijos"""
+    trie: Dict[str, Any] = {}
+    for palabra in palabras:
+        nodo = trie
+        for caracter in palabra:
+            nodo = nodo.setdefault(caracter, {})
+        nodo[""] = {}
+    return _patron_nodo(trie)
+
+def _patron_nodo(nodo: Dict[str, Any]) -> str:
+    ramas = [re.escape(caracter) + _patron_nodo(hijo) for caracter, hijo in sorted(nodo.items()) if caracter]
+    if not ramas:
+        return ""
+    patron = ramas[0] if len(ramas) == 1 else "(?:" + "|".join(ramas) + ")"
+    # Opcional y voraz: en cada posición se captura la palabra más larga
+    return f"(?:{patron})?" if "" in nodo else patron
+
+def _es_caracter_palabra(caracter: str) -> bool:
+    return caracter.isalnum() or caracter == "_"
+
+class DetectorIntenciones:
+    """Todas las señales de intención de un texto en una sola pasada"""
+    
+    def __init__(self):
+        """Construir la tabla de palabras clave y compilar el patrón combinado"""
+        # palabra → [(grupo, valor, prioridad, requiere_palabra_completa)]
+        self._entradas: Dict[str, List[Tuple[str, Any, int, bool]]] = {}
+        for prioridad, (rol, palabras) in enumerate(ROLES.items()):
+            self._agregar("rol", rol, prioridad, palabras)
+        for prioridad, (contexto, palabras) in enumerate(CONTEXTOS_QA.items()):
+            self._agregar("contexto_qa", contexto, prioridad, palabras)
+        self._agregar("contexto_qa", CONTEXTO_QA_GENERAL, len(CONTEXTOS_QA), PALABRAS_QA_GENERAL)
+        self._agregar("casos_prueba", True, 0, PALABRAS_CASOS_PRUEBA)
+        self._agregar("manual_usuario", True, 0, PALABRAS_MANUAL_USUARIO)
+        self._agregar("pregunta_simple", True, 0, PREGUNTAS_SIMPLES)
+        self._agregar("respuesta_local", True, 0, PALABRAS_RESPUESTA_LOCAL, palabra_completa=True)
+        
+        palabras = list(self._entradas)
+        self.patron = re.compile(f"(?=({_patron_trie(palabras)}))")
+        # El lookahead captura la palabra más larga de cada posición; las más cortas que
+        # empiezan en la misma posición son sus prefijos
+        self._prefijos = {palabra: [otra for otra in palabras if otra != palabra and palabra.startswith(otra)]
+                          for palabra in palabras}
+    
+    def _agregar(self, grupo: str, valor: Any, prioridad: int, palabras: List[str],
+                 palabra_completa: bool = False):
+        for palabra in palabras:
+            self._entradas.setdefault(normalizar_texto(palabra), []).append(
+                (grupo, valor, prioridad, palabra_completa))
+    
+    def detectar(self, texto: str) -> Dict[str, Any]:
+        """
+        Detectar las intenciones de un texto
+        
+        Args:
+            texto: Pregunta del usuario (sin adjuntos) normalizada con normalizar_texto
+        
+        Returns:
+            Diccionario con "rol" y "contexto_qa" (o None) y los indicadores booleanos
+            "casos_prueba", "manual_usuario", "pregunta_simple" y "respuesta_local"
+        """
+        mejores: Dict[str, Tuple[int, Any]] = {}
+        for coincidencia in self.patron.finditer(texto):
+            inicio = coincidencia.start()
+            palabra = coincidencia.group(1)
+            for candidata in [palabra] + self._prefijos[palabra]:
+                fin = inicio + len(candidata)
+                palabra_aislada = ((inicio == 0 or not _es_caracter_palabra(texto[inicio - 1]))
+                                   and (fin == len(texto) or not _es_caracter_palabra(texto[fin])))
+                for grupo, valor, prioridad, palabra_completa in self._entradas[candidata]:
+                    if palabra_completa and not palabra_aislada:
+                        continue
+                    if grupo not in mejores or prioridad < mejores[grupo][0]:
+                        mejores[grupo] = (prioridad, valor)
+        
+        def valor(grupo: str, por_defecto: Optional[Any] = None) -> Any:
+            return mejores[grupo][1] if grupo in mejores else por_defecto
+        
+        return {
+            "rol": valor("rol"),
+            "contexto_qa": valor("contexto_qa"),
+            "casos_prueba": valor("casos_prueba", False),
+            "manual_usuario": valor("manual_usuario", False),
+            "pregunta_simple": valor("pregunta_simple", False),
+            "respuesta_local": valor("respuesta_local", False)
+        }
+
+_DETECTOR = DetectorIntenciones()
+
+@lru_cache(maxsize=256)
+def detectar_intenciones(texto_normalizado: str) -> Dict[str, Any]:
+    """
+    Intenciones de una pregunta, con caché para las preguntas repetidas
+    
+    El diccionario devuelto es compartido: no debe modificarse.
+    
+    Args:
+        texto_normalizado: Pregunta del usuario (sin adjuntos) normalizada con normalizar_texto
+    
+    Returns:
+        Resultado de DetectorIntenciones.detectar
+    """
+    return _DETECTOR.detectar(texto_normalizado)
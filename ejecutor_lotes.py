@@ -0,0 +1,256 @@
+"""
+Ejecución por lotes de solicitudes desde un archivo JSONL
+
+Cada línea de entrada es un objeto JSON con:
+    id        Identificador de la solicitud (también se acepta "request_id"; por defecto, el número de línea)
+    prompt    Texto de la solicitud (también "mensaje", o "title" + "body")
+    archivos  Lista opcional de rutas de archivos adjuntos (relativas al archivo de entrada)
+
+Los resultados se agregan al archivo de salida a medida que terminan. Si la ejecución se
+interrumpe, al volver a lanzarla se omiten las solicitudes que ya tienen resultado.
+
+Uso:
+    python ejecutor_lotes.py entrada.jsonl salida.jsonl --trabajadores 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Set
+
+from Chatbot import ChatBot
+from extraccion_archivos import procesar_archivos
+from metricas import percentil
+from resiliencia import RespuestaRespaldo
+
+def leer_solicitudes(ruta_entrada: str) -> Iterator[Dict[str, Any]]:
+    """
+    Leer las solicitudes del archivo de entrada línea por línea
+    
+    Args:
+        ruta_entrada: Ruta del archivo JSONL
+    
+    Returns:
+        Iterador de solicitudes con su id normalizado
+    """
+    with open(ruta_entrada, 'r', encoding='utf-8') as f:
+        for numero_linea, linea in enumerate(f, 1):
+            if not linea.strip():
+                continue
+            try:
+                solicitud = json.loads(linea)
+            except json.JSONDecodeError as e:
+                print(f"Línea {numero_linea} ignorada (JSON inválido): {e}")
+                continue
+            solicitud['id'] = str(solicitud.get('id') or solicitud.get('request_id') or numero_linea)
+            yield solicitud
+
+def cargar_ids_completados(ruta_salida: str) -> Set[str]:
+    """
+    Obtener los ids que ya tienen un resultado correcto en el archivo de salida
+    
+    Args:
+        ruta_salida: Ruta del archivo JSONL de resultados
+    
+    Returns:
+        Conjunto de ids completados (los que terminaron con error se vuelven a ejecutar)
+    """
+    completados = set()
+    if not os.path.exists(ruta_salida):
+        return completados
+    
+    with open(ruta_salida, 'r', encoding='utf-8') as f:
+        for linea in f:
+            try:
+                resultado = json.loads(linea)
+            except json.JSONDecodeError:
+                # Última línea incompleta de una ejecución interrumpida
+                continue
+            if 'error' not in resultado:
+                completados.add(str(resultado.get('id')))
+    return completados
+
+class EjecutorLotes:
+    """Procesa un archivo de solicitudes con varios trabajadores concurrentes"""
+    
+    def __init__(self, ruta_entrada: str, ruta_salida: str, trabajadores: int = 4, usar_cache: bool = True):
+        """
+        Inicializar el ejecutor
+        
+        Args:
+            ruta_entrada: Archivo JSONL con las solicitudes
+            ruta_salida: Archivo JSONL donde se agregan los resultados
+            trabajadores: Número de solicitudes procesadas a la vez
+            usar_cache: Si se consultan las cachés de respuestas
+        """
+        self.ruta_entrada = ruta_entrada
+        self.ruta_salida = ruta_salida
+        self.trabajadores = max(1, trabajadores)
+        self.usar_cache = usar_cache
+        
+        self.latencias: List[float] = []
+        self.procesadas = 0
+        self.errores = 0
+        self.omitidas = 0
+        self.inicio = time.perf_counter()
+    
+    async def ejecutar(self) -> Dict[str, Any]:
+        """
+        Procesar todas las solicitudes pendientes
+        
+        Returns:
+            Resumen con rendimiento y percentiles de latencia
+        """
+        completados = cargar_ids_completados(self.ruta_salida)
+        cola = asyncio.Queue(maxsize=self.trabajadores * 2)
+        self.inicio = time.perf_counter()
+        # Configurar la IA y leer las cachés bloquea: los chatbots se crean fuera del bucle de eventos
+        chatbots = await asyncio.to_thread(self.crear_chatbots)
+        
+        with open(self.ruta_salida, 'a', encoding='utf-8') as salida:
+            tareas = [asyncio.create_task(self._trabajador(chatbot, cola, salida)) for chatbot in chatbots]
+            
+            # Las solicitudes se leen a medida que hay trabajadores libres
+            for solicitud in leer_solicitudes(self.ruta_entrada):
+                if solicitud['id'] in completados:
+                    self.omitidas += 1
+                    continue
+                await cola.put(solicitud)
+            
+            for _ in tareas:
+                await cola.put(None)
+            await asyncio.gather(*tareas)
+        
+        return self.obtener_resumen(time.perf_counter() - self.inicio)
+    
+    def crear_chatbots(self) -> List[ChatBot]:
+        """
+        Crear un chatbot por trabajador para que los historiales no se mezclen
+        
+        Returns:
+            Chatbots que comparten el límite de solicitudes en vuelo y las cachés del primero
+        """
+        chatbots = []
+        for numero in range(self.trabajadores):
+            chatbot = ChatBot(f"Lote-{numero + 1}")
+            chatbot.usar_cache = self.usar_cache
+            if chatbots:
+                chatbot.compartir_recursos(chatbots[0])
+            chatbots.append(chatbot)
+        return chatbots
+    
+    async def _trabajador(self, chatbot: ChatBot, cola: asyncio.Queue, salida):
+        while True:
+            solicitud = await cola.get()
+            if solicitud is None:
+                return
+            
+            inicio = time.perf_counter()
+            try:
+                mensaje = await self.construir_mensaje(solicitud)
+                
+                # Las solicitudes son independientes entre sí: sin historial previo
+                chatbot.nueva_conversacion()
+                respuesta = await chatbot.procesar_mensaje_async(mensaje)
+                # Si la IA falló, el chatbot responde localmente: es un error que se reintenta al reanudar
+                if isinstance(respuesta, RespuestaRespaldo):
+                    raise RuntimeError(f"IA no disponible, respuesta local de respaldo: {respuesta.error}")
+                
+                resultado = {'id': solicitud['id'], 'respuesta': respuesta}
+            except Exception as e:
+                self.errores += 1
+                resultado = {'id': solicitud['id'], 'error': str(e)}
+            
+            duracion = time.perf_counter() - inicio
+            resultado['segundos'] = round(duracion, 3)
+            resultado['fecha'] = datetime.now().isoformat()
+            self._escribir_resultado(salida, resultado)
+            
+            self.latencias.append(duracion)
+            self.procesadas += 1
+            print(f"[{self.procesadas}] {solicitud['id']}: {duracion:.2f}s"
+                  + (f" (error: {resultado['error']})" if 'error' in resultado else ""))
+    
+    async def construir_mensaje(self, solicitud: Dict[str, Any]) -> str:
+        """
+        Armar el mensaje para el chatbot con el mismo formato que usa la interfaz
+        
+        Args:
+            solicitud: Solicitud leída del archivo de entrada
+        
+        Returns:
+            Pregunta y, si hay archivos, su contenido tras el separador de adjuntos
+        """
+        prompt = solicitud.get('prompt') or solicitud.get('mensaje')
+        if not prompt:
+            prompt = "\n\n".join(parte for parte in [solicitud.get('title', ''), solicitud.get('body', '')] if parte)
+        if not prompt:
+            raise ValueError("La solicitud no tiene texto")
+        
+        archivos = solicitud.get('archivos') or []
+        if not archivos:
+            return prompt
+        
+        directorio_base = os.path.dirname(os.path.abspath(self.ruta_entrada))
+        rutas = [ruta if os.path.isabs(ruta) else os.path.join(directorio_base, ruta) for ruta in archivos]
+        contexto_archivos = await asyncio.to_thread(procesar_archivos, rutas)
+        return f"{prompt}\n\n--- ARCHIVOS ADJUNTOS ---{contexto_archivos}"
+    
+    def _escribir_resultado(self, salida, resultado: Dict[str, Any]):
+        # Cada resultado queda en disco antes de seguir: es el punto de control para reanudar
+        salida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+        salida.flush()
+        os.fsync(salida.fileno())
+    
+    def obtener_resumen(self, segundos_totales: float) -> Dict[str, Any]:
+        """
+        Calcular el resumen de la ejecución
+        
+        Args:
+            segundos_totales: Duración total de la ejecución
+        
+        Returns:
+            Diccionario con contadores, rendimiento y percentiles de latencia
+        """
+        return {
+            'procesadas': self.procesadas,
+            'errores': self.errores,
+            'omitidas': self.omitidas,
+            'segundos_totales': round(segundos_totales, 2),
+            'solicitudes_por_minuto': round(self.procesadas / segundos_totales * 60, 2) if segundos_totales else 0.0,
+            'latencia_p50': round(percentil(self.latencias, 50), 3),
+            'latencia_p90': round(percentil(self.latencias, 90), 3),
+            'latencia_p99': round(percentil(self.latencias, 99), 3)
+        }
+
+def imprimir_resumen(resumen: Dict[str, Any]):
+    """Mostrar el resumen de la ejecución por consola"""
+    print("-" * 60)
+    print(f"✅ Procesadas: {resumen['procesadas']}  ❌ Errores: {resumen['errores']}  "
+          f"⏭️ Omitidas (ya completadas): {resumen['omitidas']}")
+    print(f"⏱️ Tiempo total: {resumen['segundos_totales']}s  "
+          f"Rendimiento: {resumen['solicitudes_por_minuto']} solicitudes/min")
+    print(f"📊 Latencia p50: {resumen['latencia_p50']}s  p90: {resumen['latencia_p90']}s  "
+          f"p99: {resumen['latencia_p99']}s")
+
+def main():
+    """Función principal para ejecutar un lote desde la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Procesa un archivo JSONL de solicitudes con el chatbot")
+    parser.add_argument("entrada", help="Archivo JSONL con las solicitudes")
+    parser.add_argument("salida", help="Archivo JSONL donde se agregan los resultados")
+    parser.add_argument("--trabajadores", type=int, default=4, help="Solicitudes procesadas a la vez")
+    parser.add_argument("--sin-cache", action="store_true", help="No reutilizar respuestas en caché")
+    args = parser.parse_args()
+    
+    ejecutor = EjecutorLotes(args.entrada, args.salida, args.trabajadores, usar_cache=not args.sin_cache)
+    try:
+        resumen = asyncio.run(ejecutor.ejecutar())
+    except KeyboardInterrupt:
+        print("\n⏸️ Ejecución interrumpida; vuelve a lanzarla para continuar donde se detuvo.")
+        resumen = ejecutor.obtener_resumen(time.perf_counter() - ejecutor.inicio)
+    imprimir_resumen(resumen)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Enrutamiento de solicitudes entre modelos rápidos y potentes según su complejidad
+"""
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from metricas import percentil
+from politicas_generacion import (CASOS_PRUEBA, CHAT_SIMPLE, CONSULTA_TECNICA, EXTRACCION_FRAGMENTO,
+                                  MANUAL_USUARIO, RESUMEN_CONVERSACION)
+
+# Niveles de modelo, del más rápido al más capaz
+RAPIDO = "rapido"
+ESTANDAR = "estandar"
+POTENTE = "potente"
+
+# Modelos sugeridos para un enrutador creado sin configuración; el chatbot solo usa los
+# que se configuran explícitamente y, para el resto de niveles, su modelo principal
+MODELOS_POR_DEFECTO = {
+    RAPIDO: "gemini-2.0-flash-lite",
+    ESTANDAR: "gemini-2.0-flash",
+    POTENTE: "gemini-2.5-pro"
+}
+
+class EnrutadorModelos:
+    """
+    Elige el nivel de modelo de cada solicitud con señales que ya calcula el chatbot
+    (intención, adjuntos y tamaño del prompt) y registra la latencia de cada nivel.
+    
+    Las conversaciones breves y las tareas auxiliares (extracción por fragmentos,
+    resúmenes) van al nivel rápido; la generación estructurada larga va al potente.
+    Con el registro de latencias se pueden ajustar los umbrales con datos reales.
+    """
+    
+    def __init__(self, modelos: Optional[Dict[str, str]] = None, umbral_tokens_rapido: int = 1500,
+                 umbral_tokens_potente: int = 12000, archivo_registro: Optional[str] = None,
+                 max_muestras: int = 500):
+        """
+        Inicializar el enrutador
+        
+        Args:
+            modelos: Nombre del modelo de cada nivel (los que falten toman el valor por defecto)
+            umbral_tokens_rapido: Prompts más cortos que esto pueden ir al nivel rápido
+            umbral_tokens_potente: Prompts más largos que esto van al nivel potente
+            archivo_registro: JSONL donde se agrega cada llamada medida (opcional)
+            max_muestras: Latencias recientes conservadas en memoria por nivel
+        """
+        self.modelos = dict(MODELOS_POR_DEFECTO)
+        self.modelos.update({nivel: modelo for nivel, modelo in (modelos or {}).items() if modelo})
+        self.umbral_tokens_rapido = umbral_tokens_rapido
+        self.umbral_tokens_potente = umbral_tokens_potente
+        self.archivo_registro = archivo_registro
+        
+        self._latencias = {nivel: deque(maxlen=max_muestras) for nivel in self.modelos}
+        self._errores = {nivel: 0 for nivel in self.modelos}
+        self._lock = threading.Lock()
+    
+    def elegir(self, intencion: str, tokens_prompt: int) -> str:
+        """
+        Elegir el nivel de modelo de una solicitud
+        
+        Args:
+            intencion: Tipo de solicitud detectado
+            tokens_prompt: Tamaño estimado del prompt más el historial
+        
+        Returns:
+            Nivel de modelo (RAPIDO, ESTANDAR o POTENTE)
+        """
+        if intencion in (CHAT_SIMPLE, EXTRACCION_FRAGMENTO, RESUMEN_CONVERSACION):
+            return RAPIDO
+        if intencion in (CASOS_PRUEBA, MANUAL_USUARIO) or tokens_prompt > self.umbral_tokens_potente:
+            return POTENTE
+        if intencion == CONSULTA_TECNICA and tokens_prompt < self.umbral_tokens_rapido:
+            return RAPIDO
+        return ESTANDAR
+    
+    def modelo(self, nivel: str) -> str:
+        """Nombre del modelo configurado para un nivel"""
+        return self.modelos.get(nivel, self.modelos[ESTANDAR])
+    
+    def registrar(self, nivel: str, segundos: float, intencion: str = "", tokens_prompt: int = 0,
+                  exito: bool = True):
+        """
+        Registrar la duración de una llamada al modelo
+        
+        Args:
+            nivel: Nivel usado
+            segundos: Duración de la llamada
+            intencion: Tipo de solicitud
+            tokens_prompt: Tamaño estimado del prompt
+            exito: False si la llamada terminó con error
+        """
+        with self._lock:
+            if exito:
+                self._latencias.setdefault(nivel, deque(maxlen=500)).append(segundos)
+            else:
+                self._errores[nivel] = self._errores.get(nivel, 0) + 1
+        
+        if self.archivo_registro:
+            registro = {
+                "fecha": datetime.now().isoformat(),
+                "nivel": nivel,
+                "modelo": self.modelo(nivel),
+                "intencion": intencion,
+                "tokens_prompt": tokens_prompt,
+                "segundos": round(segundos, 3),
+                "exito": exito
+            }
+            try:
+                os.makedirs(os.path.dirname(self.archivo_registro), exist_ok=True)
+                with self._lock, open(self.archivo_registro, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"Error registrando latencia del modelo: {e}")
+    
+    def obtener_estadisticas(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Latencias por nivel
+        
+        Returns:
+            Para cada nivel: modelo, llamadas, errores y p50/p90 en milisegundos
+        """
+        with self._lock:
+            muestras = {nivel: [s * 1000 for s in latencias] for nivel, latencias in self._latencias.items()}
+            errores = dict(self._errores)
+        
+        return {
+            nivel: {
+                "modelo": self.modelo(nivel),
+                "llamadas": len(valores),
+                "errores": errores.get(nivel, 0),
+                "p50_ms": round(percentil(valores, 50), 1),
+                "p90_ms": round(percentil(valores, 90), 1)
+            }
+            for nivel, valores in muestras.items()
+        }
@@ -0,0 +1,862 @@
+"""
+Extracción de texto de archivos adjuntos (PDF, DOCX y TXT) sin depender de la interfaz
+
+Con varios archivos la extracción se reparte entre procesos (el análisis de PDF usa
+CPU y no libera el GIL), de modo que el tiempo total se acerca al del archivo más lento.
+Los documentos extraídos se guardan en una caché direccionada por contenido: volver a
+adjuntar el mismo archivo solo cuesta calcular su hash.
+"""
+import atexit
+import codecs
+import importlib.util
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+import time
+import unicodedata
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from cache_extraccion import CacheExtraccion
+from normalizacion import normalizar_texto
+
+# Las librerías para procesar archivos se importan al extraer el primer archivo;
+# aquí solo se comprueba que estén instaladas para no retrasar el arranque.
+# Los DOCX se leen directamente del zip con la biblioteca estándar
+PDF_DISPONIBLE = importlib.util.find_spec("PyPDF2") is not None
+
+# Procesos de extracción compartidos; se crean con la primera solicitud de varios archivos.
+# Se usa "spawn" porque el proceso principal tiene hilos (interfaz, IA) y fork no es seguro
+MAX_PROCESOS_EXTRACCION = min(os.cpu_count() or 1, 4)
+TIMEOUT_POR_ARCHIVO = 60.0
+_pool = None
+_lock_pool = threading.Lock()
+
+# Cambiar la versión cuando cambie el texto que producen los extractores invalida la caché
+VERSION_EXTRACTOR = "4"
+SEPARADOR_PAGINAS = "\n\f"
+# Misma estimación que constructor_prompt.estimar_tokens
+CARACTERES_POR_TOKEN = 4
+usar_cache_extraccion = True
+_cache_extraccion = None
+_lock_cache = threading.Lock()
+
+# Los TXT se leen mapeados en memoria y se decodifican por bloques. Los más grandes que
+# MAX_BYTES_TXT (logs) se muestrean: inicio, final y ventanas que coinciden con la pregunta
+MAX_BYTES_TXT = 4 * 1024 * 1024
+TAMANO_BLOQUE_TXT = 1024 * 1024
+TAMANO_VENTANA_TXT = 4096
+MAX_COINCIDENCIAS_TXT = 50000
+_BOMS = [(codecs.BOM_UTF32_LE, 'utf-32-le'), (codecs.BOM_UTF32_BE, 'utf-32-be'), (codecs.BOM_UTF8, 'utf-8'),
+         (codecs.BOM_UTF16_LE, 'utf-16-le'), (codecs.BOM_UTF16_BE, 'utf-16-be')]
+
+def procesar_archivos(archivos: List[str], timeout_por_archivo: float = TIMEOUT_POR_ARCHIVO,
+                      consulta: Optional[str] = None) -> str:
+    """
+    Extraer el contenido de varios archivos adjuntos
+    
+    Args:
+        archivos: Rutas de los archivos
+        timeout_por_archivo: Segundos máximos de extracción de cada archivo
+        consulta: Pregunta del usuario, para elegir qué partes incluir de los TXT muy grandes
+    
+    Returns:
+        Texto de todos los archivos, cada uno precedido por su encabezado, en el orden recibido
+    """
+    inicio = time.perf_counter()
+    resultados = extraer_archivos(archivos, timeout_por_archivo)
+    if len(resultados) > 1 or any(r["desde_cache"] for r in resultados):
+        detalle = ", ".join(f"{os.path.basename(r['archivo'])} {r['segundos']:.2f} s"
+                            + (" (caché)" if r["desde_cache"] else "") for r in resultados)
+        print(f"⏱️ Extracción de {len(resultados)} archivos en {time.perf_counter() - inicio:.2f} s ({detalle})")
+    
+    return componer_contenido(resultados, consulta)
+
+def componer_contenido(resultados: List[Dict[str, Any]], consulta: Optional[str] = None) -> str:
+    """
+    Unir los resultados de extraer_archivos en el texto que se adjunta al mensaje
+    
+    Args:
+        resultados: Un resultado por archivo, en el orden en que se adjuntaron
+        consulta: Pregunta del usuario; de los TXT muestreados (extraídos antes de conocerla)
+            se vuelve a tomar la muestra con las partes que coinciden con ella
+    
+    Returns:
+        Texto de todos los archivos, cada uno precedido por su encabezado
+    """
+    contenido_total = ""
+    for resultado in resultados:
+        nombre = os.path.basename(resultado["archivo"])
+        if resultado["error"]:
+            contenido_total += f"\n\nError al procesar {nombre}: {resultado['error']}\n"
+            continue
+        contenido = resultado["contenido"]
+        if consulta and not resultado["completo"] and resultado["archivo"].lower().endswith('.txt'):
+            try:
+                contenido = normalizar_texto_extraido(extraer_texto_txt(resultado["archivo"], consulta=consulta))
+            except OSError as e:
+                print(f"⚠️ No se pudo volver a muestrear {nombre}: {e}")
+        contenido_total += f"\n\n--- CONTENIDO DE {nombre} ---\n{contenido}\n"
+    
+    return contenido_total
+
+def extraer_archivos(archivos: List[str], timeout_por_archivo: float = TIMEOUT_POR_ARCHIVO,
+                     forzar_procesos: bool = False) -> List[Dict[str, Any]]:
+    """
+    Extraer varios archivos: primero se consulta la caché y los que faltan se extraen en
+    paralelo (uno solo se extrae en el proceso actual, salvo con forzar_procesos)
+    
+    Args:
+        archivos: Rutas de los archivos
+        timeout_por_archivo: Segundos máximos de extracción de cada archivo
+        forzar_procesos: Extraer en los procesos de extracción aunque sea un solo archivo,
+            para no ocupar el GIL del proceso actual (por ejemplo, el de la interfaz)
+    
+    Returns:
+        Un diccionario por archivo, en el orden recibido, con "archivo", "contenido",
+        "paginas" (desplazamiento de cada página en el contenido), "numeros_pagina"
+        (número de cada una en el original), "total_paginas", "completo", "segundos" (tiempo de extracción o del hash si vino de la caché), "desde_cache"
+        y "error" (None si se extrajo)
+    """
+    resultados: List[Optional[Dict[str, Any]]] = [None] * len(archivos)
+    pendientes = []
+    for indice, archivo in enumerate(archivos):
+        resultado, clave = _buscar_en_cache(archivo)
+        if resultado is not None:
+            resultados[indice] = resultado
+        else:
+            pendientes.append((indice, archivo, clave))
+    
+    if len(pendientes) < 2 and not (forzar_procesos and pendientes):
+        extraidos = [_extraer_resultado(archivo) for _, archivo, _ in pendientes]
+    else:
+        extraidos = _extraer_en_paralelo([archivo for _, archivo, _ in pendientes], timeout_por_archivo)
+    
+    for (indice, _, clave), (resultado, cacheable) in zip(pendientes, extraidos):
+        if clave and cacheable and resultado["error"] is None:
+            _cache_extraccion.guardar(clave, _documento_de_resultado(resultado), resultado["segundos"])
+        resultados[indice] = resultado
+    return resultados
+
+class ExtraccionSegundoPlano:
+    """
+    Extracción que empieza en cuanto se adjunta un archivo, mientras el usuario escribe;
+    al enviar el mensaje se reutiliza el resultado terminado o se espera el que está en curso.
+    """
+    
+    EXTRAYENDO = "extrayendo"
+    LISTO = "listo"
+    CON_ERROR = "error"
+    
+    def __init__(self, al_terminar: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                 timeout_por_archivo: float = TIMEOUT_POR_ARCHIVO):
+        """
+        Inicializar la extracción en segundo plano
+        
+        Args:
+            al_terminar: Función (ruta, resultado) llamada desde el hilo de extracción
+                cuando termina cada archivo
+            timeout_por_archivo: Segundos máximos de extracción de cada archivo
+        """
+        self.al_terminar = al_terminar
+        self.timeout_por_archivo = timeout_por_archivo
+        # Los hilos solo esperan: la extracción en sí ocurre en los procesos de extracción
+        self._ejecutor = ThreadPoolExecutor(max_workers=MAX_PROCESOS_EXTRACCION,
+                                            thread_name_prefix="preextraccion")
+        self._tareas: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+    
+    def iniciar(self, ruta_archivo: str) -> Future:
+        """Empezar a extraer un archivo (si ya se está extrayendo, devuelve la misma tarea)"""
+        with self._lock:
+            tarea = self._tareas.get(ruta_archivo)
+            if tarea is None:
+                tarea = self._ejecutor.submit(self._extraer, ruta_archivo)
+                self._tareas[ruta_archivo] = tarea
+            return tarea
+    
+    def tareas(self, rutas: List[str]) -> List[Future]:
+        """Tareas de extracción de los archivos, en el mismo orden, iniciando las que falten"""
+        return [self.iniciar(ruta) for ruta in rutas]
+    
+    def estado(self, ruta_archivo: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Estado de la extracción de un archivo
+        
+        Returns:
+            (EXTRAYENDO, None), (LISTO o CON_ERROR, resultado) o (None, None) si no se inició
+        """
+        with self._lock:
+            tarea = self._tareas.get(ruta_archivo)
+        if tarea is None:
+            return None, None
+        if not tarea.done():
+            return self.EXTRAYENDO, None
+        resultado = tarea.result()
+        return (self.CON_ERROR if resultado["error"] else self.LISTO), resultado
+    
+    def descartar(self, ruta_archivo: str):
+        """Olvidar un archivo (quien ya tenga su tarea puede seguir esperándola)"""
+        with self._lock:
+            self._tareas.pop(ruta_archivo, None)
+    
+    def limpiar(self):
+        """Olvidar todos los archivos"""
+        with self._lock:
+            self._tareas.clear()
+    
+    def _extraer(self, ruta_archivo: str) -> Dict[str, Any]:
+        try:
+            resultado = extraer_archivos([ruta_archivo], self.timeout_por_archivo, forzar_procesos=True)[0]
+        except Exception as e:
+            resultado = _resultado_error(ruta_archivo, str(e))
+        origen = " (caché)" if resultado["desde_cache"] else ""
+        print(f"📄 Preextracción de {os.path.basename(ruta_archivo)}: {resultado['segundos']:.2f} s{origen}")
+        if self.al_terminar:
+            self.al_terminar(ruta_archivo, resultado)
+        return resultado
+
+def cerrar_pool(terminar: bool = False):
+    """
+    Cerrar los procesos de extracción (se vuelven a crear con la siguiente solicitud)
+    
+    Args:
+        terminar: Detener los procesos sin esperar a que terminen su tarea
+    """
+    global _pool
+    with _lock_pool:
+        pool, _pool = _pool, None
+    if pool is None:
+        return
+    if terminar:
+        pool.terminate()
+    else:
+        pool.close()
+    pool.join()
+
+def obtener_cache_extraccion() -> Optional[CacheExtraccion]:
+    """Caché de documentos extraídos (en cache/extraccion), o None si está desactivada"""
+    global _cache_extraccion
+    if not usar_cache_extraccion:
+        return None
+    with _lock_cache:
+        if _cache_extraccion is None:
+            _cache_extraccion = CacheExtraccion(os.path.join(os.path.dirname(__file__), 'cache', 'extraccion'))
+        return _cache_extraccion
+
+def _buscar_en_cache(ruta_archivo: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Resultado guardado para el archivo (o None) y la clave con la que guardarlo si falta"""
+    cache = obtener_cache_extraccion()
+    if cache is None:
+        return None, None
+    inicio = time.perf_counter()
+    try:
+        clave = cache.generar_clave(ruta_archivo, VERSION_EXTRACTOR)
+    except OSError:
+        # El error de lectura se informa al extraer
+        return None, None
+    documento = cache.obtener(clave)
+    if documento is None:
+        return None, clave
+    return _resultado(ruta_archivo, documento, time.perf_counter() - inicio, desde_cache=True), clave
+
+def _extraer_en_paralelo(archivos: List[str], timeout_por_archivo: float) -> List[Tuple[Dict[str, Any], bool]]:
+    try:
+        pool = _obtener_pool()
+    except (OSError, RuntimeError) as e:
+        print(f"⚠️ Extracción en paralelo no disponible, se extrae en serie: {e}")
+        return [_extraer_resultado(archivo) for archivo in archivos]
+    
+    inicio = time.perf_counter()
+    tareas = [pool.apply_async(_extraer_con_tiempo, (archivo,)) for archivo in archivos]
+    extraidos = []
+    hubo_timeout = False
+    for indice, (archivo, tarea) in enumerate(zip(archivos, tareas)):
+        # Los archivos que esperan un proceso libre empiezan más tarde: el plazo de cada uno
+        # se cuenta desde la tanda en la que le toca ejecutarse
+        plazo = inicio + timeout_por_archivo * (indice // MAX_PROCESOS_EXTRACCION + 1)
+        try:
+            documento, segundos = tarea.get(timeout=max(0.0, plazo - time.perf_counter()))
+            extraidos.append((_resultado(archivo, documento, segundos), documento["cacheable"]))
+        except multiprocessing.TimeoutError:
+            hubo_timeout = True
+            extraidos.append((_resultado_error(archivo, f"tiempo de extracción agotado ({timeout_por_archivo:g} s)",
+                                               time.perf_counter() - inicio), False))
+        except Exception as e:
+            extraidos.append((_resultado_error(archivo, str(e)), False))
+    
+    # Un proceso bloqueado en un archivo no debe retrasar las solicitudes siguientes
+    if hubo_timeout:
+        cerrar_pool(terminar=True)
+    return extraidos
+
+def _obtener_pool():
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            _pool = multiprocessing.get_context("spawn").Pool(MAX_PROCESOS_EXTRACCION)
+        return _pool
+
+def _extraer_con_tiempo(ruta_archivo: str) -> Tuple[Dict[str, Any], float]:
+    inicio = time.perf_counter()
+    documento = extraer_documento(ruta_archivo)
+    return documento, time.perf_counter() - inicio
+
+def _extraer_resultado(ruta_archivo: str) -> Tuple[Dict[str, Any], bool]:
+    try:
+        documento, segundos = _extraer_con_tiempo(ruta_archivo)
+        return _resultado(ruta_archivo, documento, segundos), documento["cacheable"]
+    except Exception as e:
+        return _resultado_error(ruta_archivo, str(e)), False
+
+def _resultado(ruta_archivo: str, documento: Dict[str, Any], segundos: float,
+               desde_cache: bool = False) -> Dict[str, Any]:
+    return {"archivo": ruta_archivo, "contenido": documento["texto"], "paginas": documento["paginas"],
+            "numeros_pagina": documento["numeros_pagina"], "total_paginas": documento["total_paginas"],
+            "completo": documento["completo"], "segundos": segundos, "desde_cache": desde_cache, "error": None}
+
+def _resultado_error(ruta_archivo: str, error: str, segundos: float = 0.0) -> Dict[str, Any]:
+    return {"archivo": ruta_archivo, "contenido": "", "paginas": [], "numeros_pagina": [], "total_paginas": 0,
+            "completo": False, "segundos": segundos, "desde_cache": False, "error": error}
+
+def _documento_de_resultado(resultado: Dict[str, Any]) -> Dict[str, Any]:
+    return {"texto": resultado["contenido"], "paginas": resultado["paginas"],
+            "numeros_pagina": resultado["numeros_pagina"], "total_paginas": resultado["total_paginas"],
+            "completo": resultado["completo"]}
+
+atexit.register(cerrar_pool, terminar=True)
+
+def extraer_texto(ruta_archivo: str) -> str:
+    """
+    Extraer el texto de un archivo según su extensión
+    
+    Args:
+        ruta_archivo: Ruta del archivo
+    
+    Returns:
+        Texto extraído, un aviso si el tipo no está soportado o el error de lectura
+    """
+    return extraer_documento(ruta_archivo)["texto"]
+
+def extraer_documento(ruta_archivo: str, paginas: Optional[Iterable[int]] = None,
+                      max_caracteres: Optional[int] = None, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Extraer un archivo como documento paginado con el texto normalizado
+    
+    Args:
+        ruta_archivo: Ruta del archivo
+        paginas: Números de página (desde 1) a extraer de un PDF; None para todas
+        max_caracteres: Dejar de extraer al reunir estos caracteres (la última página se corta)
+        max_tokens: Igual que max_caracteres, medido en tokens estimados
+    
+    Returns:
+        Diccionario con "texto" (páginas separadas por un salto de página), "paginas"
+        (desplazamiento de cada página en el texto), "numeros_pagina" (número de cada una
+        en el original; las páginas sin texto de un PDF se omiten), "total_paginas" (del
+        original), "completo" (False si se cortó por el límite) y "cacheable" (False para
+        avisos, errores y extracciones parciales, que no se guardan en la caché)
+    """
+    limite = max_caracteres
+    if max_tokens is not None:
+        limite = min(limite or max_tokens * CARACTERES_POR_TOKEN, max_tokens * CARACTERES_POR_TOKEN)
+    
+    nombre = ruta_archivo.lower()
+    try:
+        if nombre.endswith('.pdf') and PDF_DISPONIBLE:
+            import PyPDF2
+            with open(ruta_archivo, 'rb') as archivo:
+                lector = PyPDF2.PdfReader(archivo)
+                documento = _reunir_paginas(iterar_paginas_lector(lector, paginas), limite, len(lector.pages))
+        elif nombre.endswith('.docx') or (nombre.endswith('.doc') and zipfile.is_zipfile(ruta_archivo)):
+            # Un .doc que en realidad es un zip es un DOCX con la extensión cambiada
+            documento = _reunir_paginas([(1, extraer_texto_docx(ruta_archivo, limite))], limite)
+        elif nombre.endswith('.doc'):
+            aviso = (f"Archivo adjuntado: {os.path.basename(ruta_archivo)} (formato Word 97-2003 no soportado "
+                     "para extracción automática; guárdalo como DOCX o PDF)")
+            return _documento([aviso], cacheable=False)
+        elif nombre.endswith('.txt'):
+            texto, completo = leer_texto_txt(ruta_archivo, limite)
+            documento = _reunir_paginas([(1, texto)], limite)
+            documento["completo"] = documento["completo"] and completo
+        else:
+            aviso = f"Archivo adjuntado: {os.path.basename(ruta_archivo)} (tipo no soportado para extracción automática)"
+            return _documento([aviso], cacheable=False)
+    except Exception as e:
+        tipo = os.path.splitext(nombre)[1].lstrip('.').upper()
+        return _documento([f"Error al leer {tipo}: {str(e)}"], cacheable=False)
+    
+    if paginas is not None:
+        documento["cacheable"] = False
+    return documento
+
+def _reunir_paginas(paginas: Iterable[Tuple[int, str]], limite: Optional[int] = None,
+                    total_paginas: Optional[int] = None) -> Dict[str, Any]:
+    """Normalizar y unir las páginas hasta reunir el límite de caracteres (sin pedir las siguientes)"""
+    textos = []
+    numeros = []
+    completo = True
+    reunidos = 0
+    for numero, texto in paginas:
+        if limite is not None and reunidos >= limite:
+            completo = False
+            break
+        texto = normalizar_texto_extraido(texto)
+        if limite is not None and reunidos + len(texto) > limite:
+            texto = texto[:limite - reunidos]
+            completo = False
+        textos.append(texto)
+        numeros.append(numero)
+        reunidos += len(texto) + len(SEPARADOR_PAGINAS)
+    
+    # Cerrar el generador libera el archivo aunque se haya cortado antes del final
+    if hasattr(paginas, 'close'):
+        paginas.close()
+    return _documento(textos, cacheable=completo, numeros_pagina=numeros,
+                      total_paginas=total_paginas, completo=completo)
+
+def normalizar_texto_extraido(texto: str) -> str:
+    """
+    Normalizar el texto de una página: composición Unicode (NFC), saltos de línea de Unix,
+    sin caracteres nulos ni saltos de página (se reservan para separar páginas)
+    """
+    texto = unicodedata.normalize('NFC', texto)
+    return texto.replace('\r\n', '\n').replace('\r', '\n').replace('\f', '\n').replace('\x00', '')
+
+def _documento(paginas: List[str], cacheable: bool = True, numeros_pagina: Optional[List[int]] = None,
+               total_paginas: Optional[int] = None, completo: bool = True) -> Dict[str, Any]:
+    desplazamientos = []
+    posicion = 0
+    for pagina in paginas:
+        desplazamientos.append(posicion)
+        posicion += len(pagina) + len(SEPARADOR_PAGINAS)
+    return {"texto": SEPARADOR_PAGINAS.join(paginas), "paginas": desplazamientos,
+            "numeros_pagina": numeros_pagina if numeros_pagina is not None else list(range(1, len(paginas) + 1)),
+            "total_paginas": total_paginas if total_paginas is not None else len(paginas),
+            "completo": completo, "cacheable": cacheable}
+
+def iterar_paginas_pdf(ruta_archivo: str, paginas: Optional[Iterable[int]] = None,
+                       omitir_sin_texto: bool = True) -> Iterator[Tuple[int, str]]:
+    """
+    Extraer las páginas de un PDF de una en una, solo cuando se piden
+    
+    Args:
+        ruta_archivo: Ruta del archivo
+        paginas: Números de página (desde 1) en el orden deseado; None para todas.
+            Los números fuera del documento se ignoran
+        omitir_sin_texto: Saltar sin analizarlas las páginas que no tienen fuentes
+            (escaneos o solo imágenes), de las que no se obtendría texto
+    
+    Yields:
+        Tuplas (número de página, texto sin normalizar)
+    """
+    import PyPDF2
+    with open(ruta_archivo, 'rb') as archivo:
+        yield from iterar_paginas_lector(PyPDF2.PdfReader(archivo), paginas, omitir_sin_texto)
+
+def iterar_paginas_lector(lector, paginas: Optional[Iterable[int]] = None,
+                          omitir_sin_texto: bool = True) -> Iterator[Tuple[int, str]]:
+    """Como iterar_paginas_pdf, sobre un PyPDF2.PdfReader ya abierto"""
+    total = len(lector.pages)
+    numeros = range(1, total + 1) if paginas is None else paginas
+    for numero in numeros:
+        if not 1 <= numero <= total:
+            continue
+        pagina = lector.pages[numero - 1]
+        if omitir_sin_texto and not _pagina_con_fuentes(pagina):
+            continue
+        yield numero, pagina.extract_text() or ""
+
+def _pagina_con_fuentes(pagina) -> bool:
+    """Sin fuentes en sus recursos (ni en sus formularios XObject) una página no puede mostrar texto"""
+    try:
+        return _recursos_con_fuentes(pagina.get("/Resources"))
+    except Exception:
+        # Ante un PDF irregular es preferible intentar la extracción
+        return True
+
+def _recursos_con_fuentes(recursos, profundidad: int = 0) -> bool:
+    recursos = recursos.get_object() if recursos is not None else None
+    if not recursos:
+        return False
+    if recursos.get("/Font"):
+        return True
+    xobjects = recursos.get("/XObject")
+    if not xobjects or profundidad >= 5:
+        return False
+    for referencia in xobjects.get_object().values():
+        xobject = referencia.get_object()
+        if xobject.get("/Subtype") == "/Form" and _recursos_con_fuentes(xobject.get("/Resources"), profundidad + 1):
+            return True
+    return False
+
+def extraer_paginas_pdf(ruta_archivo: str) -> List[str]:
+    """Extrae el texto de cada página de un archivo PDF (las páginas sin texto quedan vacías)"""
+    import PyPDF2
+    with open(ruta_archivo, 'rb') as archivo:
+        lector = PyPDF2.PdfReader(archivo)
+        paginas = dict(iterar_paginas_lector(lector))
+        return [paginas.get(numero, "") for numero in range(1, len(lector.pages) + 1)]
+
+def extraer_texto_docx(ruta_archivo: str, max_caracteres: Optional[int] = None) -> str:
+    """
+    Extrae texto de un archivo DOCX (párrafos, títulos, listas y tablas en orden)
+    
+    Args:
+        ruta_archivo: Ruta del archivo
+        max_caracteres: Dejar de leer en cuanto se supera esta longitud
+    
+    Returns:
+        Una línea por bloque de iterar_bloques_docx
+    """
+    bloques = []
+    longitud = 0
+    for bloque in iterar_bloques_docx(ruta_archivo):
+        bloques.append(bloque)
+        longitud += len(bloque) + 1
+        if max_caracteres is not None and longitud > max_caracteres:
+            break
+    return "\n".join(bloques)
+
+# Espacios de nombres de WordprocessingML y del contenido alternativo (cuadros de texto)
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_MC = '{http://schemas.openxmlformats.org/markup-compatibility/2006}'
+# Nombres de estilo de título en inglés (como los guarda Word) y en español
+_PATRON_ESTILO_TITULO = re.compile(r'^(heading|t[ií]tulo)\s*(\d)$')
+
+def iterar_bloques_docx(ruta_archivo: str) -> Iterator[str]:
+    """
+    Leer word/document.xml del zip con análisis incremental, sin cargar el documento entero
+    
+    Args:
+        ruta_archivo: Ruta del archivo
+    
+    Yields:
+        En el orden del documento: títulos como "## Texto", elementos de lista como
+        "  - Texto" (dos espacios por nivel), filas de tabla como "| a | b |" y párrafos
+    """
+    with zipfile.ZipFile(ruta_archivo) as docx:
+        estilos = _estilos_docx(docx)
+        with docx.open('word/document.xml') as xml:
+            parrafos: List[List[str]] = []  # Texto del párrafo actual (se anidan en cuadros de texto)
+            tablas: List[Dict[str, Any]] = []  # Fila y celda actuales de cada tabla abierta
+            en_propiedades = 0  # Dentro de w:pPr, donde w:tab define tabulaciones y no es texto
+            en_alternativa = 0  # Dentro de mc:Fallback, copia del contenido de mc:Choice
+            
+            for evento, elemento in ET.iterparse(xml, events=("start", "end")):
+                etiqueta = elemento.tag
+                if etiqueta == f'{_MC}Fallback':
+                    en_alternativa += 1 if evento == "start" else -1
+                    if evento == "end":
+                        elemento.clear()
+                    continue
+                if en_alternativa:
+                    continue
+                if etiqueta == f'{_W}pPr':
+                    en_propiedades += 1 if evento == "start" else -1
+                    continue
+                
+                if evento == "start":
+                    if etiqueta == f'{_W}p':
+                        parrafos.append([])
+                    elif etiqueta == f'{_W}tbl':
+                        tablas.append({"fila": [], "celda": None})
+                    elif etiqueta == f'{_W}tr' and tablas:
+                        tablas[-1]["fila"] = []
+                    elif etiqueta == f'{_W}tc' and tablas:
+                        tablas[-1]["celda"] = []
+                    continue
+                
+                if etiqueta == f'{_W}t' and parrafos:
+                    parrafos[-1].append(elemento.text or "")
+                elif etiqueta == f'{_W}tab' and parrafos and not en_propiedades:
+                    parrafos[-1].append("\t")
+                elif etiqueta in (f'{_W}br', f'{_W}cr') and parrafos:
+                    parrafos[-1].append("\n")
+                elif etiqueta == f'{_W}p' and parrafos:
+                    texto = "".join(parrafos.pop()).strip()
+                    if texto:
+                        if tablas and tablas[-1]["celda"] is not None:
+                            tablas[-1]["celda"].append(texto)
+                        else:
+                            yield _formatear_parrafo_docx(elemento, texto, estilos)
+                    elemento.clear()
+                elif etiqueta == f'{_W}tc' and tablas:
+                    celda = " ".join(tablas[-1]["celda"] or [])
+                    tablas[-1]["fila"].append(" ".join(celda.split()).replace("|", "\\|"))
+                    tablas[-1]["celda"] = None
+                    elemento.clear()
+                elif etiqueta == f'{_W}tr' and tablas:
+                    fila = tablas[-1]["fila"]
+                    if any(fila):
+                        # Una tabla anidada queda como texto de la celda que la contiene
+                        if len(tablas) > 1 and tablas[-2]["celda"] is not None:
+                            tablas[-2]["celda"].append("; ".join(celda for celda in fila if celda))
+                        else:
+                            yield "| " + " | ".join(fila) + " |"
+                    elemento.clear()
+                elif etiqueta == f'{_W}tbl' and tablas:
+                    tablas.pop()
+                    elemento.clear()
+
+def _formatear_parrafo_docx(parrafo: ET.Element, texto: str,
+                           estilos: Tuple[Dict[str, int], Dict[str, int]]) -> str:
+    """Marcar el párrafo como título o como elemento de lista, por sus propiedades o su estilo"""
+    propiedades = parrafo.find(f'{_W}pPr')
+    if propiedades is None:
+        return texto
+    
+    niveles_titulo, niveles_lista = estilos
+    estilo = propiedades.find(f'{_W}pStyle')
+    estilo = estilo.get(f'{_W}val') if estilo is not None else None
+    nivel_titulo = niveles_titulo.get(estilo)
+    esquema = propiedades.find(f'{_W}outlineLvl')
+    if esquema is not None and esquema.get(f'{_W}val', '').isdigit() and int(esquema.get(f'{_W}val')) < 9:
+        nivel_titulo = int(esquema.get(f'{_W}val')) + 1
+    if nivel_titulo:
+        return f"{'#' * min(nivel_titulo, 6)} {texto}"
+    
+    profundidad = _nivel_lista(propiedades.find(f'{_W}numPr'))
+    if profundidad is None:
+        profundidad = niveles_lista.get(estilo)
+    if profundidad is not None:
+        return f"{'  ' * profundidad}- {texto}"
+    return texto
+
+def _nivel_lista(numeracion: Optional[ET.Element]) -> Optional[int]:
+    """Nivel (desde 0) de un w:numPr, o None si no hay numeración (numId 0 la quita)"""
+    if numeracion is None:
+        return None
+    lista = numeracion.find(f'{_W}numId')
+    if lista is not None and lista.get(f'{_W}val') == '0':
+        return None
+    nivel = numeracion.find(f'{_W}ilvl')
+    valor = nivel.get(f'{_W}val', '0') if nivel is not None else '0'
+    return int(valor) if valor.isdigit() else 0
+
+def _estilos_docx(docx: zipfile.ZipFile) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    Estilos de párrafo de word/styles.xml que son títulos o listas, incluidos los heredados
+    
+    Returns:
+        (nivel de título 1-9 por estilo, nivel de lista desde 0 por estilo)
+    """
+    try:
+        with docx.open('word/styles.xml') as xml:
+            raiz = ET.parse(xml).getroot()
+    except (KeyError, ET.ParseError):
+        return {}, {}
+    
+    niveles: Dict[str, int] = {}
+    listas: Dict[str, int] = {}
+    bases: Dict[str, str] = {}
+    for estilo in raiz.iter(f'{_W}style'):
+        if estilo.get(f'{_W}type') != 'paragraph':
+            continue
+        identificador = estilo.get(f'{_W}styleId')
+        nombre = estilo.find(f'{_W}name')
+        nombre = (nombre.get(f'{_W}val') or '').lower() if nombre is not None else ''
+        coincidencia = _PATRON_ESTILO_TITULO.match(nombre)
+        esquema = estilo.find(f'{_W}pPr/{_W}outlineLvl')
+        if coincidencia and int(coincidencia.group(2)) > 0:
+            niveles[identificador] = int(coincidencia.group(2))
+        elif nombre in ('title', 'título', 'titulo'):
+            niveles[identificador] = 1
+        elif esquema is not None and esquema.get(f'{_W}val', '').isdigit() and int(esquema.get(f'{_W}val')) < 9:
+            niveles[identificador] = int(esquema.get(f'{_W}val')) + 1
+        nivel_lista = _nivel_lista(estilo.find(f'{_W}pPr/{_W}numPr'))
+        if nivel_lista is not None:
+            listas[identificador] = nivel_lista
+        base = estilo.find(f'{_W}basedOn')
+        if base is not None:
+            bases[identificador] = base.get(f'{_W}val')
+    
+    # Un estilo propio basado en "Título 2" también es un título de nivel 2
+    for heredados in (niveles, listas):
+        for identificador in bases:
+            actual = identificador
+            for _ in range(10):
+                if actual in heredados or actual not in bases:
+                    break
+                actual = bases[actual]
+            if actual in heredados:
+                heredados.setdefault(identificador, heredados[actual])
+    return niveles, listas
+
+def extraer_texto_txt(ruta_archivo: str, max_caracteres: Optional[int] = None,
+                      consulta: Optional[str] = None) -> str:
+    """Extrae texto de un archivo TXT (ver leer_texto_txt)"""
+    return leer_texto_txt(ruta_archivo, max_caracteres, consulta)[0]
+
+def leer_texto_txt(ruta_archivo: str, max_caracteres: Optional[int] = None, consulta: Optional[str] = None,
+                   max_bytes: int = MAX_BYTES_TXT) -> Tuple[str, bool]:
+    """
+    Leer un TXT mapeado en memoria, detectando su codificación y decodificando por bloques
+    
+    Args:
+        ruta_archivo: Ruta del archivo
+        max_caracteres: Dejar de decodificar al superar estos caracteres (se lee el inicio)
+        consulta: Pregunta del usuario, para elegir las ventanas de un archivo muestreado
+        max_bytes: Tamaño a partir del cual el archivo se muestrea en lugar de leerse entero
+    
+    Returns:
+        (texto, completo): completo es False si el texto es una muestra o se cortó
+    """
+    with open(ruta_archivo, 'rb') as archivo:
+        tamano = os.fstat(archivo.fileno()).st_size
+        if tamano == 0:
+            return "", True
+        with mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as datos:
+            codificacion, inicio = detectar_codificacion(datos[:64 * 1024])
+            if max_caracteres is not None or tamano - inicio <= max_bytes:
+                return _decodificar(datos, inicio, tamano, codificacion, max_caracteres)
+            return _muestrear_texto(datos, inicio, codificacion, max_bytes, consulta), False
+
+def detectar_codificacion(muestra: bytes) -> Tuple[str, int]:
+    """
+    Detectar la codificación de un texto por su BOM o, sin BOM, por heurísticas:
+    bytes nulos alternos (UTF-16), UTF-8 válido, o Windows-1252 / Latin-1
+    
+    Args:
+        muestra: Primeros bytes del archivo
+    
+    Returns:
+        (nombre del códec, bytes del BOM que hay que saltar)
+    """
+    for bom, codificacion in _BOMS:
+        if muestra.startswith(bom):
+            return codificacion, len(bom)
+    
+    if b'\x00' in muestra:
+        nulos_pares = muestra[0::2].count(0)
+        nulos_impares = muestra[1::2].count(0)
+        mitad = max(len(muestra) // 2, 1)
+        if nulos_impares > 0.3 * mitad and nulos_pares < 0.05 * mitad:
+            return 'utf-16-le', 0
+        if nulos_pares > 0.3 * mitad and nulos_impares < 0.05 * mitad:
+            return 'utf-16-be', 0
+    
+    try:
+        # final=False: la muestra puede cortar un carácter multibyte al final
+        codecs.getincrementaldecoder('utf-8')().decode(muestra, final=False)
+        return 'utf-8', 0
+    except UnicodeDecodeError:
+        pass
+    # Bytes que Windows-1252 no define delatan Latin-1
+    if any(byte in muestra for byte in (b'\x81', b'\x8d', b'\x8f', b'\x90', b'\x9d')):
+        return 'latin-1', 0
+    return 'cp1252', 0
+
+def _decodificar(datos: mmap.mmap, inicio: int, fin: int, codificacion: str,
+                 max_caracteres: Optional[int] = None) -> Tuple[str, bool]:
+    """Decodificar un rango por bloques; devuelve el texto y si se llegó al final del rango"""
+    decodificador = codecs.getincrementaldecoder(codificacion)(errors='replace')
+    partes = []
+    reunidos = 0
+    for posicion in range(inicio, fin, TAMANO_BLOQUE_TXT):
+        parte = decodificador.decode(datos[posicion:min(posicion + TAMANO_BLOQUE_TXT, fin)])
+        partes.append(parte)
+        reunidos += len(parte)
+        if max_caracteres is not None and reunidos > max_caracteres:
+            return "".join(partes), False
+    partes.append(decodificador.decode(b"", final=True))
+    return "".join(partes), True
+
+def _muestrear_texto(datos: mmap.mmap, inicio: int, codificacion: str, max_bytes: int,
+                     consulta: Optional[str]) -> str:
+    """Inicio y final del archivo y, con consulta, las ventanas que más términos suyos contienen"""
+    fin = len(datos)
+    extremo = max_bytes // 4 if consulta else max_bytes // 2
+    rangos = [(inicio, inicio + extremo)]
+    if consulta:
+        rangos += _ventanas_coincidentes(datos, inicio + extremo, fin - extremo, codificacion,
+                                         consulta, max_bytes - 2 * extremo)
+    rangos.append((fin - extremo, fin))
+    
+    # Las ventanas contiguas se unen; los cortes se mueven al salto de línea más cercano
+    unidos: List[List[int]] = []
+    for desde, hasta in rangos:
+        if unidos and desde <= unidos[-1][1]:
+            unidos[-1][1] = max(unidos[-1][1], hasta)
+        else:
+            unidos.append([desde, hasta])
+    
+    ancho = _ancho_codificacion(codificacion)
+    partes = [f"[Archivo de {(fin - inicio) / (1024 * 1024):.1f} MB: se incluyen el inicio, el final"
+              + (" y las partes relacionadas con la pregunta" if len(unidos) > 2 else "") + "]\n"]
+    anterior = inicio
+    for desde, hasta in unidos:
+        desde, hasta = _alinear_rango(datos, desde, hasta, inicio, fin, ancho)
+        if desde > anterior:
+            partes.append(f"\n[... {desde - anterior:,} bytes omitidos ...]\n")
+        partes.append(_decodificar(datos, desde, hasta, codificacion)[0])
+        anterior = hasta
+    return "".join(partes)
+
+def _ventanas_coincidentes(datos: mmap.mmap, desde: int, hasta: int, codificacion: str,
+                           consulta: str, presupuesto: int) -> List[Tuple[int, int]]:
+    """Ventanas de TAMANO_VENTANA_TXT bytes que contienen más términos de la consulta (los raros pesan más)"""
+    variantes = _variantes_consulta(consulta, codificacion)
+    if not variantes or hasta <= desde:
+        return []
+    
+    # mmap.find recorre el mapa en memoria sin copiarlo; cada variante tiene un cupo de
+    # coincidencias para que un término muy frecuente no impida encontrar los demás
+    ventanas: Dict[int, set] = {}
+    apariciones: Dict[str, int] = {}
+    cupo = max(1, MAX_COINCIDENCIAS_TXT // len(variantes))
+    for variante, termino in variantes.items():
+        posicion = datos.find(variante, desde, hasta)
+        encontradas = 0
+        while posicion >= 0 and encontradas < cupo:
+            ventanas.setdefault((posicion - desde) // TAMANO_VENTANA_TXT, set()).add(termino)
+            encontradas += 1
+            posicion = datos.find(variante, posicion + len(variante), hasta)
+        apariciones[termino] = apariciones.get(termino, 0) + encontradas
+    
+    def relevancia(ventana):
+        return -sum(1.0 / apariciones[termino] for termino in ventanas[ventana]), ventana
+    
+    elegidas = sorted(sorted(ventanas, key=relevancia)[:max(1, presupuesto // TAMANO_VENTANA_TXT)])
+    return [(desde + ventana * TAMANO_VENTANA_TXT, min(desde + (ventana + 1) * TAMANO_VENTANA_TXT, hasta))
+            for ventana in elegidas]
+
+def _variantes_consulta(consulta: str, codificacion: str) -> Dict[bytes, str]:
+    """Términos de la consulta en bytes (con y sin acentos, minúsculas, capitalizados y mayúsculas)"""
+    # En UTF-16/32 un término en bytes podría coincidir a mitad de un carácter
+    if _ancho_codificacion(codificacion) > 1:
+        return {}
+    from cache_semantica import PALABRAS_VACIAS
+    
+    variantes: Dict[bytes, str] = {}
+    for palabra in re.findall(r'\w{4,}', consulta.lower()):
+        termino = normalizar_texto(palabra).strip()
+        if not termino or termino in PALABRAS_VACIAS:
+            continue
+        for forma in {palabra, termino}:
+            for variante in (forma, forma.capitalize(), forma.upper()):
+                try:
+                    variantes[variante.encode(codificacion)] = termino
+                except UnicodeEncodeError:
+                    pass
+    return variantes
+
+def _ancho_codificacion(codificacion: str) -> int:
+    return 4 if '32' in codificacion else 2 if '16' in codificacion else 1
+
+def _alinear_rango(datos: mmap.mmap, desde: int, hasta: int, inicio: int, fin: int, ancho: int) -> Tuple[int, int]:
+    """Llevar los extremos interiores a un límite de línea (o de carácter en UTF-16/32)"""
+    if ancho > 1:
+        return desde - (desde - inicio) % ancho, hasta - (hasta - inicio) % ancho
+    if desde > inicio:
+        salto = datos.find(b'\n', desde, hasta)
+        if salto >= 0:
+            desde = salto + 1
+    if hasta < fin:
+        salto = datos.rfind(b'\n', desde, hasta)
+        if salto >= 0:
+            hasta = salto + 1
+    return desde, hasta
@@ -0,0 +1,307 @@
+"""
+Índice invertido BM25 sobre las sesiones guardadas en historial/
+
+Cada conversación de una sesión (pregunta y respuesta) es un documento. El índice se
+actualiza de forma incremental al guardar cada sesión y se persiste en disco, de modo
+que las preguntas ya resueltas en sesiones anteriores se pueden responder sin la IA o
+aportar contexto compacto al prompt.
+"""
+import glob
+import json
+import math
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from cache_semantica import normalizar_mensaje
+from detector_intenciones import detectar_intenciones
+from normalizacion import SEPARADOR_ADJUNTOS, normalizar_texto
+
+VERSION_INDICE = 3
+
+TITULO_FRAGMENTOS_HISTORIAL = "Conversaciones anteriores relacionadas (úsalas solo si son pertinentes):"
+
+class IndiceBM25:
+    """Búsqueda BM25 sobre preguntas y respuestas de sesiones anteriores"""
+    
+    def __init__(self, archivo_indice: str, k1: float = 1.5, b: float = 0.75,
+                 umbral_respuesta_directa: float = 0.8, min_terminos: int = 2):
+        """
+        Inicializar el índice (se lee de disco con la primera búsqueda)
+        
+        Args:
+            archivo_indice: JSON donde se persiste el índice
+            k1: Saturación de la frecuencia de términos
+            b: Normalización por longitud del documento
+            umbral_respuesta_directa: Coincidencia mínima (Jaccard) entre los términos de la
+                pregunta y los de la pregunta guardada para reutilizar su respuesta
+            min_terminos: Términos mínimos de la consulta para buscar
+        """
+        self.archivo_indice = archivo_indice
+        self.k1 = k1
+        self.b = b
+        self.umbral_respuesta_directa = umbral_respuesta_directa
+        self.min_terminos = min_terminos
+        
+        self._lock = threading.Lock()
+        self._cargado = False
+        self._sesiones: Dict[str, int] = {}  # inicio de la sesión → conversaciones ya indexadas
+        self._archivos: Dict[str, float] = {}  # archivo → fecha de modificación indexada
+        self._documentos: List[Dict[str, Any]] = []
+        self._invertido: Dict[str, List[List[int]]] = {}  # término → [[documento, frecuencia], ...]
+        self._longitud_total = 0
+        self._ultima_busqueda = None
+        
+        self.respuestas_directas = 0
+        self.busquedas = 0
+    
+    def sincronizar(self, directorio: str) -> int:
+        """
+        Indexar las sesiones del directorio nuevas o guardadas de nuevo desde la última vez
+        
+        Args:
+            directorio: Carpeta con los archivos conversacion_*.json
+        
+        Returns:
+            Número de conversaciones agregadas
+        """
+        self._cargar()
+        pendientes = [ruta for ruta in sorted(glob.glob(os.path.join(directorio, '*.json')))
+                      if self._archivos.get(os.path.basename(ruta)) != self._fecha_modificacion(ruta)]
+        agregadas = sum(self.agregar_sesion(ruta, guardar=False) for ruta in pendientes)
+        if pendientes:
+            self._guardar()
+        return agregadas
+    
+    def agregar_sesion(self, ruta_sesion: str, guardar: bool = True) -> int:
+        """
+        Agregar al índice las conversaciones de una sesión guardada que aún no están en él
+        
+        Args:
+            ruta_sesion: Archivo JSON de la sesión
+            guardar: Persistir el índice al terminar
+        
+        Returns:
+            Número de conversaciones agregadas
+        """
+        self._cargar()
+        nombre = os.path.basename(ruta_sesion)
+        fecha_modificacion = self._fecha_modificacion(ruta_sesion)
+        try:
+            with open(ruta_sesion, 'r', encoding='utf-8') as f:
+                sesion = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Sesión no indexada ({nombre}): {e}")
+            return 0
+        
+        # Una sesión se guarda varias veces a medida que crece (y pudo quedar en varios archivos):
+        # se identifica por su inicio y solo se agregan las conversaciones posteriores a las indexadas
+        clave = str(sesion.get("inicio") or nombre)
+        conversaciones = sesion.get("conversaciones", [])
+        agregadas = 0
+        with self._lock:
+            indexadas = self._sesiones.get(clave, 0)
+            for conversacion in conversaciones[indexadas:]:
+                agregadas += self._agregar_conversacion(conversacion, nombre)
+            self._sesiones[clave] = max(indexadas, len(conversaciones))
+            self._archivos[nombre] = fecha_modificacion
+            self._ultima_busqueda = None
+        
+        if guardar:
+            self._guardar()
+        return agregadas
+    
+    def buscar(self, consulta: str, k: int = 3) -> List[Dict[str, Any]]:
+        """
+        Conversaciones anteriores más relevantes para una consulta
+        
+        Args:
+            consulta: Pregunta del usuario (sin adjuntos)
+            k: Número máximo de resultados
+        
+        Returns:
+            Documentos ordenados por puntuación BM25, cada uno con su "puntuacion"
+            y la "coincidencia" (Jaccard) entre las dos preguntas
+        """
+        self._cargar()
+        terminos = normalizar_mensaje(consulta)
+        if len(terminos) < self.min_terminos:
+            return []
+        
+        with self._lock:
+            # La misma consulta se repite al decidir la respuesta directa y al construir el prompt
+            clave = (tuple(terminos), k)
+            if self._ultima_busqueda and self._ultima_busqueda[0] == clave:
+                return self._ultima_busqueda[1]
+            
+            self.busquedas += 1
+            total = len(self._documentos)
+            if not total:
+                return []
+            longitud_media = self._longitud_total / total
+            
+            puntuaciones: Dict[int, float] = {}
+            for termino in set(terminos):
+                apariciones = self._invertido.get(termino)
+                if not apariciones:
+                    continue
+                idf = math.log(1.0 + (total - len(apariciones) + 0.5) / (len(apariciones) + 0.5))
+                for documento, frecuencia in apariciones:
+                    longitud = self._documentos[documento]["longitud"]
+                    norma = self.k1 * (1.0 - self.b + self.b * longitud / longitud_media)
+                    puntuaciones[documento] = (puntuaciones.get(documento, 0.0)
+                                               + idf * frecuencia * (self.k1 + 1.0) / (frecuencia + norma))
+            
+            consulta_conjunto = set(terminos)
+            resultados = []
+            for documento, puntuacion in sorted(puntuaciones.items(), key=lambda p: -p[1])[:k]:
+                pregunta_conjunto = set(self._documentos[documento]["terminos_pregunta"])
+                union = consulta_conjunto | pregunta_conjunto
+                resultados.append(dict(self._documentos[documento], puntuacion=puntuacion,
+                                       coincidencia=len(consulta_conjunto & pregunta_conjunto) / len(union)))
+            self._ultima_busqueda = (clave, resultados)
+            return resultados
+    
+    def respuesta_directa(self, consulta: str, rol: Optional[str], contexto: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Conversación anterior cuya respuesta se puede reutilizar tal cual
+        
+        Args:
+            consulta: Pregunta del usuario (sin adjuntos)
+            rol: Rol detectado en la pregunta
+            contexto: Contexto QA detectado en la pregunta
+        
+        Returns:
+            El documento, o None si ninguna pregunta anterior es prácticamente la misma
+        """
+        # Sin contexto QA la pregunta suele depender de turnos anteriores ("dame 5 casos más")
+        if contexto is None:
+            return None
+        for resultado in self.buscar(consulta):
+            if (resultado["reutilizable"] and resultado["coincidencia"] >= self.umbral_respuesta_directa
+                    and resultado["rol"] == rol and resultado["contexto_qa"] == contexto):
+                self.respuestas_directas += 1
+                return resultado
+        return None
+    
+    def fragmentos(self, consulta: str, k: int = 3, max_caracteres: int = 600) -> str:
+        """
+        Contexto compacto con las conversaciones anteriores más relevantes
+        
+        Args:
+            consulta: Pregunta del usuario (sin adjuntos)
+            k: Número máximo de conversaciones
+            max_caracteres: Longitud máxima de cada respuesta incluida
+        
+        Returns:
+            Texto con una pregunta y respuesta abreviada por conversación, o "" si no hay
+        """
+        resultados = self.buscar(consulta, k)
+        bloques = []
+        for resultado in resultados:
+            # Las coincidencias mucho más débiles que la mejor solo añadirían ruido
+            if resultado["puntuacion"] < 0.5 * resultados[0]["puntuacion"]:
+                break
+            respuesta = " ".join(resultado["respuesta"].split())
+            if len(respuesta) > max_caracteres:
+                respuesta = respuesta[:max_caracteres].rsplit(" ", 1)[0] + " [...]"
+            pregunta = resultado["pregunta"][:300]
+            bloques.append(f"- Pregunta ({resultado['fecha'][:10]}): {pregunta}\n  Respuesta: {respuesta}")
+        return "\n".join(bloques)
+    
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        """
+        Tamaño y uso del índice
+        
+        Returns:
+            Diccionario con sesiones, documentos, términos, búsquedas y respuestas directas
+        """
+        self._cargar()
+        with self._lock:
+            return {
+                "sesiones": len(self._sesiones),
+                "documentos": len(self._documentos),
+                "terminos": len(self._invertido),
+                "busquedas": self.busquedas,
+                "respuestas_directas": self.respuestas_directas
+            }
+    
+    def _agregar_conversacion(self, conversacion: Dict[str, Any], sesion: str) -> int:
+        pregunta = str(conversacion.get("usuario") or "").split(SEPARADOR_ADJUNTOS, 1)[0].strip()
+        respuesta = str(conversacion.get("bot") or "").strip()
+        # Las respuestas predefinidas (también las de respaldo cuando falló la IA) y las que se
+        # cortaron a mitad no aportan conocimiento
+        if (not pregunta or not respuesta or not conversacion.get("fue_ia", True)
+                or conversacion.get("respaldo_local", False) or conversacion.get("incompleta", False)):
+            return 0
+        
+        terminos_pregunta = normalizar_mensaje(pregunta)
+        terminos = Counter(terminos_pregunta + normalizar_mensaje(respuesta))
+        if not terminos:
+            return 0
+        
+        intenciones = detectar_intenciones(normalizar_texto(pregunta))
+        documento = len(self._documentos)
+        self._documentos.append({
+            "pregunta": pregunta,
+            "respuesta": respuesta,
+            "fecha": str(conversacion.get("timestamp") or ""),
+            "sesion": sesion,
+            "rol": intenciones["rol"],
+            "contexto_qa": intenciones["contexto_qa"],
+            # Con adjuntos la respuesta depende del documento, no solo de la pregunta, y sin contexto
+            # QA la pregunta suele depender de los turnos anteriores de su sesión
+            "reutilizable": not conversacion.get("con_adjuntos", False) and intenciones["contexto_qa"] is not None,
+            "terminos_pregunta": sorted(set(terminos_pregunta)),
+            "longitud": sum(terminos.values())
+        })
+        for termino, frecuencia in terminos.items():
+            self._invertido.setdefault(termino, []).append([documento, frecuencia])
+        self._longitud_total += sum(terminos.values())
+        return 1
+    
+    def _fecha_modificacion(self, ruta: str) -> float:
+        try:
+            return os.path.getmtime(ruta)
+        except OSError:
+            return 0.0
+    
+    def _cargar(self):
+        if self._cargado:
+            return
+        with self._lock:
+            if self._cargado:
+                return
+            try:
+                with open(self.archivo_indice, 'r', encoding='utf-8') as f:
+                    datos = json.load(f)
+                if datos.get("version") == VERSION_INDICE:
+                    self._sesiones = datos["sesiones"]
+                    self._archivos = datos["archivos"]
+                    self._documentos = datos["documentos"]
+                    self._invertido = datos["invertido"]
+                    self._longitud_total = sum(documento["longitud"] for documento in self._documentos)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Índice del historial inválido, se reconstruye: {e}")
+            self._cargado = True
+    
+    def _guardar(self):
+        with self._lock:
+            datos = {
+                "version": VERSION_INDICE,
+                "sesiones": self._sesiones,
+                "archivos": self._archivos,
+                "documentos": self._documentos,
+                "invertido": self._invertido
+            }
+            try:
+                os.makedirs(os.path.dirname(self.archivo_indice), exist_ok=True)
+                temporal = f"{self.archivo_indice}.tmp"
+                with open(temporal, 'w', encoding='utf-8') as f:
+                    json.dump(datos, f, ensure_ascii=False)
+                os.replace(temporal, self.archivo_indice)
+            except OSError as e:
+                print(f"Error guardando el índice del historial: {e}")
@@ -0,0 +1,21 @@
+"""
+Estadísticas simples de latencia compartidas por el chatbot, el ejecutor por lotes y los benchmarks
+"""
+from typing import List
+
+def percentil(valores: List[float], porcentaje: float) -> float:
+    """
+    Calcular un percentil por el método del rango más cercano
+    
+    Args:
+        valores: Muestras
+        porcentaje: Percentil deseado (0-100)
+    
+    Returns:
+        Valor del percentil o 0.0 si no hay muestras
+    """
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, int(round(porcentaje / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[indice]
@@ -0,0 +1,65 @@
+"""
+Normalización de los mensajes del usuario (sin acentos, puntuación ni mayúsculas) calculada una vez por solicitud
+"""
+import re
+import unicodedata
+from functools import cached_property
+from typing import Any, Dict
+
+SEPARADOR_ADJUNTOS = "--- ARCHIVOS ADJUNTOS ---"
+
+PATRON_NO_PALABRA = re.compile(r'\W+')
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Normalizar un texto para comparar palabras clave
+    
+    Descompone los caracteres (NFKD) y elimina los acentos, pasa a minúsculas y
+    reemplaza la puntuación y los espacios repetidos por un único espacio.
+    
+    Args:
+        texto: Texto original
+    
+    Returns:
+        Texto normalizado, por ejemplo "¿Actúa como QA?" → "actua como qa"
+    """
+    descompuesto = unicodedata.normalize('NFKD', texto)
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return PATRON_NO_PALABRA.sub(" ", sin_acentos.lower()).strip()
+
+class SolicitudChat(str):
+    """
+    Mensaje del usuario con su pregunta, su texto normalizado y sus intenciones
+    calculados una sola vez, en el momento en que se necesitan.
+    
+    Hereda de str para poder pasarse a cualquier método que espera el mensaje
+    original; los detectores reconocen la solicitud y reutilizan lo ya calculado.
+    """
+    
+    @cached_property
+    def pregunta(self) -> str:
+        """Pregunta del usuario sin el contenido de los adjuntos"""
+        indice = self.find(SEPARADOR_ADJUNTOS)
+        return str(self) if indice < 0 else str(self[:indice])
+    
+    @cached_property
+    def tiene_adjuntos(self) -> bool:
+        """Indica si el mensaje incluye archivos adjuntos"""
+        return len(self.pregunta) < len(self)
+    
+    @cached_property
+    def texto_normalizado(self) -> str:
+        """Pregunta normalizada con normalizar_texto"""
+        return normalizar_texto(self.pregunta)
+    
+    @cached_property
+    def intenciones(self) -> Dict[str, Any]:
+        """Intenciones detectadas en la pregunta (ver detector_intenciones)"""
+        # Importación diferida: el detector normaliza sus palabras clave con este módulo
+        from detector_intenciones import detectar_intenciones
+        return detectar_intenciones(self.texto_normalizado)
+    
+    @classmethod
+    def desde(cls, mensaje: str) -> "SolicitudChat":
+        """Devolver la misma solicitud si ya lo es, o crearla a partir del texto"""
+        return mensaje if isinstance(mensaje, cls) else cls(mensaje)
@@ -0,0 +1,107 @@
+"""
+Políticas de generación por tipo de solicitud (tokens de salida, temperatura y secuencias de parada)
+"""
+import copy
+import json
+import os
+from typing import Any, Dict, Optional
+
+# Tipos de solicitud (intenciones) reconocidos por el chatbot
+CHAT_SIMPLE = "chat_simple"
+ROL = "rol"
+CONTEXTO_QA = "contexto_qa"
+CASOS_PRUEBA = "casos_prueba"
+MANUAL_USUARIO = "manual_usuario"
+ANALISIS_ARCHIVOS = "analisis_archivos"
+CONSULTA_TECNICA = "consulta_tecnica"
+EXTRACCION_FRAGMENTO = "extraccion_fragmento"
+RESUMEN_CONVERSACION = "resumen_conversacion"
+
+# Los saludos se cortan pronto; las suites de casos de prueba y los manuales necesitan espacio
+POLITICAS_POR_DEFECTO: Dict[str, Dict[str, Any]] = {
+    CHAT_SIMPLE: {"max_output_tokens": 256, "temperature": 0.8, "stop_sequences": ["\nUsuario:"]},
+    ROL: {"max_output_tokens": 2048, "temperature": 0.7, "stop_sequences": ["\nUsuario:"]},
+    CONTEXTO_QA: {"max_output_tokens": 4096, "temperature": 0.4},
+    CASOS_PRUEBA: {"max_output_tokens": 8192, "temperature": 0.3},
+    MANUAL_USUARIO: {"max_output_tokens": 8192, "temperature": 0.4},
+    ANALISIS_ARCHIVOS: {"max_output_tokens": 4096, "temperature": 0.3},
+    CONSULTA_TECNICA: {"max_output_tokens": 2048, "temperature": 0.6, "stop_sequences": ["\nUsuario:"]},
+    EXTRACCION_FRAGMENTO: {"max_output_tokens": 1024, "temperature": 0.2},
+    RESUMEN_CONVERSACION: {"max_output_tokens": 512, "temperature": 0.2}
+}
+
+class PoliticasGeneracion:
+    """
+    Tabla de configuraciones de generación por intención.
+    
+    Los valores por defecto se pueden sobrescribir con un archivo JSON con la misma
+    forma, por ejemplo {"chat_simple": {"max_output_tokens": 512}}. Un valor null
+    elimina el parámetro de esa intención.
+    """
+    
+    def __init__(self, archivo_config: Optional[str] = None):
+        """
+        Inicializar las políticas
+        
+        Args:
+            archivo_config: Ruta del JSON con las políticas a sobrescribir (opcional)
+        """
+        self.archivo_config = archivo_config
+        self.politicas = copy.deepcopy(POLITICAS_POR_DEFECTO)
+        if archivo_config:
+            self.sobrescribir(self.cargar_configuracion(archivo_config))
+    
+    def cargar_configuracion(self, archivo_config: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Leer las políticas a sobrescribir desde un archivo JSON
+        
+        Args:
+            archivo_config: Ruta del archivo
+        
+        Returns:
+            Diccionario intención → parámetros (vacío si no existe o no es válido)
+        """
+        if not os.path.exists(archivo_config):
+            return {}
+        try:
+            with open(archivo_config, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error leyendo políticas de generación de {archivo_config}: {e}")
+            return {}
+    
+    def sobrescribir(self, cambios: Dict[str, Dict[str, Any]]):
+        """
+        Sobrescribir parámetros de una o varias intenciones
+        
+        Args:
+            cambios: Diccionario intención → parámetros
+        """
+        for intencion, parametros in cambios.items():
+            politica = self.politicas.setdefault(intencion, {})
+            for parametro, valor in (parametros or {}).items():
+                if valor is None:
+                    politica.pop(parametro, None)
+                else:
+                    politica[parametro] = valor
+    
+    def obtener(self, intencion: str, base: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Configuración de generación para una intención
+        
+        Args:
+            intencion: Tipo de solicitud
+            base: Configuración general del chatbot, sobre la que se aplica la política
+        
+        Returns:
+            Nueva configuración combinada (la política tiene prioridad)
+        """
+        configuracion = dict(base or {})
+        configuracion.update(copy.deepcopy(self.politicas.get(intencion, {})))
+        return configuracion
+    
+    @staticmethod
+    def describir(intencion: str, configuracion: Dict[str, Any]) -> str:
+        """Texto breve de la política aplicada, para el registro por llamada"""
+        parametros = ", ".join(f"{clave}={valor!r}" for clave, valor in sorted(configuracion.items()))
+        return f"{intencion} ({parametros or 'valores del modelo'})"
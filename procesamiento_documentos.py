@@ -0,0 +1,159 @@
+"""
+Procesamiento map-reduce de documentos adjuntos grandes
+"""
+import asyncio
+import re
+from typing import Awaitable, Callable, List, Optional
+
+# Encabezados típicos de documentos de requisitos: "# Título", "1.2 Título", "CAPÍTULO 3", etc.
+PATRON_ENCABEZADO = re.compile(
+    r'^(#{1,6}\s+\S.*|\d+(\.\d+)*\.?\s+[A-ZÁÉÍÓÚÑ].{0,80}|[A-ZÁÉÍÓÚÑ0-9][A-ZÁÉÍÓÚÑ0-9 \-:]{3,80})$'
+)
+PATRON_ARCHIVO = re.compile(r'^--- CONTENIDO DE .+ ---$')
+
+def dividir_en_secciones(texto: str) -> List[str]:
+    """
+    Dividir un texto en secciones según saltos de página, archivos y encabezados
+    
+    Args:
+        texto: Contenido extraído de los archivos
+    
+    Returns:
+        Lista de secciones en el orden original
+    """
+    secciones = []
+    actual = []
+    for linea in texto.split('\n'):
+        # Un salto de página (\f) también cierra la sección actual
+        partes = linea.split('\f')
+        for indice, parte in enumerate(partes):
+            limpia = parte.strip()
+            nueva_seccion = indice > 0 or PATRON_ARCHIVO.match(limpia) or (
+                limpia and PATRON_ENCABEZADO.match(limpia))
+            if nueva_seccion and any(l.strip() for l in actual):
+                secciones.append('\n'.join(actual))
+                actual = []
+            actual.append(parte)
+    if any(l.strip() for l in actual):
+        secciones.append('\n'.join(actual))
+    return secciones
+
+def dividir_en_fragmentos(texto: str, max_caracteres: int = 24000) -> List[str]:
+    """
+    Agrupar las secciones de un texto en fragmentos de tamaño acotado
+    
+    Args:
+        texto: Contenido extraído de los archivos
+        max_caracteres: Tamaño máximo de cada fragmento
+    
+    Returns:
+        Lista de fragmentos que respetan, en lo posible, los límites de sección
+    """
+    fragmentos = []
+    actual = ""
+    for seccion in dividir_en_secciones(texto):
+        # Las secciones más grandes que un fragmento se parten por párrafos
+        piezas = [seccion] if len(seccion) <= max_caracteres else _partir_seccion(seccion, max_caracteres)
+        for pieza in piezas:
+            if actual and len(actual) + len(pieza) + 1 > max_caracteres:
+                fragmentos.append(actual)
+                actual = ""
+            actual = f"{actual}\n{pieza}" if actual else pieza
+    if actual.strip():
+        fragmentos.append(actual)
+    return fragmentos
+
+def _partir_seccion(seccion: str, max_caracteres: int) -> List[str]:
+    piezas = []
+    actual = ""
+    for parrafo in re.split(r'\n\s*\n', seccion):
+        while len(parrafo) > max_caracteres:
+            piezas.append(parrafo[:max_caracteres])
+            parrafo = parrafo[max_caracteres:]
+        if actual and len(actual) + len(parrafo) + 2 > max_caracteres:
+            piezas.append(actual)
+            actual = ""
+        actual = f"{actual}\n\n{parrafo}" if actual else parrafo
+    if actual.strip():
+        piezas.append(actual)
+    return piezas
+
+class ProcesadorMapReduce:
+    """Condensa documentos grandes con llamadas concurrentes por fragmento"""
+    
+    def __init__(self, generar: Callable[[str], Awaitable[str]], max_paralelo: int = 4,
+                 tamano_fragmento: int = 24000):
+        """
+        Inicializar el procesador
+        
+        Args:
+            generar: Corrutina que envía un prompt al modelo y devuelve el texto
+            max_paralelo: Máximo de llamadas simultáneas al modelo
+            tamano_fragmento: Tamaño máximo en caracteres de cada fragmento
+        """
+        self.generar = generar
+        self.max_paralelo = max_paralelo
+        self.tamano_fragmento = tamano_fragmento
+    
+    async def condensar(self, pregunta: str, contenido: str,
+                        callback_progreso: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Extraer de cada fragmento la información relevante para la pregunta (fase map)
+        
+        Args:
+            pregunta: Solicitud del usuario
+            contenido: Texto completo de los archivos adjuntos
+            callback_progreso: Función que recibe mensajes de avance
+        
+        Returns:
+            Notas condensadas de todos los fragmentos, en el orden del documento
+        """
+        fragmentos = dividir_en_fragmentos(contenido, self.tamano_fragmento)
+        total = len(fragmentos)
+        completados = 0
+        semaforo = asyncio.Semaphore(self.max_paralelo)
+        self._notificar(callback_progreso, f"📄 Documento dividido en {total} fragmentos")
+        
+        async def procesar(indice, fragmento):
+            nonlocal completados
+            async with semaforo:
+                try:
+                    resultado = await self.generar(self.prompt_extraccion(pregunta, fragmento, indice + 1, total))
+                except Exception as e:
+                    # Si falla un fragmento se conserva su inicio en bruto
+                    print(f"Error procesando fragmento {indice + 1}/{total}: {e}")
+                    resultado = fragmento[:self.tamano_fragmento // 4]
+            completados += 1
+            self._notificar(callback_progreso, f"📄 Analizando documento: {completados}/{total} fragmentos")
+            return resultado
+        
+        # gather conserva el orden del documento aunque los fragmentos terminen en otro orden
+        resultados = await asyncio.gather(*(procesar(i, f) for i, f in enumerate(fragmentos)))
+        
+        return "\n\n".join(
+            f"--- NOTAS DEL FRAGMENTO {i + 1}/{total} ---\n{resultado}"
+            for i, resultado in enumerate(resultados)
+        )
+    
+    def prompt_extraccion(self, pregunta: str, fragmento: str, numero: int, total: int) -> str:
+        """Prompt de la fase map para un fragmento"""
+        return f"""Estás analizando el fragmento {numero} de {total} de una documentación adjunta.
+
+El usuario solicita: "{pregunta}"
+
+Extrae de este fragmento TODA la información necesaria para responder esa solicitud más adelante:
+- Requisitos, reglas de negocio, validaciones y restricciones
+- Módulos, pantallas, campos, botones y flujos con sus nombres exactos
+- Datos, valores límite, roles y permisos mencionados
+
+Responde solo con notas concisas en viñetas. Si el fragmento no contiene nada relevante, responde "Sin información relevante".
+
+Fragmento:
+{fragmento}"""
+    
+    def _notificar(self, callback_progreso, mensaje):
+        if callback_progreso:
+            try:
+                callback_progreso(mensaje)
+            except Exception as e:
+                print(f"Error notificando progreso: {e}")
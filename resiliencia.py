@@ -0,0 +1,243 @@
+"""
+Reintentos con espera exponencial e interruptor de circuito para las llamadas a la IA
+"""
+import asyncio
+import functools
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+# Estados del interruptor de circuito
+CERRADO = "cerrado"        # Las llamadas pasan normalmente
+ABIERTO = "abierto"        # Las llamadas se rechazan sin contactar al proveedor
+SEMIABIERTO = "semiabierto"  # Se deja pasar una llamada de prueba
+
+class CircuitoAbiertoError(Exception):
+    """La llamada se rechazó porque el interruptor de circuito está abierto"""
+
+class RespuestaRespaldo(str):
+    """
+    Respuesta local entregada en lugar de la de la IA porque la llamada falló o el circuito
+    está abierto: no se reutiliza desde el historial y el ejecutor por lotes la cuenta como error
+    """
+    
+    def __new__(cls, texto: str, error: str = ""):
+        respuesta = super().__new__(cls, texto)
+        respuesta.error = error
+        return respuesta
+
+class AvisoRespuestaIncompleta(str):
+    """
+    Último fragmento de un stream que se cortó a mitad de la respuesta: lo entregado antes
+    es parcial, así que el turno no se reutiliza desde el historial
+    """
+
+def es_error_reintentable(error: Exception) -> bool:
+    """
+    Indicar si un error es transitorio (cuota, sobrecarga, timeout o red)
+    
+    Args:
+        error: Excepción producida por la llamada
+    
+    Returns:
+        True si tiene sentido reintentar la llamada
+    """
+    return isinstance(error, obtener_errores_reintentables())
+
+@functools.lru_cache(maxsize=None)
+def obtener_errores_reintentables() -> Tuple[type, ...]:
+    """Tipos de error transitorios (los de Google se importan en el primer uso, no al arrancar)"""
+    errores = (asyncio.TimeoutError, TimeoutError, ConnectionError)
+    try:
+        from google.api_core import exceptions as google_exceptions
+        errores += (
+            google_exceptions.ResourceExhausted,
+            google_exceptions.TooManyRequests,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.InternalServerError,
+            google_exceptions.BadGateway,
+            google_exceptions.GatewayTimeout,
+            google_exceptions.Aborted
+        )
+    except ImportError:
+        pass
+    return errores
+
+class PoliticaReintentos:
+    """Parámetros de timeout y de espera exponencial con jitter entre reintentos"""
+    
+    def __init__(self, max_intentos: int = 3, espera_base: float = 0.5, espera_maxima: float = 8.0,
+                 timeout_segundos: float = 90.0):
+        """
+        Inicializar la política
+        
+        Args:
+            max_intentos: Intentos totales por llamada (incluido el primero)
+            espera_base: Espera antes del primer reintento
+            espera_maxima: Tope de la espera entre reintentos
+            timeout_segundos: Tiempo máximo de cada intento
+        """
+        self.max_intentos = max_intentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.timeout_segundos = timeout_segundos
+    
+    def calcular_espera(self, intento: int) -> float:
+        """Espera antes del reintento número intento (jitter completo para no sincronizar clientes)"""
+        return random.uniform(0, min(self.espera_maxima, self.espera_base * (2 ** intento)))
+
+class InterruptorCircuito:
+    """Abre el circuito tras fallos consecutivos y lo prueba de nuevo pasado un tiempo"""
+    
+    def __init__(self, umbral_fallos: int = 5, segundos_apertura: float = 30.0):
+        """
+        Inicializar el interruptor
+        
+        Args:
+            umbral_fallos: Fallos consecutivos que abren el circuito
+            segundos_apertura: Tiempo que el circuito permanece abierto antes de probar otra llamada
+        """
+        self.umbral_fallos = umbral_fallos
+        self.segundos_apertura = segundos_apertura
+        
+        self.estado = CERRADO
+        self.fallos_consecutivos = 0
+        self.abierto_desde = 0.0
+        self.aperturas = 0
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+    
+    def esta_abierto(self) -> bool:
+        """Indica, sin cambiar el estado, si una llamada sería rechazada ahora"""
+        with self._lock:
+            if self.estado == ABIERTO:
+                return time.monotonic() - self.abierto_desde < self.segundos_apertura
+            return self.estado == SEMIABIERTO and self._prueba_en_curso
+    
+    def permitir(self) -> bool:
+        """
+        Decidir si una llamada puede hacerse
+        
+        Returns:
+            True si la llamada puede contactar al proveedor
+        """
+        with self._lock:
+            if self.estado == ABIERTO:
+                if time.monotonic() - self.abierto_desde < self.segundos_apertura:
+                    return False
+                self.estado = SEMIABIERTO
+                self._prueba_en_curso = False
+            
+            if self.estado == SEMIABIERTO:
+                # Solo una llamada de prueba a la vez
+                if self._prueba_en_curso:
+                    return False
+                self._prueba_en_curso = True
+            return True
+    
+    def registrar_exito(self):
+        """Cerrar el circuito tras una llamada correcta"""
+        with self._lock:
+            self.estado = CERRADO
+            self.fallos_consecutivos = 0
+            self._prueba_en_curso = False
+    
+    def registrar_fallo(self):
+        """Contar un fallo y abrir el circuito si se alcanza el umbral"""
+        with self._lock:
+            self.fallos_consecutivos += 1
+            if self.estado == SEMIABIERTO or self.fallos_consecutivos >= self.umbral_fallos:
+                if self.estado != ABIERTO:
+                    self.aperturas += 1
+                self.estado = ABIERTO
+                self.abierto_desde = time.monotonic()
+                self._prueba_en_curso = False
+    
+    def segundos_para_reintentar(self) -> float:
+        """Segundos que faltan para que el circuito abierto admita una llamada de prueba"""
+        with self._lock:
+            if self.estado != ABIERTO:
+                return 0.0
+            return max(0.0, self.segundos_apertura - (time.monotonic() - self.abierto_desde))
+
+class GestorResiliencia:
+    """Ejecuta llamadas a la IA con timeout, reintentos e interruptor de circuito"""
+    
+    def __init__(self, politica: PoliticaReintentos = None, interruptor: InterruptorCircuito = None):
+        """
+        Inicializar el gestor
+        
+        Args:
+            politica: Política de timeout y reintentos
+            interruptor: Interruptor de circuito compartido por todas las llamadas
+        """
+        self.politica = politica or PoliticaReintentos()
+        self.interruptor = interruptor or InterruptorCircuito()
+        
+        self.llamadas = 0
+        self.reintentos = 0
+        self.timeouts = 0
+        self.fallos = 0
+        self.rechazadas = 0
+    
+    async def ejecutar(self, funcion: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Ejecutar una llamada asíncrona aplicando la política
+        
+        Args:
+            funcion: Función sin argumentos que crea la corrutina de la llamada en cada intento
+        
+        Returns:
+            Resultado de la llamada
+        
+        Raises:
+            CircuitoAbiertoError: Si el circuito está abierto
+            Exception: El último error si se agotan los intentos o no es reintentable
+        """
+        for intento in range(self.politica.max_intentos):
+            if not self.interruptor.permitir():
+                self.rechazadas += 1
+                raise CircuitoAbiertoError("El servicio de IA no está disponible temporalmente")
+            
+            self.llamadas += 1
+            try:
+                resultado = await asyncio.wait_for(funcion(), self.politica.timeout_segundos)
+                self.interruptor.registrar_exito()
+                return resultado
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timeouts += 1
+                if not es_error_reintentable(e):
+                    # Un error propio de la solicitud no indica que el proveedor esté caído
+                    self.interruptor.registrar_exito()
+                    raise
+                
+                self.fallos += 1
+                self.interruptor.registrar_fallo()
+                if intento == self.politica.max_intentos - 1 or self.interruptor.esta_abierto():
+                    raise
+                
+                espera = self.politica.calcular_espera(intento)
+                print(f"⏳ Error transitorio de la IA ({type(e).__name__}); reintento en {espera:.1f}s")
+                self.reintentos += 1
+                await asyncio.sleep(espera)
+    
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        """
+        Obtener el estado del circuito y los contadores de llamadas
+        
+        Returns:
+            Diccionario con estado, segundos para reintentar y contadores
+        """
+        return {
+            "estado": self.interruptor.estado,
+            "segundos_para_reintentar": round(self.interruptor.segundos_para_reintentar(), 1),
+            "aperturas": self.interruptor.aperturas,
+            "llamadas": self.llamadas,
+            "reintentos": self.reintentos,
+            "timeouts": self.timeouts,
+            "fallos": self.fallos,
+            "rechazadas": self.rechazadas
+        }
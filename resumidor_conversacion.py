@@ -0,0 +1,140 @@
+"""
+Resumen incremental de la conversación, actualizado en segundo plano
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from constructor_prompt import estimar_tokens
+
+def resumir_turnos_localmente(turnos: List[Dict[str, str]]) -> str:
+    """
+    Resumen compacto sin IA: cada pregunta con la primera línea de su respuesta
+    
+    Args:
+        turnos: Turnos {"usuario": ..., "modelo": ...} a resumir
+    
+    Returns:
+        Texto del resumen
+    """
+    lineas = []
+    for turno in turnos:
+        primera_linea = next((l.strip() for l in turno["modelo"].splitlines() if l.strip()), "")
+        lineas.append(f"- Usuario: {turno['usuario'][:150]} → Respuesta: {primera_linea[:150]}")
+    return "\n".join(lineas)
+
+class ResumidorConversacion:
+    """
+    Mantiene un resumen acumulado de los turnos antiguos de la conversación.
+    
+    Después de cada respuesta se programa, en un hilo aparte, la incorporación al
+    resumen de los turnos que ya no caben en el historial (nunca los más recientes);
+    mientras todo cabe no se llama al modelo. La solicitud del usuario nunca espera
+    al resumen: si todavía no está al día se usa el resumen local de los turnos pendientes.
+    """
+    
+    def __init__(self, resumir: Callable[[str], str], max_tokens_resumen: int = 400,
+                 turnos_recientes: int = 3):
+        """
+        Inicializar el resumidor
+        
+        Args:
+            resumir: Función que envía un prompt al modelo y devuelve el texto
+            max_tokens_resumen: Tamaño máximo del resumen acumulado
+            turnos_recientes: Turnos más recientes que nunca se resumen
+        """
+        self.resumir = resumir
+        self.max_tokens_resumen = max_tokens_resumen
+        self.turnos_recientes = turnos_recientes
+        
+        self.resumen = ""
+        self.turnos_resumidos = 0
+        self.actualizaciones = 0
+        self._version = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ResumidorConversacion")
+    
+    def programar_actualizacion(self, obtener_turnos: Callable[[], List[Dict[str, str]]],
+                                contar_a_resumir: Optional[Callable[[List[Dict[str, str]], str], int]] = None):
+        """
+        Programar la actualización del resumen en segundo plano
+        
+        Args:
+            obtener_turnos: Función que devuelve una copia de todos los turnos de la conversación
+            contar_a_resumir: Función (turnos aún no resumidos, resumen) que devuelve cuántos de
+                los primeros hay que resumir (0 si todos caben en el historial); sin ella se
+                resumen todos los que no son recientes
+        """
+        with self._lock:
+            version = self._version
+        # Un único hilo de trabajo: las actualizaciones se aplican en orden y las que
+        # llegan cuando ya no hay turnos pendientes terminan sin hacer nada
+        self._executor.submit(self._actualizar, version, obtener_turnos, contar_a_resumir)
+    
+    def obtener(self) -> Tuple[str, int]:
+        """
+        Obtener el resumen vigente
+        
+        Returns:
+            Tupla (resumen, número de turnos iniciales que cubre)
+        """
+        with self._lock:
+            return self.resumen, self.turnos_resumidos
+    
+    def reiniciar(self):
+        """Descartar el resumen (nueva conversación); las actualizaciones en curso se ignoran"""
+        with self._lock:
+            self._version += 1
+            self.resumen = ""
+            self.turnos_resumidos = 0
+    
+    def esperar(self):
+        """Esperar a que terminen las actualizaciones programadas"""
+        self._executor.submit(lambda: None).result()
+    
+    def prompt_resumen(self, resumen_previo: str, turnos: List[Dict[str, str]]) -> str:
+        """Prompt que integra los turnos nuevos en el resumen acumulado"""
+        conversacion = "\n\n".join(f"Usuario: {t['usuario']}\nAsistente: {t['modelo'][:4000]}" for t in turnos)
+        return f"""Mantienes el resumen de una conversación entre un analista QA y un asistente.
+
+Resumen actual:
+{resumen_previo or "(vacío)"}
+
+Nuevos intercambios:
+{conversacion}
+
+Escribe el resumen actualizado en viñetas, en un máximo de {self.max_tokens_resumen * 3 // 4} palabras.
+Conserva módulos, requisitos, decisiones, identificadores de casos de prueba y pendientes.
+No incluyas el contenido completo de los casos de prueba ni saludos. Responde solo con el resumen."""
+    
+    def _actualizar(self, version: int, obtener_turnos: Callable[[], List[Dict[str, str]]],
+                    contar_a_resumir: Optional[Callable[[List[Dict[str, str]], str], int]] = None):
+        with self._lock:
+            if version != self._version:
+                return
+            resumen_previo = self.resumen
+            desde = self.turnos_resumidos
+        
+        turnos = obtener_turnos()
+        hasta = len(turnos) - self.turnos_recientes
+        if contar_a_resumir is not None and hasta > desde:
+            hasta = min(hasta, desde + contar_a_resumir(turnos[desde:], resumen_previo))
+        if hasta <= desde:
+            return
+        pendientes = turnos[desde:hasta]
+        
+        try:
+            nuevo = self.resumir(self.prompt_resumen(resumen_previo, pendientes)).strip()
+        except Exception as e:
+            print(f"Error resumiendo la conversación, se usa el resumen local: {e}")
+            nuevo = "\n".join(parte for parte in [resumen_previo, resumir_turnos_localmente(pendientes)] if parte)
+        
+        # El resumen nunca supera su presupuesto; se conserva lo más reciente
+        if estimar_tokens(nuevo) > self.max_tokens_resumen:
+            nuevo = nuevo[-self.max_tokens_resumen * 4:]
+        
+        with self._lock:
+            if version == self._version and desde == self.turnos_resumidos:
+                self.resumen = nuevo
+                self.turnos_resumidos = hasta
+                self.actualizaciones += 1
@@ -0,0 +1,182 @@
+"""
+Sesión de chat multi-turno con historial compacto
+"""
+import hashlib
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from constructor_prompt import estimar_tokens
+from resumidor_conversacion import ResumidorConversacion, resumir_turnos_localmente
+
+MARCA_RESPUESTA_COMPACTADA = "[... respuesta anterior de ~{tokens} tokens abreviada ...]"
+RESPUESTA_RESUMEN = "Entendido, tengo en cuenta ese contexto."
+
+class SesionChat:
+    """
+    Turnos de una conversación que se envían al modelo como historial nativo.
+    
+    Solo se guarda lo que el usuario preguntó (sin los adjuntos) y lo que respondió
+    el modelo. Al enviarlo, las respuestas largas se abrevian y los turnos que no
+    caben en el presupuesto se reemplazan por un resumen compacto. Con un resumidor,
+    los turnos antiguos se sustituyen por su resumen acumulado, calculado en segundo
+    plano después de cada respuesta.
+    """
+    
+    def __init__(self, presupuesto_tokens: int = 2000, max_tokens_por_respuesta: int = 400,
+                 max_tokens_por_pregunta: int = 200, resumidor: Optional[ResumidorConversacion] = None):
+        """
+        Inicializar la sesión
+        
+        Args:
+            presupuesto_tokens: Tamaño máximo estimado del historial enviado en cada llamada
+            max_tokens_por_respuesta: Tamaño al que se abrevia cada respuesta anterior
+            max_tokens_por_pregunta: Tamaño al que se abrevia cada pregunta anterior
+            resumidor: Resumidor incremental de los turnos antiguos (opcional)
+        """
+        self.presupuesto_tokens = presupuesto_tokens
+        self.max_tokens_por_respuesta = max_tokens_por_respuesta
+        self.max_tokens_por_pregunta = max_tokens_por_pregunta
+        self.resumidor = resumidor
+        self.turnos: List[Dict[str, str]] = []
+        self._lock = threading.Lock()
+    
+    def agregar_turno(self, usuario: str, modelo: str):
+        """
+        Registrar una pregunta y su respuesta
+        
+        Args:
+            usuario: Pregunta del usuario (sin el contenido de los adjuntos)
+            modelo: Respuesta completa del modelo
+        """
+        with self._lock:
+            self.turnos.append({"usuario": usuario, "modelo": modelo})
+        if self.resumidor:
+            self.resumidor.programar_actualizacion(self.obtener_turnos, self.contar_turnos_a_resumir)
+    
+    def reiniciar(self):
+        """Olvidar todos los turnos (nueva conversación)"""
+        with self._lock:
+            self.turnos = []
+        if self.resumidor:
+            self.resumidor.reiniciar()
+    
+    def obtener_turnos(self) -> List[Dict[str, str]]:
+        """Copia de los turnos registrados"""
+        with self._lock:
+            return list(self.turnos)
+    
+    def obtener_historial(self) -> List[Dict[str, str]]:
+        """
+        Construir el historial a enviar respetando el presupuesto de tokens
+        
+        Returns:
+            Lista de mensajes {"rol": "usuario"|"modelo", "texto": ...} en orden cronológico,
+            con un resumen de los turnos antiguos al principio si no cupieron completos
+        """
+        turnos = self.obtener_turnos()
+        resumen, turnos_resumidos = self.resumidor.obtener() if self.resumidor else ("", 0)
+        # Los turnos que ya cubre el resumen acumulado no se vuelven a enviar
+        turnos = turnos[turnos_resumidos:]
+        
+        incluidos = self._turnos_que_caben(turnos, estimar_tokens(resumen), self.presupuesto_tokens)
+        
+        historial = []
+        # Los turnos que no caben y que el resumidor aún no procesó se resumen localmente
+        antiguos = turnos[:len(turnos) - len(incluidos)]
+        partes_resumen = [parte for parte in [resumen, self.resumir_turnos(antiguos) if antiguos else ""] if parte]
+        if partes_resumen:
+            historial.append({"rol": "usuario", "texto": "Resumen de la conversación anterior:\n"
+                              + "\n".join(partes_resumen)})
+            historial.append({"rol": "modelo", "texto": RESPUESTA_RESUMEN})
+        
+        for pregunta, respuesta in incluidos:
+            historial.append({"rol": "usuario", "texto": pregunta})
+            historial.append({"rol": "modelo", "texto": respuesta})
+        return historial
+    
+    def contar_turnos_a_resumir(self, turnos: List[Dict[str, str]], resumen: str) -> int:
+        """
+        Cuántos de los primeros turnos conviene pasar al resumen: ninguno mientras todos caben en
+        el presupuesto; al desbordarlo, los necesarios para que el resto ocupe la mitad, para que
+        el resumen con el modelo se pida de vez en cuando y no tras cada respuesta
+        
+        Args:
+            turnos: Turnos que el resumen todavía no cubre
+            resumen: Resumen acumulado
+        
+        Returns:
+            Número de turnos a resumir
+        """
+        tokens_resumen = estimar_tokens(resumen)
+        if len(self._turnos_que_caben(turnos, tokens_resumen, self.presupuesto_tokens)) == len(turnos):
+            return 0
+        return len(turnos) - len(self._turnos_que_caben(turnos, tokens_resumen, self.presupuesto_tokens // 2))
+    
+    def obtener_historial_texto(self, nombre_asistente: str) -> str:
+        """
+        Historial compacto en texto plano, para incluirlo dentro del prompt
+        
+        Args:
+            nombre_asistente: Nombre con el que se etiquetan las respuestas
+        
+        Returns:
+            Resumen de lo anterior más los últimos turnos, dentro del mismo presupuesto de tokens
+        """
+        lineas = []
+        for mensaje in self.obtener_historial():
+            if mensaje["texto"].startswith("Resumen de la conversación anterior:"):
+                lineas.append(mensaje["texto"])
+            elif mensaje["rol"] == "usuario":
+                lineas.append(f"Usuario: {mensaje['texto']}")
+            elif mensaje["texto"] != RESPUESTA_RESUMEN:
+                lineas.append(f"{nombre_asistente}: {mensaje['texto']}")
+        return "\n".join(lineas)
+    
+    def resumir_turnos(self, turnos: List[Dict[str, str]]) -> str:
+        """
+        Resumen compacto de turnos antiguos: cada pregunta con la primera línea de su respuesta
+        
+        Args:
+            turnos: Turnos a resumir
+        
+        Returns:
+            Texto del resumen
+        """
+        return resumir_turnos_localmente(turnos)
+    
+    def huella(self, historial: List[Dict[str, str]]) -> str:
+        """
+        Huella del historial enviado, para distinguir en la caché el mismo prompt en distinto contexto
+        
+        Args:
+            historial: Historial devuelto por obtener_historial
+        
+        Returns:
+            Hash SHA-256 en hexadecimal (vacío si no hay historial)
+        """
+        if not historial:
+            return ""
+        contenido = json.dumps(historial, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+    
+    def _turnos_que_caben(self, turnos: List[Dict[str, str]], tokens_iniciales: int,
+                          presupuesto: int) -> List[Tuple[str, str]]:
+        """Turnos más recientes (abreviados) que caben en el presupuesto; siempre al menos el último"""
+        # Se recorren los turnos del más reciente al más antiguo hasta agotar el presupuesto
+        incluidos = []
+        tokens = tokens_iniciales
+        for turno in reversed(turnos):
+            pregunta = self._abreviar(turno["usuario"], self.max_tokens_por_pregunta)
+            respuesta = self._abreviar(turno["modelo"], self.max_tokens_por_respuesta)
+            tokens_turno = estimar_tokens(pregunta) + estimar_tokens(respuesta)
+            if incluidos and tokens + tokens_turno > presupuesto:
+                break
+            incluidos.insert(0, (pregunta, respuesta))
+            tokens += tokens_turno
+        return incluidos
+    
+    def _abreviar(self, texto: str, max_tokens: int) -> str:
+        if estimar_tokens(texto) <= max_tokens:
+            return texto
+        return texto[:max_tokens * 4] + "\n" + MARCA_RESPUESTA_COMPACTADA.format(tokens=estimar_tokens(texto))
@@ -0,0 +1,66 @@
+"""
+Línea de tiempo del arranque de la aplicación (importaciones, ventana visible, IA lista)
+
+Se activa la impresión detallada con la variable de entorno CHATBOT_TIEMPOS_ARRANQUE=1
+o con el argumento --tiempos-arranque.
+"""
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+_INICIO = time.perf_counter()
+_eventos: List[Dict[str, Any]] = []
+_lock = threading.Lock()
+
+def milisegundos_desde_inicio() -> float:
+    """Milisegundos transcurridos desde que se importó este módulo"""
+    return (time.perf_counter() - _INICIO) * 1000
+
+def marcar(evento: str, duracion_ms: Optional[float] = None):
+    """
+    Registrar un hito del arranque
+    
+    Args:
+        evento: Descripción del hito
+        duracion_ms: Duración de la etapa, si el hito cierra una etapa medida
+    """
+    with _lock:
+        _eventos.append({
+            "evento": evento,
+            "ms": round(milisegundos_desde_inicio(), 1),
+            "duracion_ms": round(duracion_ms, 1) if duracion_ms is not None else None,
+            "hilo": threading.current_thread().name
+        })
+
+@contextmanager
+def medir(etapa: str):
+    """
+    Medir la duración de una etapa del arranque
+    
+    Args:
+        etapa: Descripción de la etapa (por ejemplo, "importar PyQt5")
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        marcar(etapa, (time.perf_counter() - inicio) * 1000)
+
+def obtener_linea_tiempo() -> List[Dict[str, Any]]:
+    """Copia de los hitos registrados hasta el momento"""
+    with _lock:
+        return list(_eventos)
+
+def detalle_habilitado() -> bool:
+    """Indica si se pidió imprimir la línea de tiempo completa"""
+    return os.environ.get("CHATBOT_TIEMPOS_ARRANQUE") == "1" or "--tiempos-arranque" in sys.argv
+
+def imprimir_linea_tiempo():
+    """Mostrar por consola los hitos del arranque"""
+    print("⏱️ Línea de tiempo del arranque")
+    for evento in obtener_linea_tiempo():
+        duracion = f" ({evento['duracion_ms']} ms)" if evento['duracion_ms'] is not None else ""
+        print(f"   {evento['ms']:>8.1f} ms  {evento['evento']}{duracion}  [{evento['hilo']}]")